@@ -0,0 +1,490 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""
+ASGI config for cards-against-django project, Python 3.5+ only.
+
+Serves the endpoints that wait for something to happen in a game as
+coroutines, a waiting client costs an open socket rather than a whole
+sync gunicorn worker:
+
+    GET  /game/<id>/poll?version=N   long-poll, answers once the game's
+                                     state version is not N, or after
+                                     POLL_TIMEOUT seconds
+    GET  /game/<id>/events?version=N text/event-stream, a "state" event
+                                     per new state version
+    POST /game/<id>/presence         heartbeat of the session's player,
+    GET  /game/<id>/presence         both return the players seen in the
+                                     last PRESENCE_TIMEOUT seconds
+
+Everything else goes to the Django WSGI application, run in a pool of
+settings.ASGI_THREADS threads. Run with any ASGI server, e.g.
+
+    uvicorn cah.asgi:application
+
+New state versions arrive from cards.gamestate.publish_state() on the
+GAME_EVENTS_URL Redis channel via aioredis, presence is kept in Redis
+sorted sets there too. Without GAME_EVENTS_URL (development) versions
+are polled from the shared cache every POLL_INTERVAL seconds and
+presence is per process.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import http.cookies
+import io
+import json
+import os
+import re
+import sys
+import time
+from urllib.parse import parse_qs
+
+import cards.log as log
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cah.settings.prod")
+
+POLL_TIMEOUT = 25  # seconds, below the usual 30 second proxy timeouts
+POLL_INTERVAL = 1
+KEEPALIVE_INTERVAL = 15
+PRESENCE_TIMEOUT = 60
+REDIS_RETRY_INTERVAL = 1
+GAME_EVENTS_CHANNEL = 'game_events'  # cards.gamestate.GAME_EVENTS_CHANNEL
+DEFAULT_THREADS = 10
+
+GAME_PATH_RE = re.compile(r'^/game/(?P<pk>\d+)/(?P<endpoint>poll|events|presence)$')
+JSON_HEADERS = [(b'content-type', b'application/json'),
+                (b'cache-control', b'no-cache')]
+
+
+class EventHub(object):
+
+    """Game state versions, and the queues of the clients waiting for
+    them, in this process."""
+
+    def __init__(self):
+        self.versions = {}  # game id: latest version seen
+        self.waiters = collections.defaultdict(set)  # game id: {Queue}
+
+    def subscribe(self, game_id):
+        queue = asyncio.Queue()
+        self.waiters[game_id].add(queue)
+        return queue
+
+    def unsubscribe(self, game_id, queue):
+        waiters = self.waiters.get(game_id)
+        if waiters is not None:
+            waiters.discard(queue)
+            if not waiters:
+                del self.waiters[game_id]
+
+    def publish(self, game_id, version):
+        if version == self.versions.get(game_id):
+            return
+        self.versions[game_id] = version
+        for queue in self.waiters.get(game_id, ()):
+            queue.put_nowait(version)
+
+
+class LocalPresence(object):
+
+    def __init__(self, timeout=PRESENCE_TIMEOUT):
+        self.timeout = timeout
+        self.seen = collections.defaultdict(dict)  # game id: {name: time}
+
+    async def touch(self, game_id, player_name):
+        self.seen[game_id][player_name] = time.time()
+
+    async def players(self, game_id):
+        cutoff = time.time() - self.timeout
+        seen = self.seen[game_id]
+        for player_name, last_seen in list(seen.items()):
+            if last_seen < cutoff:
+                del seen[player_name]
+        return sorted(seen)
+
+
+class RedisPresence(object):
+
+    """Presence shared by all processes, a sorted set (player name by
+    time last seen) per game."""
+
+    def __init__(self, redis, timeout=PRESENCE_TIMEOUT):
+        self.redis = redis
+        self.timeout = timeout
+
+    def _key(self, game_id):
+        return 'presence:%d' % game_id
+
+    async def touch(self, game_id, player_name):
+        key = self._key(game_id)
+        await self.redis.zadd(key, time.time(), player_name)
+        await self.redis.expire(key, self.timeout)
+
+    async def players(self, game_id):
+        key = self._key(game_id)
+        await self.redis.zremrangebyscore(key, max=time.time() - self.timeout)
+        return sorted(await self.redis.zrange(key, 0, -1, encoding='utf-8'))
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI http `scope` and request `body`."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI strings are latin-1 decoded bytes
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ):
+    """Returns (status code, headers, body) of `wsgi_app` for `environ`."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'),
+                                value.encode('latin-1'))
+                               for name, value in headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+async def read_body(receive):
+    body = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(body)
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, data, status=200):
+    await send_response(send, status, JSON_HEADERS,
+                        json.dumps(data).encode('utf-8'))
+
+
+def state_versions(game_ids):
+    from cards import gamestate
+    return dict((game_id, gamestate.state_version(game_id))
+                for game_id in game_ids)
+
+
+def session_player_name(game_id, session_key):
+    """Name of the player in game `game_id` for the Django session
+    `session_key`, None if there is none (or the game has a password
+    the session does not know)."""
+    from importlib import import_module
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.db import close_old_connections
+    from cards import sharding
+    from cards.models import Game
+
+    close_old_connections()
+    try:
+        session = import_module(settings.SESSION_ENGINE).SessionStore(
+            session_key)
+        session_details = session.get('session_details') or {}
+        try:
+            game = sharding.get_game(game_id)
+        except Game.DoesNotExist:
+            return None
+        password = game.gamedata.get('password')
+        if password and session_details.get('password') != password:
+            return None
+        player_name = None
+        user_id = session.get('_auth_user_id')
+        if user_id is not None:
+            player_name = get_user_model().objects.filter(
+                pk=user_id).values_list('username', flat=True).first()
+        player_name = player_name or session_details.get('name')
+        if player_name not in game.gamedata['players']:
+            return None
+        return player_name
+    finally:
+        close_old_connections()
+
+
+class GameEventsApplication(object):
+
+    """ASGI application, see the module docstring. `wsgi_app` serves
+    everything but the game event endpoints, `events_url` is the Redis
+    GAME_EVENTS_URL (None to poll `state_versions`). Without `wsgi_app`
+    Django is set up, and the others read from its settings, on the
+    first call."""
+
+    def __init__(self, wsgi_app=None, events_url=None, threads=None,
+                 state_versions=state_versions,
+                 session_player_name=session_player_name):
+        self.wsgi_app = wsgi_app
+        self.events_url = events_url
+        self.threads = threads
+        self.state_versions = state_versions
+        self.session_player_name = session_player_name
+        self.hub = EventHub()
+        self.presence_store = LocalPresence()
+        self.executor = None
+        self._listener = None
+
+    def setup(self):
+        if self.executor is not None:
+            return
+        if self.wsgi_app is None:
+            from django.conf import settings
+            from django.core.wsgi import get_wsgi_application
+
+            self.wsgi_app = get_wsgi_application()
+            if os.environ.get('CAH_WARMUP'):
+                from cards.warmup import warm_up
+                warm_up()
+            self.events_url = getattr(settings, 'GAME_EVENTS_URL', None)
+            self.threads = getattr(settings, 'ASGI_THREADS', None)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            self.threads or DEFAULT_THREADS)
+        loop = asyncio.get_event_loop()
+        if self.events_url:
+            self._listener = loop.create_task(self.listen_redis())
+        else:
+            self._listener = loop.create_task(self.poll_versions())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self.setup()
+        match = GAME_PATH_RE.match(scope['path'])
+        if match is None:
+            await self.wsgi(scope, receive, send)
+            return
+        game_id = int(match.group('pk'))
+        handler = getattr(self, match.group('endpoint'))
+        await handler(game_id, scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.setup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._listener is not None:
+                    self._listener.cancel()
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def listen_redis(self):
+        import aioredis
+
+        while True:
+            subscriber = None
+            try:
+                if not isinstance(self.presence_store, RedisPresence):
+                    # per process presence until Redis can be reached
+                    self.presence_store = RedisPresence(
+                        await aioredis.create_redis_pool(self.events_url))
+                subscriber = await aioredis.create_redis(self.events_url)
+                channel, = await subscriber.subscribe(GAME_EVENTS_CHANNEL)
+                while await channel.wait_message():
+                    message = await channel.get_json()
+                    self.hub.publish(int(message['game']),
+                                     int(message['version']))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # clients time out and poll again, nothing is lost for long
+                log.logger.exception('game events listener')
+                await asyncio.sleep(REDIS_RETRY_INTERVAL)
+            finally:
+                if subscriber is not None:
+                    subscriber.close()
+
+    async def poll_versions(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            game_ids = list(self.hub.waiters)
+            if not game_ids:
+                continue
+            try:
+                versions = await loop.run_in_executor(
+                    self.executor, self.state_versions, game_ids)
+            except Exception:
+                log.logger.exception('polling game state versions')
+                continue
+            for game_id, version in versions.items():
+                self.hub.publish(game_id, version)
+
+    async def current_version(self, game_id):
+        # not self.hub.versions, without waiters nothing keeps it current
+        loop = asyncio.get_event_loop()
+        versions = await loop.run_in_executor(
+            self.executor, self.state_versions, [game_id])
+        self.hub.versions[game_id] = versions[game_id]
+        return versions[game_id]
+
+    async def wsgi(self, scope, receive, send):
+        body = await read_body(receive)
+        environ = wsgi_environ(scope, body)
+        loop = asyncio.get_event_loop()
+        status, headers, body = await loop.run_in_executor(
+            self.executor, run_wsgi, self.wsgi_app, environ)
+        await send_response(send, status, headers, body)
+
+    async def wait(self, queue, receive, timeout):
+        """Returns the next version from `queue`, None on timeout or
+        client disconnect."""
+        get = asyncio.ensure_future(queue.get())
+        disconnect = asyncio.ensure_future(receive())
+        done, pending = await asyncio.wait(
+            [get, disconnect], timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED)
+        for future in pending:
+            future.cancel()
+        if get in done:
+            return get.result()
+        return None
+
+    async def poll(self, game_id, scope, receive, send):
+        await read_body(receive)
+        version = _query_int(scope, 'version')
+        queue = self.hub.subscribe(game_id)
+        try:
+            current = await self.current_version(game_id)
+            if version is None or current != version:
+                await send_json(send, {'version': current, 'changed': True})
+                return
+            current = await self.wait(queue, receive, POLL_TIMEOUT)
+            if current is None:
+                await send_json(send, {'version': version, 'changed': False})
+            else:
+                await send_json(send, {'version': current, 'changed': True})
+        finally:
+            self.hub.unsubscribe(game_id, queue)
+
+    async def events(self, game_id, scope, receive, send):
+        await read_body(receive)
+        version = _query_int(scope, 'version')
+        queue = self.hub.subscribe(game_id)
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'),
+                                    (b'cache-control', b'no-cache'),
+                                    (b'x-accel-buffering', b'no')]})
+            current = await self.current_version(game_id)
+            disconnect = asyncio.ensure_future(receive())
+            try:
+                while True:
+                    if current is not None and current != version:
+                        version = current
+                        chunk = 'event: state\ndata: %s\n\n' % json.dumps(
+                            {'version': version})
+                    else:
+                        chunk = ': keepalive\n\n'
+                    await send({'type': 'http.response.body',
+                                'body': chunk.encode('utf-8'),
+                                'more_body': True})
+                    get = asyncio.ensure_future(queue.get())
+                    done, _ = await asyncio.wait(
+                        [get, disconnect], timeout=KEEPALIVE_INTERVAL,
+                        return_when=asyncio.FIRST_COMPLETED)
+                    if disconnect in done:
+                        get.cancel()
+                        return
+                    if get in done:
+                        current = get.result()
+                    else:
+                        get.cancel()
+                        current = None
+            finally:
+                disconnect.cancel()
+        finally:
+            self.hub.unsubscribe(game_id, queue)
+
+    async def presence(self, game_id, scope, receive, send):
+        await read_body(receive)
+        if scope['method'] == 'POST':
+            session_key = _cookie(scope, _session_cookie_name())
+            player_name = None
+            if session_key:
+                loop = asyncio.get_event_loop()
+                player_name = await loop.run_in_executor(
+                    self.executor, self.session_player_name, game_id,
+                    session_key)
+            if player_name is None:
+                await send_json(send, {'error': 'not a player'}, status=403)
+                return
+            await self.presence_store.touch(game_id, player_name)
+        elif scope['method'] != 'GET':
+            await send_response(send, 405, [(b'allow', b'GET, POST')], b'')
+            return
+        await send_json(send, {'players': await self.presence_store.players(game_id)})
+
+
+def _query_int(scope, name):
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(name)
+    try:
+        return int(values[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def _cookie(scope, name):
+    for header, value in scope.get('headers', []):
+        if header == b'cookie':
+            cookies = http.cookies.SimpleCookie()
+            cookies.load(value.decode('latin-1'))
+            if name in cookies:
+                return cookies[name].value
+    return None
+
+
+def _session_cookie_name():
+    from django.conf import settings
+    return settings.SESSION_COOKIE_NAME
+
+
+application = GameEventsApplication()
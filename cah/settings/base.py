@@ -41,6 +41,71 @@ MANAGERS = ADMINS
 
 TINTG_SERVER = "http://localhost:8000"
 
+# Catalog snapshot file written by the export_catalog_snapshot command,
+# memory mapped by the workers for card texts and card set membership
+CARD_SNAPSHOT = os.environ.get('CAH_CARD_SNAPSHOT')
+
+# Send game actions to game_actor processes (see cards.actions) rather
+# than applying them in the web worker, e.g. unix:///tmp/cah{shard}.sock
+# or redis://localhost:6379/0
+GAME_ACTOR_URL = os.environ.get('CAH_GAME_ACTOR_URL')
+GAME_ACTOR_SHARDS = int(os.environ.get('CAH_GAME_ACTOR_SHARDS', 1))
+GAME_ACTOR_TIMEOUT = 10
+
+# Long-poll, event stream and presence endpoints served by cah.asgi,
+# game state changes reach them on this Redis (redis://...), without it
+# they poll the shared cache. ASGI_THREADS threads run the Django views.
+GAME_EVENTS_URL = os.environ.get('CAH_GAME_EVENTS_URL')
+ASGI_THREADS = int(os.environ.get('CAH_ASGI_THREADS', 10))
+
+# Cache shared by all workers (see cards.sharedcache), redis://... or
+# unset to use CACHES['default'], with a per worker LRU in front of it
+SHARED_CACHE_URL = os.environ.get('CAH_SHARED_CACHE_URL')
+# every shared cache key in that Redis starts with this, clearing the
+# cache deletes only these keys
+SHARED_CACHE_KEY_PREFIX = os.environ.get('CAH_SHARED_CACHE_KEY_PREFIX',
+                                         'cah:shared:')
+SHARED_CACHE_L1_SIZE = 1000
+SHARED_CACHE_L1_TIMEOUT = 5
+# True if only one process ever uses the cache, then a process local
+# CACHES['default'] is as good as shared (see sharedcache.is_shared())
+SHARED_CACHE_SINGLE_PROCESS = False
+
+# DATABASES alias of a read replica for catalog, stats and history
+# reads (see cards.routers), browsers that wrote stay on the primary for
+# REPLICA_PIN_SECONDS
+DATABASE_ROUTERS = [
+    'cards.sharding.ShardRouter',
+    'cards.routers.ReplicaRouter',
+]
+DATABASE_REPLICA = None
+REPLICA_PIN_SECONDS = 5
+
+# Seconds browsers and reverse proxies may reuse the game page of an
+# observer (no player name), it is also cached per game state version
+OBSERVER_PAGE_MAX_AGE = int(os.environ.get('CAH_OBSERVER_PAGE_MAX_AGE', 2))
+
+# Token bucket budgets per client, {scope: (requests per second, burst)},
+# see cards.ratelimit.DEFAULT_RATE_LIMITS. Behind a proxy that appends
+# the client address to X-Forwarded-For set RATE_LIMIT_TRUST_X_FORWARDED_FOR
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = False
+
+# Fraction (0 to 1) of requests run under cProfile, staff can also ask
+# for it with ?profile=1, the last PROFILE_BUFFER_SIZE profiles are kept
+# (see cards.profiling)
+PROFILE_SAMPLE_RATE = float(os.environ.get('CAH_PROFILE_SAMPLE_RATE', 0))
+PROFILE_BUFFER_SIZE = 50
+
+# Log game actions as GameEvent rows (see cards.eventlog) instead of
+# rewriting gamedata each time, gamedata is saved every GAME_SNAPSHOT_EVERY
+# events
+GAME_EVENT_LOG = bool(os.environ.get('CAH_GAME_EVENT_LOG'))
+GAME_SNAPSHOT_EVERY = int(os.environ.get('CAH_GAME_SNAPSHOT_EVERY', 20))
+
+# DATABASES aliases games are spread over by game id (see cards.sharding),
+# run the rebalance_games command after changing this
+GAME_SHARDS = ['default']
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.',  # Add 'postgresql_psycopg2', 'postgresql', 'mysql', 'sqlite3' or 'oracle'.
@@ -138,11 +203,14 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'cards.metrics.MetricsMiddleware',
+    'cards.routers.PrimaryPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'cards.profiling.ProfilingMiddleware',
 )
 
 AUTHENTICATION_BACKENDS = (
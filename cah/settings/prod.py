@@ -9,13 +9,28 @@ DEBUG = False
 TEMPLATE_DEBUG = DEBUG
 
 DATABASES['default'] = dj_database_url.config()
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.config('REPLICA_DATABASE_URL')
+    DATABASE_REPLICA = 'replica'
+# space separated database URLs of extra game shards
+for index, url in enumerate(os.environ.get('GAME_SHARD_DATABASE_URLS', '').split()):
+    DATABASES['shard%d' % (index + 1)] = dj_database_url.parse(url)
+    GAME_SHARDS.append('shard%d' % (index + 1))
 
 REDIS_URL = urlparse(get_env_variable('REDISCLOUD_URL'))
+# CACHES['default'] is per worker, game and lobby versions, rate limits
+# and cached pages have to be in Redis to mean the same to every worker,
+# the keys are prefixed (SHARED_CACHE_KEY_PREFIX) so sharing the Redis
+# with socket.io and the push notifications is safe
+SHARED_CACHE_URL = (os.environ.get('CAH_SHARED_CACHE_URL') or
+                    get_env_variable('REDISCLOUD_URL'))
 
 SOCKETIO_URL = get_env_variable("SOCKETIO_URL")
 
 # Honor the 'X-Forwarded-Proto' header for request.is_secure()
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+# the Heroku router appends the client address
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = True
 
 ALLOWED_HOSTS = ['.thisisnotthatgame.com','.herokuapp.com', 'localhost', '127.0.0.1']
 
@@ -27,6 +42,11 @@ TEMPLATE_DIRS = (
     PROJECT_ROOT.child('templates'),
 )
 
+# compile each template once per worker (see cards.warmup)
+TEMPLATE_LOADERS = (
+    ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+)
+
 INSTALLED_APPS += (
     'gunicorn',
 )
@@ -13,9 +13,29 @@ DATABASES = {
                 'PASSWORD': '',
                 'HOST': 'localhost',
                 'PORT': '',
-        }
+        },
+        # only used by the router tests, which enable DATABASE_REPLICA
+        'replica': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': 'cah_django_replica.db',
+                'TEST': {'MIRROR': 'default'},
+        },
+        # only used by the sharding tests, which set GAME_SHARDS
+        'shard1': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': 'cah_django_shard1.db',
+        },
 }
 
+# tests clear the Django cache between tests, which the per process
+# LRU would not see
+SHARED_CACHE_L1_SIZE = 0
+# the tests run in one process, its LocMemCache is shared by everything
+SHARED_CACHE_SINGLE_PROCESS = True
+
 REDIS_HOST = 'http://example.com'
 REDIS_PORT = '9000'
-SOCKETIO_URL = 'http://example.com'
\ No newline at end of file
+SOCKETIO_URL = 'http://example.com'
+# requests of all the tests come from the same address, the rate limit
+# tests set their own
+RATE_LIMITS = {}
@@ -17,6 +17,15 @@ from cards.views.game_views import (
 )
 
 from cards.views.card_views import SubmitCardView, import_cards
+from cards.views.stats_views import LeaderboardView, HallOfFameView
+from cards.views.metrics_views import metrics_view
+from cards.views.ratelimit_views import top_talkers_view
+from cards.views.profiling_views import (
+    profile_download_view,
+    profile_view,
+    profiles_view,
+)
+from cards.api.views import Leaderboard
 
 # from cards.views.cards
 
@@ -33,6 +42,15 @@ urlpatterns = patterns('',
     url(r'^game/', include('cards.urls')),
     url(r'^import', import_cards, name="import-cards"),
     url(r'^submit', SubmitCardView.as_view(), name="submit-card"),
+    url(r'^leaderboard$', LeaderboardView.as_view(), name="leaderboard-view"),
+    url(r'^leaderboard/api$', Leaderboard.as_view(), name="leaderboard"),
+    url(r'^halloffame$', HallOfFameView.as_view(), name="hall-of-fame-view"),
+    url(r'^metrics$', metrics_view, name="metrics"),
+    url(r'^ratelimit$', top_talkers_view, name="top-talkers"),
+    url(r'^profiles$', profiles_view, name="profiles"),
+    url(r'^profiles/(?P<seq>\d+)$', profile_view, name="profile"),
+    url(r'^profiles/(?P<seq>\d+)\.prof$', profile_download_view,
+        name="profile-download"),
     url(r'^admin/', include(admin.site.urls)),
     url(r'^accounts/', include('allauth.urls')),
 )
@@ -26,3 +26,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cah.settings.prod")
 # setting points here.
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
+
+# With CAH_WARMUP set load views, templates and the card catalog now
+# rather than on the first requests (see cards.warmup). Set it to
+# 'preload' with gunicorn --preload, this then happens once before the
+# workers are forked.
+if os.environ.get('CAH_WARMUP'):
+    from cards.warmup import warm_up
+    warm_up(before_fork=os.environ['CAH_WARMUP'] == 'preload')
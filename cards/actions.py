@@ -0,0 +1,341 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Game actions (join, submit, pick, exit, rename) and the optional game
+actor.
+
+Views change games through perform(). By default the action is applied
+in the web worker, like any other read-modify-write of the game row.
+
+With settings.GAME_ACTOR_URL set, the action is instead sent as a
+command to the single writer for the game's shard, a game_actor
+management command process, and the view waits for its reply. The
+actor keeps the games it owns in memory, applies commands one at a
+time and saves the game after each one, so updates are never lost
+and web workers do not queue up on the game row.
+
+GAME_ACTOR_URL is either
+
+    unix:///path/to/actor{shard}.sock    one socket per shard
+    redis://host:port/db                 one list per shard
+
+and games are spread over GAME_ACTOR_SHARDS actors by id.
+"""
+
+import collections
+import errno
+import json
+import os
+import socket
+import time
+import uuid
+
+import redis
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, transaction
+
+from cards import eventlog, gamestate, sharding
+from cards.models import Game, GameError
+import cards.log as log
+
+DEFAULT_TIMEOUT = 10  # seconds to wait for the actor
+# times an action is tried on a freshly loaded game when another process
+# changed the game first
+ACTION_ATTEMPTS = 3
+ACTOR_QUEUE_KEY = 'game_actor:%d'
+ACTOR_REPLY_KEY = 'game_actor:reply:%s'
+ACTOR_MAX_GAMES = 1000
+# re-read a game owned by the actor after this many seconds, it is also
+# re-read whenever something else (admin, deactivate_old_games) saved it
+ACTOR_MAX_AGE = 60
+# seconds a client of the unix socket actor has to send its command
+ACTOR_CONNECTION_TIMEOUT = 5
+
+
+class ActorError(Exception):
+    pass
+
+
+def join_game(game, player_name, player_image_url=None):
+    if player_name not in game.gamedata['players']:
+        game.add_player(player_name, player_image_url=player_image_url)
+        if len(game.gamedata['players']) == 1:
+            game.start_new_round(winner_id=player_name)
+
+
+def submit_cards(game, player_name, white_card_list):
+    game.submit_white_cards(player_name, white_card_list)
+
+
+def pick_winner(game, czar_name, winner):
+    game.pick_winner(czar_name, winner)
+
+
+def exit_game(game, player_name):
+    game.del_player(player_name)
+
+
+def rename_player(game, old_name, new_name):
+    """The player who joined as `old_name` (session name) is now logged in
+    as `new_name`."""
+    players = game.gamedata['players']
+    if players.get(old_name):
+        players[new_name] = players[old_name]
+        game.del_player(old_name)
+        if game.gamedata['card_czar'] == old_name:
+            game.gamedata['card_czar'] = new_name
+
+
+ACTIONS = {
+    'join': join_game,
+    'submit': submit_cards,
+    'pick': pick_winner,
+    'exit': exit_game,
+    'rename': rename_player,
+}
+
+
+def apply_action(game, action, kwargs):
+    """Apply `action` to `game` and save it, submissions and win counters
+    are saved in the same transaction. Returns the game, a freshly loaded
+    one if another process logged an event for it first (see
+    cards.eventlog)."""
+    try:
+        func = ACTIONS[action]
+    except KeyError:
+        raise ActorError('unknown game action %r' % action)
+    kwargs = dict((str(key), value) for key, value in kwargs.items())
+    for attempt in range(ACTION_ATTEMPTS):
+        try:
+            with transaction.atomic(using=game._state.db or DEFAULT_DB_ALIAS):
+                eventlog.catch_up(game)
+                if eventlog.enabled():
+                    before = eventlog.plain(game.gamedata)
+                func(game, **kwargs)
+                if eventlog.enabled():
+                    eventlog.record(game, action, kwargs, before)
+                else:
+                    game.save()
+            break
+        except eventlog.Conflict:
+            if attempt == ACTION_ATTEMPTS - 1:
+                raise
+            # apply the action to the game as it is now
+            game = sharding.get_game(game.id)
+    gamestate.publish_state(game.id)
+    return game
+
+
+def shard_for(game_id, shards=None):
+    if shards is None:
+        shards = getattr(settings, 'GAME_ACTOR_SHARDS', 1)
+    return game_id % shards
+
+
+def perform(game, action, **kwargs):
+    """Apply `action` (one of ACTIONS) to `game` with `kwargs`, in this
+    process or via the game actor. Returns the updated Game."""
+    url = getattr(settings, 'GAME_ACTOR_URL', None)
+    if not url:
+        return apply_action(game, action, kwargs)
+    ActorClient(url).send(game.id, action, kwargs)
+    return sharding.get_game(game.id)
+
+
+def _unix_path(url, shard):
+    return url[len('unix://'):].format(shard=shard)
+
+
+def _remove_socket(path):
+    try:
+        os.unlink(path)
+    except OSError as info:
+        if info.errno != errno.ENOENT:
+            raise
+
+
+def _raise_for_reply(reply):
+    if reply.get('ok'):
+        return
+    error_type = reply.get('error_type')
+    if error_type == 'GameError':
+        raise GameError(reply.get('error'))
+    if error_type == 'DoesNotExist':
+        raise Game.DoesNotExist(reply.get('error'))
+    raise ActorError(reply.get('error'))
+
+
+class ActorClient(object):
+
+    def __init__(self, url, shards=None, timeout=None):
+        self.url = url
+        self.shards = shards
+        if timeout is None:
+            timeout = getattr(settings, 'GAME_ACTOR_TIMEOUT', DEFAULT_TIMEOUT)
+        self.timeout = timeout
+
+    def send(self, game_id, action, kwargs):
+        """Send the command to the actor owning `game_id` and wait for the
+        result. Raises the actor's GameError/Game.DoesNotExist, ActorError
+        if the actor could not be reached or did not answer in time."""
+        shard = shard_for(game_id, self.shards)
+        command = {
+            'id': uuid.uuid4().hex,
+            'game_id': game_id,
+            'action': action,
+            'kwargs': kwargs,
+        }
+        if self.url.startswith('unix://'):
+            reply = self._send_unix(_unix_path(self.url, shard), command)
+        elif self.url.startswith('redis://'):
+            reply = self._send_redis(shard, command)
+        else:
+            raise ActorError('unsupported GAME_ACTOR_URL %r' % self.url)
+        _raise_for_reply(reply)
+        return reply
+
+    def _send_unix(self, path, command):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(path)
+            sock.sendall(json.dumps(command).encode('utf-8') + b'\n')
+            reply = sock.makefile('rb').readline()
+        except (socket.error, socket.timeout) as info:
+            raise ActorError('game actor %s: %s' % (path, info))
+        finally:
+            sock.close()
+        if not reply:
+            raise ActorError('game actor %s closed the connection' % path)
+        return json.loads(reply.decode('utf-8'))
+
+    def _send_redis(self, shard, command):
+        connection = redis.StrictRedis.from_url(self.url)
+        command['reply_to'] = ACTOR_REPLY_KEY % command['id']
+        try:
+            connection.lpush(ACTOR_QUEUE_KEY % shard, json.dumps(command))
+            reply = connection.brpop(command['reply_to'], int(self.timeout) or 1)
+        except redis.RedisError as info:
+            raise ActorError('game actor queue: %s' % info)
+        if reply is None:
+            raise ActorError('game actor %d did not answer in time' % shard)
+        return json.loads(reply[1].decode('utf-8'))
+
+
+class GameActor(object):
+
+    """Single writer for the games of one shard."""
+
+    def __init__(self, shard=0, shards=None, max_games=ACTOR_MAX_GAMES,
+                 max_age=ACTOR_MAX_AGE,
+                 connection_timeout=ACTOR_CONNECTION_TIMEOUT):
+        self.shard = shard
+        self.shards = shards or getattr(settings, 'GAME_ACTOR_SHARDS', 1)
+        self.max_games = max_games
+        self.max_age = max_age
+        self.connection_timeout = connection_timeout
+        self.games = collections.OrderedDict()  # id: (Game, loaded at)
+
+    def changed(self, game):
+        """Whether `game` was saved by someone else since it was loaded."""
+        row = Game.objects.using(game._state.db or DEFAULT_DB_ALIAS).filter(
+            pk=game.pk).values_list('modified', 'event_seq').first()
+        return row != (game.modified, game.event_seq)
+
+    def get_game(self, game_id):
+        now = time.time()
+        game, loaded = self.games.pop(game_id, (None, 0))
+        if game is None or now - loaded > self.max_age or self.changed(game):
+            game = sharding.get_game(game_id)
+            loaded = now
+        self.games[game_id] = (game, loaded)  # most recently used last
+        while len(self.games) > self.max_games:
+            self.games.popitem(last=False)
+        return game
+
+    def handle(self, command):
+        """Apply one command (dict), returns the reply dict."""
+        reply = {'id': command.get('id'), 'ok': False}
+        game_id = command.get('game_id')
+        close_old_connections()
+        try:
+            if shard_for(game_id, self.shards) != self.shard:
+                raise ActorError('game %r is not in shard %d' % (
+                    game_id, self.shard))
+            game = apply_action(self.get_game(game_id), command.get('action'),
+                                command.get('kwargs') or {})
+            self.games[game_id] = (game, self.games[game_id][1])
+            reply['ok'] = True
+        except GameError as info:
+            reply.update(error=str(info), error_type='GameError')
+        except Game.DoesNotExist as info:
+            reply.update(error=str(info), error_type='DoesNotExist')
+        except Exception as info:
+            log.logger.exception('game actor command %r', command)
+            reply.update(error=str(info), error_type='error')
+        if not reply['ok']:
+            # the in memory game may be half changed, start afresh
+            self.games.pop(game_id, None)
+        return reply
+
+    def handle_connection(self, conn):
+        """Read one (newline terminated json) command from socket `conn`
+        and write the reply."""
+        conn.settimeout(self.connection_timeout)
+        try:
+            line = conn.makefile('rb').readline()
+            if line:
+                reply = self.handle(json.loads(line.decode('utf-8')))
+                conn.sendall(json.dumps(reply).encode('utf-8') + b'\n')
+        except (IOError, socket.error) as info:
+            # a slow or gone client (timeouts are socket.timeout, or
+            # IOError from the file of a socket with a timeout), on to the next one
+            log.logger.warning('game actor connection: %s', info)
+        finally:
+            conn.close()
+
+    def serve_unix(self, url, requests=None):
+        """Serve commands on the shard's unix socket, `requests` limits the
+        number handled (default forever)."""
+        path = _unix_path(url, self.shard)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # left behind by an actor that did not stop cleanly
+        _remove_socket(path)
+        try:
+            listener.bind(path)
+            listener.listen(128)
+            while requests is None or requests > 0:
+                conn, _ = listener.accept()
+                self.handle_connection(conn)
+                if requests is not None:
+                    requests -= 1
+        finally:
+            listener.close()
+            _remove_socket(path)
+
+    def serve_redis(self, url, requests=None):
+        connection = redis.StrictRedis.from_url(url)
+        queue = ACTOR_QUEUE_KEY % self.shard
+        while requests is None or requests > 0:
+            item = connection.brpop(queue, 5)
+            if item is None:
+                continue
+            command = json.loads(item[1].decode('utf-8'))
+            reply = self.handle(command)
+            reply_to = command.get('reply_to')
+            if reply_to:
+                pipe = connection.pipeline()
+                pipe.lpush(reply_to, json.dumps(reply))
+                pipe.expire(reply_to, DEFAULT_TIMEOUT * 6)
+                pipe.execute()
+            if requests is not None:
+                requests -= 1
+
+    def serve(self, url, requests=None):
+        if url.startswith('unix://'):
+            self.serve_unix(url, requests)
+        elif url.startswith('redis://'):
+            self.serve_redis(url, requests)
+        else:
+            raise ActorError('unsupported GAME_ACTOR_URL %r' % url)
@@ -1,6 +1,285 @@
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
 from django.db.models import get_models, get_app
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.admin.sites import AlreadyRegistered
+from django.http import QueryDict
+
+from cards import search, sharding
+from cards.models import (
+    BlackCard,
+    CardSet,
+    Game,
+    GameArchive,
+    GameEvent,
+    StandardSubmission,
+    WhiteCard,
+    card_text_hash,
+)
+
+# above this many rows (planner estimate) changelists show the estimate
+# rather than run COUNT(*)
+ESTIMATED_COUNT_ABOVE = 10000
+# pick, draw combinations searched for when looking up black card text
+BLACK_CARD_SHAPES = [(pick, draw) for pick in (1, 2, 3) for draw in (0, 1, 2)]
+
+
+class EstimatedCountPaginator(Paginator):
+
+    """Paginator that uses the PostgreSQL planner's row estimate for an
+    unfiltered changelist of a big table instead of COUNT(*)."""
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = self._estimated_count()
+        if self._count is None:
+            return super(EstimatedCountPaginator, self)._get_count()
+        return self._count
+    count = property(_get_count)
+
+    def _estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if queryset.query.where or connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < ESTIMATED_COUNT_ABOVE:
+            return None
+        return int(row[0])
+
+
+class BigTableAdmin(admin.ModelAdmin):
+
+    """Changelist settings for tables with many rows, no COUNT(*) of the
+    whole table, and searches that try an index first (indexed_search())
+    and only scan the table (search_fields) if that finds nothing."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def indexed_search(self, queryset, term):
+        if term.isdigit():
+            return queryset.filter(pk=int(term))
+        return None
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if term:
+            matches = self.indexed_search(queryset, term)
+            if matches is not None and matches.exists():
+                return matches, False
+        return super(BigTableAdmin, self).get_search_results(
+            request, queryset, search_term)
+
+
+class ShardListFilter(admin.SimpleListFilter):
+
+    """Lists one shard (cards.sharding) at a time, the first one unless
+    another is picked. Hidden without sharding."""
+
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        if not sharding.sharding_enabled():
+            return None
+        return [(alias, alias) for alias in sharding.game_aliases()]
+
+    def value(self):
+        return (super(ShardListFilter, self).value() or
+                sharding.shard_aliases()[0])
+
+    def choices(self, cl):
+        # no "All", a changelist is on one database
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == alias,
+                'query_string': cl.get_query_string(
+                    {self.parameter_name: alias}, []),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        if not sharding.sharding_enabled():
+            return None
+        if self.value() not in sharding.game_aliases():
+            raise IncorrectLookupParameters(self.value())
+        return queryset.using(self.value())
+
+
+class ShardedAdmin(BigTableAdmin):
+
+    """Admin for the models on the game shards, the changelist is
+    filtered by shard and the change form loads the object from the
+    shard it was listed on."""
+
+    def get_list_filter(self, request):
+        return (ShardListFilter,) + tuple(self.list_filter)
+
+    def object_shard(self, request, object_id):
+        """The shard `object_id` was listed on, the admin links keep the
+        changelist filters in _changelist_filters."""
+        name = ShardListFilter.parameter_name
+        filters = QueryDict(request.GET.get('_changelist_filters', ''))
+        return request.GET.get(name) or filters.get(name)
+
+    def get_object(self, request, object_id, from_field=None):
+        if not sharding.sharding_enabled():
+            return super(ShardedAdmin, self).get_object(
+                request, object_id, from_field)
+        alias = (self.object_shard(request, object_id) or
+                 sharding.shard_aliases()[0])
+        if alias not in sharding.game_aliases():
+            return None
+        queryset = self.get_queryset(request).using(alias)
+        opts = queryset.model._meta
+        field = (opts.pk if from_field is None
+                 else opts.get_field(from_field))
+        try:
+            object_id = field.to_python(object_id)
+            return queryset.get(**{field.name: object_id})
+        except (queryset.model.DoesNotExist, ValidationError, ValueError):
+            return None
+
+
+class GameAdmin(ShardedAdmin):
+    list_display = ('id', '__str__', 'game_state', 'modified')
+    list_filter = ('is_active',)
+    search_fields = ('name',)
+    readonly_fields = ('snapshot_seq', 'event_seq')
+
+    def indexed_search(self, queryset, term):
+        if term.isdigit():
+            return queryset.filter(pk=int(term))
+        return queryset.filter(name=term)
+
+    def object_shard(self, request, object_id):
+        alias = super(GameAdmin, self).object_shard(request, object_id)
+        if alias is None and object_id.isdigit():
+            alias = sharding.shard_for(int(object_id))
+        return alias
+
+    def get_queryset(self, request):
+        # gamedata is large and decoded when a row is loaded, only the
+        # change form needs it
+        return super(GameAdmin, self).get_queryset(request).defer('gamedata')
+
+
+class StandardSubmissionAdmin(ShardedAdmin):
+    list_display = ('id', 'game_number', 'round', 'player_name', 'black_card',
+                    'winner', 'created')
+    list_filter = ('winner',)
+    list_select_related = ('blackcard',)
+    raw_id_fields = ('game', 'blackcard', 'submissions')
+    search_fields = ('=player_name',)
+
+    def indexed_search(self, queryset, term):
+        # by game
+        if term.isdigit():
+            return queryset.filter(game_id=int(term))
+        return None
+
+    def game_number(self, submission):
+        return submission.game_id
+    game_number.short_description = 'game'
+    game_number.admin_order_field = 'game_id'
+
+    def black_card(self, submission):
+        if submission.blackcard is None:
+            return ''
+        return submission.blackcard.short_str
+
+
+class GameEventAdmin(ShardedAdmin):
+    list_display = ('id', 'game_number', 'seq', 'action', 'created')
+    list_filter = ('action',)
+    raw_id_fields = ('game',)
+    search_fields = ('=action',)
+
+    def indexed_search(self, queryset, term):
+        # by game
+        if term.isdigit():
+            return queryset.filter(game_id=int(term))
+        return None
+
+    def game_number(self, event):
+        return event.game_id
+    game_number.short_description = 'game'
+    game_number.admin_order_field = 'game_id'
+
+
+class GameArchiveAdmin(BigTableAdmin):
+    list_display = ('game_id', 'name', 'rounds', 'player_count',
+                    'submission_count', 'modified', 'archived')
+    search_fields = ('name',)
+
+    def indexed_search(self, queryset, term):
+        if term.isdigit():
+            return queryset.filter(game_id=int(term))
+        return None
+
+    def get_queryset(self, request):
+        return super(GameArchiveAdmin, self).get_queryset(request).defer(
+            'gamedata_z', 'submissions_z')
+
+
+class CardAdmin(BigTableAdmin):
+
+    """Searches find cards by id, by their whole text (any case and
+    spacing) or else by the words in their text, all indexed (see
+    cards.search), the table is never scanned."""
+
+    list_display = ('id', 'text', 'watermark')
+    # for the search box, get_search_results() does the searching
+    search_fields = ('text',)
+
+    def text_hashes(self, text):
+        return [card_text_hash(text)]
+
+    def indexed_search(self, queryset, term):
+        if term.isdigit():
+            return queryset.filter(pk=int(term))
+        matches = queryset.filter(text_hash__in=self.text_hashes(term))
+        if matches.exists():
+            return matches
+        return search.contains(self.model, term, queryset)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return self.indexed_search(queryset, term), False
+
+
+class BlackCardAdmin(CardAdmin):
+    list_display = ('id', 'text', 'pick', 'draw', 'watermark')
+    list_filter = ('pick',)
+
+    def text_hashes(self, text):
+        return [card_text_hash(text, pick, draw)
+                for pick, draw in BLACK_CARD_SHAPES]
+
+
+class CardSetAdmin(admin.ModelAdmin):
+    list_display = ('name', 'description', 'active', 'base_deck', 'weight')
+    list_filter = ('active', 'base_deck')
+    search_fields = ('name',)
+    # ids rather than a select listing every card
+    raw_id_fields = ('black_card', 'white_card')
+
+
+admin.site.register(Game, GameAdmin)
+admin.site.register(StandardSubmission, StandardSubmissionAdmin)
+admin.site.register(GameEvent, GameEventAdmin)
+admin.site.register(GameArchive, GameArchiveAdmin)
+admin.site.register(WhiteCard, CardAdmin)
+admin.site.register(BlackCard, BlackCardAdmin)
+admin.site.register(CardSet, CardSetAdmin)
 
 
 def autoregister(*app_list):
@@ -33,4 +312,5 @@ def autoregister(*app_list):
                 pass
 
 
+# the rest
 autoregister('cards')
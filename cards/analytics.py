@@ -0,0 +1,216 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Card win rates, aggregated from StandardSubmission.
+
+update_card_stats() walks the submissions in id order, a chunk at a
+time, adding to WhiteCardStats, BlackCardStats and CardPairStats. The
+last processed id is kept in an AnalyticsWatermark so each run only
+looks at new rows. Submission ids are per shard (see cards.sharding),
+so every shard has its own watermark. The stats are on 'default'. Run
+it with the card_stats management command.
+"""
+
+import collections
+import datetime
+import functools
+import hashlib
+import operator
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import (
+    Case,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    Q,
+    Value,
+    When,
+)
+
+from cards import sharding
+from cards.models import (
+    StandardSubmission,
+    WhiteCardStats,
+    BlackCardStats,
+    CardPairStats,
+    AnalyticsWatermark,
+    default_game_timeout,
+)
+
+WATERMARK_NAME = 'card_stats'
+# submissions per chunk, their ids are one query's parameters and SQLite
+# allows 999
+DEFAULT_CHUNK_SIZE = 900
+# stats rows per query, an UPDATE of card pairs has 8 parameters a row
+KEYS_PER_QUERY = 100
+HALL_OF_FAME_SIZE = 10
+HALL_OF_FAME_MIN_PLAYED = 5  # ignore cards that won their only outing
+HALL_OF_FAME_CACHE_TIMEOUT = 60 * 60
+
+
+class Tally(object):
+
+    """played/wins counters for one chunk of submissions."""
+
+    def __init__(self):
+        self.played = collections.Counter()
+        self.wins = collections.Counter()
+
+    def add(self, key, winner):
+        self.played[key] += 1
+        if winner:
+            self.wins[key] += 1
+
+
+def _keys_filter(key_fields, keys):
+    if len(key_fields) == 1:
+        return Q(**{'%s__in' % key_fields[0]: [key[0] for key in keys]})
+    return functools.reduce(operator.or_, [
+        Q(**dict(zip(key_fields, key))) for key in keys])
+
+
+def _by_key(key_fields, keys, counter):
+    """SQL expression for `counter`[key] of the row's key."""
+    return Case(
+        *[When(then=Value(counter[key]), **dict(zip(key_fields, key)))
+          for key in keys],
+        default=Value(0), output_field=IntegerField())
+
+
+def _apply(model, key_fields, tally):
+    """Add `tally` to the `model` rows identified by `key_fields`, one
+    SELECT, UPDATE and INSERT per KEYS_PER_QUERY keys."""
+    keys = sorted(tally.played)
+    for start in range(0, len(keys), KEYS_PER_QUERY):
+        batch = keys[start:start + KEYS_PER_QUERY]
+        existing = set(model.objects.filter(
+            _keys_filter(key_fields, batch)).values_list(*key_fields))
+        updates = [key for key in batch if key in existing]
+        if updates:
+            model.objects.filter(_keys_filter(key_fields, updates)).update(
+                played=F('played') + _by_key(key_fields, updates, tally.played),
+                wins=F('wins') + _by_key(key_fields, updates, tally.wins),
+            )
+        model.objects.bulk_create([
+            model(played=tally.played[key], wins=tally.wins[key],
+                  **dict(zip(key_fields, key)))
+            for key in batch if key not in existing])
+
+
+def watermark_name(alias):
+    """The AnalyticsWatermark name for the submissions on shard `alias`."""
+    if alias == DEFAULT_DB_ALIAS:
+        return WATERMARK_NAME
+    return '%s:%s' % (WATERMARK_NAME, alias)
+
+
+def _process_chunk(chunk, using=DEFAULT_DB_ALIAS):
+    """`chunk` is list of (submission id, black card id, winner) of the
+    submissions on shard `using`."""
+    through = StandardSubmission.submissions.through
+    white_cards = collections.defaultdict(list)
+    for submission_id, white_card_id in through.objects.using(using).filter(
+            standardsubmission_id__in=[row[0] for row in chunk]
+            ).values_list('standardsubmission_id', 'whitecard_id'):
+        white_cards[submission_id].append(white_card_id)
+
+    white_tally = Tally()
+    black_tally = Tally()
+    pair_tally = Tally()
+    for submission_id, black_card_id, winner in chunk:
+        black_tally.add((black_card_id,), winner)
+        for white_card_id in white_cards[submission_id]:
+            white_tally.add((white_card_id,), winner)
+            pair_tally.add((black_card_id, white_card_id), winner)
+
+    _apply(WhiteCardStats, ('white_card_id',), white_tally)
+    _apply(BlackCardStats, ('black_card_id',), black_tally)
+    _apply(CardPairStats, ('black_card_id', 'white_card_id'), pair_tally)
+
+
+def update_card_stats(chunk_size=DEFAULT_CHUNK_SIZE, settle=None):
+    """Aggregate submissions not yet seen into the card stats tables.
+
+    Only submissions older than `settle` (a timedelta, default is the
+    game timeout) are processed, newer ones may still be picked as the
+    winner. Generator, yields the number of submissions per chunk, each
+    chunk (and the watermark) is committed on its own.
+    """
+    settle = default_game_timeout() if settle is None else settle
+    cutoff = datetime.datetime.now() - settle
+    for alias in sharding.game_aliases():
+        watermark, _ = AnalyticsWatermark.objects.get_or_create(
+            name=watermark_name(alias))
+        submissions = StandardSubmission.objects.using(alias).filter(
+            created__lt=cutoff, blackcard__isnull=False).order_by('id')
+        while True:
+            chunk = list(submissions.filter(
+                id__gt=watermark.last_id).values_list(
+                'id', 'blackcard_id', 'winner')[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                _process_chunk(chunk, alias)
+                watermark.last_id = chunk[-1][0]
+                watermark.save()
+            yield len(chunk)
+
+
+def _watermarks():
+    return AnalyticsWatermark.objects.filter(
+        Q(name=WATERMARK_NAME) | Q(name__startswith=WATERMARK_NAME + ':'))
+
+
+@transaction.atomic
+def reset_card_stats():
+    CardPairStats.objects.all().delete()
+    WhiteCardStats.objects.all().delete()
+    BlackCardStats.objects.all().delete()
+    _watermarks().delete()
+
+
+def _win_rate():
+    return ExpressionWrapper(
+        F('wins') * 1.0 / F('played'), output_field=FloatField())
+
+
+def hall_of_fame(card_set_name=None, size=HALL_OF_FAME_SIZE):
+    """Returns dict of top white cards (by win rate), black cards (by
+    submissions) and card pairs (by wins), optionally restricted to one
+    card set.
+
+    Cached until the next update_card_stats() run.
+    """
+    watermark = '-'.join(
+        '%d' % last_id for last_id in _watermarks().order_by(
+            'name').values_list('last_id', flat=True))
+    # card set names are user input, any length and characters
+    name_hash = hashlib.md5(
+        (card_set_name or '').encode('utf-8')).hexdigest()
+    cache_key = 'hall_of_fame:%s:%s:%d' % (watermark, name_hash, size)
+    result = cache.get(cache_key)
+    if result is not None:
+        return result
+
+    white = WhiteCardStats.objects.filter(played__gte=HALL_OF_FAME_MIN_PLAYED)
+    black = BlackCardStats.objects.all()
+    pairs = CardPairStats.objects.filter(wins__gt=0)
+    if card_set_name:
+        white = white.filter(white_card__cardset__name=card_set_name)
+        black = black.filter(black_card__cardset__name=card_set_name)
+        pairs = pairs.filter(black_card__cardset__name=card_set_name)
+
+    result = {
+        'white_cards': list(white.annotate(win_rate=_win_rate()).order_by(
+            '-win_rate', '-played').values_list(
+            'white_card__text', 'played', 'wins', 'win_rate')[:size]),
+        'black_cards': list(black.order_by('-played').values_list(
+            'black_card__text', 'played', 'wins')[:size]),
+        'pairs': list(pairs.order_by('-wins', '-played').values_list(
+            'black_card__text', 'white_card__text', 'played', 'wins')[:size]),
+    }
+    cache.set(cache_key, result, HALL_OF_FAME_CACHE_TIMEOUT)
+    return result
@@ -2,8 +2,8 @@ from rest_framework import serializers
 from cards.models import Game
 
 class GameSerializer(serializers.Serializer):
-    pk = serializers.Field()
+    pk = serializers.ReadOnlyField()
     name = serializers.CharField(max_length=140)
     game_state = serializers.CharField(max_length=140)
     is_active = serializers.BooleanField()
-    gamedata = serializers.Field()
+    gamedata = serializers.ReadOnlyField()
@@ -1,8 +1,49 @@
 from cards.models import Game
 from cards.api.serializers import GameSerializer
+from cards import eventlog, profiling, sharding, stats
+from cards.ratelimit import rate_limit
+from cards.routers import replica_reads
+from django.utils.decorators import method_decorator
 from rest_framework import mixins
 from rest_framework import generics
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 class GameDetail(generics.RetrieveAPIView):
     queryset = Game.objects.all()
-    serializer_class = GameSerializer
\ No newline at end of file
+    serializer_class = GameSerializer
+
+    def get_queryset(self):
+        return sharding.game_queryset(Game, int(self.kwargs['pk']))
+
+    def get_object(self):
+        game = eventlog.catch_up(super(GameDetail, self).get_object())
+        profiling.note_game(self.request, game)
+        return game
+
+    @method_decorator(rate_limit('game-api'))
+    def dispatch(self, request, *args, **kwargs):
+        return super(GameDetail, self).dispatch(request, *args, **kwargs)
+
+    @replica_reads()
+    def get(self, request, *args, **kwargs):
+        return super(GameDetail, self).get(request, *args, **kwargs)
+
+class Leaderboard(APIView):
+
+    """Top players, ?period=day|week for the current day/week."""
+
+    def get(self, request, format=None):
+        period = request.query_params.get('period') or None
+        try:
+            leaders = stats.leaderboard(period)
+        except ValueError as info:
+            raise ParseError(str(info))
+        return Response({
+            'period': period or 'all',
+            'leaders': [
+                {'player_name': player_name, 'wins': wins}
+                for player_name, wins in leaders
+            ],
+        })
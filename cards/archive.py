@@ -0,0 +1,197 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Archive finished games into GameArchive (and back again).
+
+Inactive games keep their complete gamedata (decks, hands, ...) which
+makes the Game table, and every query against it, bigger than it needs
+to be. Archiving moves the game and its StandardSubmission rows into a
+single GameArchive row with compressed payloads.
+
+With sharding (cards.sharding) games are archived from every shard
+(and 'default'), GameArchive is on 'default' and games are restored to
+their shard.
+"""
+
+import datetime
+import json
+import zlib
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from cards import eventlog, sharding
+from cards.models import Game, GameArchive, StandardSubmission
+from . import log
+
+DEFAULT_ARCHIVE_AGE = datetime.timedelta(days=30)
+DEFAULT_BATCH_SIZE = 200
+
+
+def compress_json(obj):
+    data = json.dumps(obj, separators=(',', ':'))
+    return zlib.compress(data.encode('utf-8'), 9)
+
+
+def decompress_json(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def hot_table_size():
+    """Returns (row count, size in bytes) of the Game table, over all the
+    shards.
+
+    On PostgreSQL the size includes indexes and TOAST, elsewhere it is
+    the total length of the gamedata column which is the bulk of it.
+    """
+    table = Game._meta.db_table
+    total_rows = total_size = 0
+    for alias in sharding.game_aliases():
+        connection = connections[alias]
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT COUNT(*) FROM %s' % table)
+            rows = cursor.fetchone()[0]
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+            else:
+                cursor.execute(
+                    'SELECT COALESCE(SUM(LENGTH(gamedata)), 0) FROM %s' % table)
+            size = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        total_rows += rows
+        total_size += size
+    return total_rows, total_size
+
+
+def _export_submissions(game_ids, using=DEFAULT_DB_ALIAS):
+    """Returns dict of game id: [list of submission dicts]."""
+    through = StandardSubmission.submissions.through
+    white_cards = {}
+    for submission_id, white_card_id in through.objects.using(using).filter(
+            standardsubmission__game_id__in=game_ids).order_by(
+            'id').values_list('standardsubmission_id', 'whitecard_id'):
+        white_cards.setdefault(submission_id, []).append(white_card_id)
+
+    result = {}
+    for submission in StandardSubmission.objects.using(using).filter(
+            game_id__in=game_ids).order_by('id'):
+        result.setdefault(submission.game_id, []).append({
+            'id': submission.id,
+            'created': submission.created.isoformat(),
+            'modified': submission.modified.isoformat(),
+            'round': submission.round,
+            'player_name': submission.player_name,
+            'blackcard': submission.blackcard_id,
+            'winner': submission.winner,
+            'complete_submission': submission.complete_submission,
+            'submissions': white_cards.get(submission.id, []),
+        })
+    return result
+
+
+def _archive_batch(game_ids, using=DEFAULT_DB_ALIAS):
+    submissions = _export_submissions(game_ids, using)
+    archives = []
+    for game in Game.objects.using(using).filter(pk__in=game_ids):
+        eventlog.catch_up(game)
+        game_submissions = submissions.get(game.id, [])
+        archives.append(GameArchive(
+            game_id=game.id,
+            name=game.name,
+            game_state=game.game_state,
+            created=game.created,
+            modified=game.modified,
+            rounds=game.gamedata.get('round', 0),
+            player_count=len(game.gamedata.get('players', {})),
+            submission_count=len(game_submissions),
+            gamedata_z=compress_json(game.gamedata),
+            submissions_z=compress_json(game_submissions),
+        ))
+    GameArchive.objects.using(DEFAULT_DB_ALIAS).bulk_create(archives)
+    # deletes submissions (and their white card links) and events too
+    Game.objects.using(using).filter(pk__in=game_ids).delete()
+    return len(archives)
+
+
+def archive_games(older_than=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Move inactive games last modified before `older_than` into
+    GameArchive, `batch_size` games per transaction.
+
+    Generator, yields the number of games archived per batch.
+    """
+    older_than = older_than or (datetime.datetime.now() - DEFAULT_ARCHIVE_AGE)
+    for alias in sharding.game_aliases():
+        candidates = Game.objects.using(alias).filter(
+            is_active=False, modified__lt=older_than).order_by('pk')
+        last_id = 0
+        while True:
+            game_ids = list(candidates.filter(pk__gt=last_id).values_list(
+                'pk', flat=True)[:batch_size])
+            if not game_ids:
+                break
+            with transaction.atomic(using=DEFAULT_DB_ALIAS), \
+                    transaction.atomic(using=alias):
+                count = _archive_batch(game_ids, alias)
+            log.logger.debug('archived %d games from %s up to id %d',
+                             count, alias, game_ids[-1])
+            last_id = game_ids[-1]
+            yield count
+
+
+def _restore_archive(archive, using=DEFAULT_DB_ALIAS):
+    game = Game(
+        id=archive.game_id,
+        name=archive.name,
+        game_state=archive.game_state,
+        is_active=False,
+        created=archive.created,
+        modified=archive.modified,
+        gamedata=decompress_json(archive.gamedata_z),
+    )
+    # raw save keeps created/modified and the name as archived
+    game.save_base(using=using, raw=True, force_insert=True)
+
+    through = StandardSubmission.submissions.through
+    submissions = []
+    white_card_links = []
+    for entry in decompress_json(archive.submissions_z):
+        submissions.append(StandardSubmission(
+            id=entry['id'],
+            game_id=game.id,
+            created=parse_datetime(entry['created']),
+            modified=parse_datetime(entry['modified']),
+            round=entry.get('round', 0),
+            player_name=entry.get('player_name', ''),
+            blackcard_id=entry['blackcard'],
+            winner=entry['winner'],
+            complete_submission=entry['complete_submission'],
+        ))
+        for white_card_id in entry['submissions']:
+            white_card_links.append(through(
+                standardsubmission_id=entry['id'],
+                whitecard_id=white_card_id,
+            ))
+    StandardSubmission.objects.using(using).bulk_create(submissions)
+    through.objects.using(using).bulk_create(white_card_links)
+    archive.delete()
+
+
+def restore_games(game_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Move archived games (by original game id) back into the Game table.
+
+    Generator, yields the number of games restored per batch.
+    """
+    game_ids = sorted(game_ids)
+    for offset in range(0, len(game_ids), batch_size):
+        batch = game_ids[offset:offset + batch_size]
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            count = 0
+            for archive in GameArchive.objects.using(DEFAULT_DB_ALIAS).filter(
+                    game_id__in=batch):
+                alias = sharding.shard_for(archive.game_id)
+                with transaction.atomic(using=alias):
+                    _restore_archive(archive, alias)
+                count += 1
+        yield count
@@ -0,0 +1,235 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Card catalog caching.
+
+The catalog (cards and card sets) changes rarely, imports and admin
+edits, so anything derived from it is cached (in the shared cache, see
+cards.sharedcache) under the current catalog_version() and simply stops
+being used when the version moves. What is cached is read from the
+primary database, where the version comes from, not from a replica
+that may not have the change yet.
+"""
+
+import array
+import collections
+import contextlib
+import hashlib
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from cards.models import (
+    BlackCard,
+    CardSet,
+    CatalogVersion,
+    WhiteCard,
+    DEFAULT_CARD_SETS,
+)
+from cards.routers import primary_reads
+from cards.sharedcache import cache
+
+CATALOG_VERSION_KEY = 'catalog_version'
+# other processes notice a new version after at most this many seconds
+CATALOG_VERSION_TIMEOUT = 60
+CARD_SET_CACHE_TIMEOUT = 24 * 60 * 60
+CARD_POOL_CACHE_TIMEOUT = 24 * 60 * 60
+# card set combinations worth having in the cache before anyone asks
+POPULAR_CARD_SETS = [DEFAULT_CARD_SETS]
+ID_ARRAY_TYPECODE = 'i'
+
+_local = threading.local()
+_pool_stats = collections.Counter()
+
+
+def db_catalog_version():
+    """catalog_version() straight from the database."""
+    return CatalogVersion.objects.filter(pk=1).values_list(
+        'version', flat=True).first() or 0
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = db_catalog_version()
+        cache.set(CATALOG_VERSION_KEY, version, CATALOG_VERSION_TIMEOUT)
+    return version
+
+
+def bump_catalog_version():
+    if not CatalogVersion.objects.filter(pk=1).update(
+            version=F('version') + 1):
+        try:
+            with transaction.atomic():
+                CatalogVersion.objects.create(pk=1, version=1)
+        except IntegrityError:
+            CatalogVersion.objects.filter(pk=1).update(
+                version=F('version') + 1)
+    cache.delete(CATALOG_VERSION_KEY)
+
+
+def catalog_changed():
+    """Called (via signals) whenever cards or card sets change."""
+    if not getattr(_local, 'batch_depth', 0):
+        bump_catalog_version()
+
+
+@contextlib.contextmanager
+def batch_changes():
+    """Bump the catalog version once for all changes made in the block,
+    rather than once per saved/deleted card."""
+    _local.batch_depth = getattr(_local, 'batch_depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.batch_depth -= 1
+    if _local.batch_depth == 0:
+        # bulk inserts do not send signals, so always bump
+        bump_catalog_version()
+
+
+def _snapshot():
+    from cards import snapshot
+    return snapshot.current_snapshot()
+
+
+def black_card(card_id):
+    """Returns the BlackCard, from the catalog snapshot if there is one."""
+    current_snapshot = _snapshot()
+    if current_snapshot is not None:
+        try:
+            text, pick, draw = current_snapshot.black_card(card_id)
+        except KeyError:
+            pass
+        else:
+            return BlackCard(id=card_id, text=text, pick=pick, draw=draw)
+    return BlackCard.objects.get(id=card_id)
+
+
+def white_card_texts(card_ids):
+    """Returns dict of card id: text for the white cards in `card_ids`,
+    from the catalog snapshot if there is one."""
+    current_snapshot = _snapshot()
+    result = {}
+    missing = card_ids
+    if current_snapshot is not None:
+        missing = []
+        for card_id in card_ids:
+            try:
+                result[card_id] = current_snapshot.white_card(card_id)
+            except KeyError:
+                missing.append(card_id)
+    if missing:
+        result.update(WhiteCard.objects.filter(
+            id__in=missing).values_list('id', 'text'))
+    return result
+
+
+def _card_set_key(version, card_set_name):
+    name_hash = hashlib.md5(card_set_name.encode('utf-8')).hexdigest()
+    return 'card_set_ids:%d:%s' % (version, name_hash)
+
+
+def card_set_ids(card_set_names):
+    """Returns dict of card set name: (white card ids, black card ids).
+
+    Each card set's ids are cached, the sets not in the cache are loaded
+    from the catalog snapshot if there is one, otherwise with one query
+    per card colour however many there are. Unknown card set names have
+    no cards.
+    """
+    version = catalog_version()
+    keys = dict((name, _card_set_key(version, name)) for name in card_set_names)
+    cached = cache.get_many(list(keys.values()))
+
+    result = {}
+    missing = []
+    for name, key in keys.items():
+        if key in cached:
+            result[name] = cached[key]
+        else:
+            missing.append(name)
+
+    if missing:
+        current_snapshot = _snapshot()
+        if current_snapshot is not None:
+            for name in missing:
+                result[name] = current_snapshot.card_set_ids(name)
+        else:
+            white = collections.defaultdict(list)
+            black = collections.defaultdict(list)
+            with primary_reads():
+                for name, card_id in CardSet.white_card.through.objects.filter(
+                        cardset__name__in=missing).values_list(
+                        'cardset__name', 'whitecard_id'):
+                    white[name].append(card_id)
+                for name, card_id in CardSet.black_card.through.objects.filter(
+                        cardset__name__in=missing).values_list(
+                        'cardset__name', 'blackcard_id'):
+                    black[name].append(card_id)
+            for name in missing:
+                result[name] = (white[name], black[name])
+        cache.set_many(dict((keys[name], result[name]) for name in missing),
+                       CARD_SET_CACHE_TIMEOUT)
+    return result
+
+
+def _pack_ids(ids):
+    packed = array.array(ID_ARRAY_TYPECODE, sorted(ids))
+    return getattr(packed, 'tobytes', getattr(packed, 'tostring', None))()
+
+
+def _unpack_ids(data):
+    unpacked = array.array(ID_ARRAY_TYPECODE)
+    getattr(unpacked, 'frombytes', getattr(unpacked, 'fromstring', None))(data)
+    return unpacked.tolist()
+
+
+def _card_pool_key(version, card_set_names):
+    names = u'\x00'.join(sorted(set(card_set_names)))
+    names_hash = hashlib.md5(names.encode('utf-8')).hexdigest()
+    return 'card_pool:%d:%s' % (version, names_hash)
+
+
+def card_pool(card_set_names):
+    """Returns (white card ids, black card ids) for the union of the named
+    card sets, without duplicates, in no particular order.
+
+    The combined pool is cached per combination of card set names as
+    packed integer arrays, so the usual combinations cost one cache get.
+    """
+    key = _card_pool_key(catalog_version(), card_set_names)
+    packed = cache.get(key)
+    if packed is not None:
+        _pool_stats['hits'] += 1
+        return _unpack_ids(packed[0]), _unpack_ids(packed[1])
+
+    _pool_stats['misses'] += 1
+    white = set()
+    black = set()
+    for white_ids, black_ids in card_set_ids(card_set_names).values():
+        white.update(white_ids)
+        black.update(black_ids)
+    cache.set(key, (_pack_ids(white), _pack_ids(black)), CARD_POOL_CACHE_TIMEOUT)
+    return list(white), list(black)
+
+
+def card_pool_stats():
+    """Returns dict of hits, misses and hit_rate of the card_pool() cache
+    in this process."""
+    hits = _pool_stats['hits']
+    misses = _pool_stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': float(hits) / total if total else 0.0,
+    }
+
+
+def warm_card_pools(combinations=None):
+    """Make sure the card pools of `combinations` (list of lists of card set
+    names, default POPULAR_CARD_SETS) are cached."""
+    for card_set_names in combinations or POPULAR_CARD_SETS:
+        card_pool(card_set_names)
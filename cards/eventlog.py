@@ -0,0 +1,214 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Append-only log of game actions.
+
+With settings.GAME_EVENT_LOG each game action (see cards.actions) is
+stored as a GameEvent row with the action, its arguments and a patch of
+what it changed in gamedata, rather than rewriting all of gamedata
+(mostly the decks) on every action. Every GAME_SNAPSHOT_EVERY events
+the whole gamedata is saved as a snapshot, Game.snapshot_seq is the
+number of the last event it includes and Game.event_seq the number of
+the last event. Loading a game (sharding.get_game() and find_game())
+applies the events after the snapshot, also with the log turned off
+again, the next save of the game then makes a new snapshot.
+
+Only the log moves Game.event_seq, with an UPDATE conditional on the
+event_seq the game was loaded with. Saving a game never writes it and
+a game loaded before the latest events first catches up with them (see
+Game._do_update()), so saving an old copy does not undo them.
+
+Event 0 ("create") holds the initial gamedata so replay() can step
+through a game from the start, e.g. with the replay_game command.
+
+A patch is a list of operations on a path (list of keys) into gamedata:
+
+    ['set', path, value]
+    ['del', path]
+    ['splice', path, start, count, items]   replace list[start:start + count]
+
+dealing a card is a ['splice', ['white_deck'], 41, 1, []].
+"""
+
+import copy
+import datetime
+import json
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from cards import gamestate, sharding
+from cards.models import Game, GameError, GameEvent
+
+CREATE = 'create'
+DEFAULT_SNAPSHOT_EVERY = 20
+
+
+class Conflict(GameError):
+
+    """Another event was logged for the game since it was loaded."""
+
+
+def enabled():
+    return getattr(settings, 'GAME_EVENT_LOG', False)
+
+
+def snapshot_every():
+    return getattr(settings, 'GAME_SNAPSHOT_EVERY', DEFAULT_SNAPSHOT_EVERY)
+
+
+def plain(gamedata):
+    """`gamedata` as it is stored, tuples are lists and so on."""
+    return json.loads(json.dumps(gamedata))
+
+
+def diff(before, after, path=None):
+    """Returns the patch that turns `before` into `after` (both plain)."""
+    path = path or []
+    if isinstance(before, dict) and isinstance(after, dict):
+        patch = []
+        for key in before:
+            if key not in after:
+                patch.append(['del', path + [key]])
+        for key, value in after.items():
+            if key not in before:
+                patch.append(['set', path + [key], value])
+            elif before[key] != value:
+                patch.extend(diff(before[key], value, path + [key]))
+        return patch
+    if isinstance(before, list) and isinstance(after, list):
+        if before == after:
+            return []
+        # cards are taken from and added to the ends, or removed from the
+        # middle of a hand, one splice covers the changed part
+        limit = min(len(before), len(after))
+        start = 0
+        while start < limit and before[start] == after[start]:
+            start += 1
+        end = 0
+        while end < limit - start and before[-1 - end] == after[-1 - end]:
+            end += 1
+        return [['splice', path, start, len(before) - start - end,
+                 after[start:len(after) - end]]]
+    if before != after:
+        return [['set', path, after]]
+    return []
+
+
+def apply_patch(state, patch):
+    """Apply `patch` to `state` in place, returns the new state."""
+    for operation in patch:
+        kind, path = operation[0], operation[1]
+        if not path:
+            if kind == 'set':
+                state = operation[2]
+                continue
+            if kind == 'splice':
+                start, count, items = operation[2:]
+                state[start:start + count] = items
+                continue
+        parent = state
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if kind == 'set':
+            parent[key] = operation[2]
+        elif kind == 'del':
+            del parent[key]
+        elif kind == 'splice':
+            start, count, items = operation[2:]
+            parent[key][start:start + count] = items
+        else:
+            raise ValueError('unknown patch operation %r' % (kind,))
+    return state
+
+
+def game_created(game):
+    """Record the initial state of new game `game` as event 0."""
+    game.__dict__['caught_up'] = True
+    if enabled():
+        GameEvent(game=game, seq=0, action=CREATE, data={
+            'state': plain(game.gamedata),
+            'game_state': game.game_state,
+        }).save()
+
+
+def _apply_events(game, after, upto):
+    events = GameEvent.objects.using(game._state.db or DEFAULT_DB_ALIAS)
+    for event in events.filter(game_id=game.id, seq__gt=after,
+                               seq__lte=upto).order_by('seq'):
+        apply_patch(game.gamedata, event.data['patch'])
+        game.game_state = event.data['game_state']
+
+
+def catch_up(game):
+    """Apply the events after `game`'s snapshot to it. Only queries when
+    there are such events, and works with the log turned off so games
+    keep their last events after turning it off."""
+    if game.__dict__.get('caught_up'):
+        return game
+    if game.event_seq > game.snapshot_seq:
+        _apply_events(game, game.snapshot_seq, game.event_seq)
+    game.__dict__['caught_up'] = True
+    return game
+
+
+def advance(game, event_seq):
+    """`game` was loaded before events up to `event_seq` were logged,
+    apply them (if it is caught up) so saving it does not undo them, see
+    Game._do_update()."""
+    if game.__dict__.get('caught_up'):
+        _apply_events(game, game.event_seq, event_seq)
+        game.snapshot_seq = event_seq
+    game.event_seq = event_seq
+
+
+def record(game, action, kwargs, before):
+    """Log `action` (with `kwargs`) that changed `game`, whose gamedata was
+    `before` (plain()). Saves a snapshot every snapshot_every() events,
+    otherwise only the event and the small columns of the game row are
+    written. Raises Conflict if another event was logged for the game
+    since it was loaded."""
+    seq = game.event_seq + 1
+    data = {
+        'kwargs': kwargs,
+        'patch': diff(before, plain(game.gamedata)),
+        'game_state': game.game_state,
+    }
+    reshuffles = game.__dict__.pop('reshuffles', None)
+    if reshuffles:
+        data['reshuffles'] = reshuffles
+    using = game._state.db or DEFAULT_DB_ALIAS
+    try:
+        with transaction.atomic(using=using):
+            GameEvent(game=game, seq=seq, action=action, data=data).save()
+    except IntegrityError:
+        raise Conflict('Game "%s" changed, try again' % game.name)
+    game.modified = datetime.datetime.now()
+    if not Game.objects.using(using).filter(
+            pk=game.pk, event_seq=seq - 1).update(
+            game_state=game.game_state, event_seq=seq, modified=game.modified):
+        raise Conflict('Game "%s" changed, try again' % game.name)
+    game.event_seq = seq
+
+    if seq - game.snapshot_seq >= snapshot_every():
+        # sets snapshot_seq, see models.game_pre_save()
+        game.save()
+    else:
+        gamestate.game_saved(game, False)
+
+
+def replay(game_id):
+    """Yields (event, gamedata, game state) after each event of game
+    `game_id` from its creation. gamedata is the same dict each time,
+    updated in place, copy it to keep it."""
+    state = None
+    events = sharding.game_queryset(GameEvent, game_id).filter(game_id=game_id)
+    for event in events.order_by('seq').iterator():
+        if event.action == CREATE:
+            state = copy.deepcopy(event.data['state'])
+        elif state is None:
+            raise ValueError('game %d was created before the event log' % game_id)
+        else:
+            apply_patch(state, event.data['patch'])
+        yield event, state, event.data['game_state']
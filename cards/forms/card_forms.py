@@ -1,11 +1,39 @@
+from django import forms
+from django.core.exceptions import ValidationError
 from django.forms import ModelForm
+from django.forms.widgets import CheckboxInput, HiddenInput
 
 from django.contrib.auth.models import User
 
-from cards.models import SubmittedCard
+from cards import search
+from cards.models import BlackCard, SubmittedCard, WhiteCard, card_text_hash
+
+CARD_MODELS = {'1': WhiteCard, '2': BlackCard}
+# submissions this similar to an existing card (see cards.search) need
+# submit_anyway
+NEAR_DUPLICATE_THRESHOLD = 0.6
+
+
+def submitted_text_hash(model, text):
+    """The text_hash of a new `model` card with `text`, a submission does
+    not say the other hash_fields (a black card's pick and draw) so they
+    are the defaults."""
+    return card_text_hash(text, *[
+        model._meta.get_field(name).default for name in model.hash_fields])
 
 
 class SubmittedCardForm(ModelForm):
+
+    """Rejects cards that already exist (same text_hash) or were already
+    submitted, and asks for submit_anyway when there are cards much like
+    it, e.g. the same words with other blanks or punctuation."""
+
+    submit_anyway = forms.BooleanField(
+        label="Submit anyway, it is not the same as the cards above",
+        required=False,
+        widget=HiddenInput,
+    )
+
     class Meta:
         model = SubmittedCard
         fields = ['submitter', 'card_type', 'text']
@@ -13,4 +41,29 @@ class SubmittedCardForm(ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user')
         super(SubmittedCardForm, self).__init__(*args, **kwargs)
-        self.fields['submitter'].queryset = User.objects.filter(id=user.id)
\ No newline at end of file
+        self.fields['submitter'].queryset = User.objects.filter(id=user.id)
+
+    def clean(self):
+        cleaned_data = super(SubmittedCardForm, self).clean()
+        text = cleaned_data.get('text')
+        card_type = cleaned_data.get('card_type')
+        if not text or card_type not in CARD_MODELS:
+            return cleaned_data
+
+        model = CARD_MODELS[card_type]
+        existing = model.objects.filter(
+            text_hash=submitted_text_hash(model, text)).first()
+        if existing is not None:
+            raise ValidationError(
+                'This card already exists: "%s"' % existing.text)
+        if SubmittedCard.objects.filter(
+                card_type=card_type, text__iexact=text.strip()).exists():
+            raise ValidationError('This card was already submitted')
+        similar = search.similar(model, text,
+                                 threshold=NEAR_DUPLICATE_THRESHOLD)
+        if similar and not cleaned_data.get('submit_anyway'):
+            self.fields['submit_anyway'].widget = CheckboxInput()
+            raise ValidationError(
+                'There are cards much like this one: %s' % ', '.join(
+                    '"%s"' % card.text for _, card in similar))
+        return cleaned_data
@@ -14,7 +14,7 @@ from django.forms.widgets import (
     HiddenInput,
 )
 from django.core.exceptions import ValidationError
-from django.core.cache import cache  # this maybe a bad idea
+from cards.sharedcache import cache
 
 from cards.models import CardSet, DEFAULT_HAND_SIZE
 import cards.log as log
@@ -143,8 +143,7 @@ class JoinForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super(JoinForm, self).__init__(*args, **kwargs)
 
-        player_counter = cache.get('player_counter', 0) + 1
-        cache.set('player_counter', player_counter)
+        player_counter = cache.incr('player_counter')
         self.fields['player_name'].initial = 'Auto Player %d' % player_counter  # TODO remove this? Debug tool
 
     def clean_player_name(self):
@@ -0,0 +1,126 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Per game state versions and the cached lobby game list.
+
+Every save of a game increments its state version (an atomic counter
+in the shared cache), anything derived from a game's state can be
+cached under the version, e.g. the observer page (see GameView). The
+lobby list is cached under a lobby version that moves when games are
+created or finish. The versions only mean something when every worker
+sees the same counters, with a process local cache (see
+sharedcache.is_shared()) nothing is cached under them.
+
+With settings.GAME_EVENTS_URL (redis://...) new state versions are also
+published on the GAME_EVENTS_CHANNEL Redis channel, for the waiting
+endpoints in cah.asgi.
+"""
+
+import json
+
+import redis
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from cards import sharding
+from cards.routers import primary_reads
+from cards.models import Game
+from cards.sharedcache import cache, is_shared
+import cards.log as log
+
+LOBBY_VERSION_KEY = 'lobby_version'
+LOBBY_CACHE_TIMEOUT = 60
+OBSERVER_PAGE_CACHE_TIMEOUT = 300
+GAME_EVENTS_CHANNEL = 'game_events'
+
+_events_redis = None
+
+
+def _state_version_key(game_id):
+    return 'game_state:%d' % game_id
+
+
+def state_version(game_id):
+    return cache.incr(_state_version_key(game_id), 0)
+
+
+def bump_state_version(game_id):
+    return cache.incr(_state_version_key(game_id))
+
+
+def lobby_version():
+    return cache.incr(LOBBY_VERSION_KEY, 0)
+
+
+def bump_lobby_version():
+    return cache.incr(LOBBY_VERSION_KEY)
+
+
+def _observer_page_key(game_id, version):
+    return 'observer_page:%d:%d' % (game_id, version)
+
+
+def observer_page(game_id, version):
+    """(ETag, content) of the cached game page observers see at state
+    `version`, or None."""
+    return cache.get(_observer_page_key(game_id, version))
+
+
+def cache_observer_page(game_id, version, etag, content):
+    cache.set(_observer_page_key(game_id, version), (etag, content),
+              OBSERVER_PAGE_CACHE_TIMEOUT)
+
+
+def publish_state(game_id, version=None):
+    """Publish the state version of a game on GAME_EVENTS_CHANNEL, a
+    no-op without settings.GAME_EVENTS_URL."""
+    global _events_redis
+    url = getattr(settings, 'GAME_EVENTS_URL', None)
+    if not url:
+        return
+    if version is None:
+        version = state_version(game_id)
+    if _events_redis is None:
+        _events_redis = redis.StrictRedis.from_url(url)
+    try:
+        _events_redis.publish(GAME_EVENTS_CHANNEL, json.dumps(
+            {'game': game_id, 'version': version}))
+    except redis.RedisError:
+        # clients still see the change on their next poll
+        log.logger.exception('publishing state of game %d failed', game_id)
+
+
+def game_saved(game, created):
+    """Called (via signals) whenever a game is saved."""
+    version = bump_state_version(game.id)
+    if created or not game.is_active:
+        bump_lobby_version()
+    if not transaction.get_connection(
+            game._state.db or DEFAULT_DB_ALIAS).in_atomic_block:
+        # saves in a transaction are published once it commits, clients
+        # reloading earlier would not see the change
+        publish_state(game.id, version)
+
+
+def lobby_games(include_private=False):
+    """Returns list of (id, name) of the active games, private ones
+    only if `include_private`."""
+    key = None
+    result = None
+    if is_shared():
+        key = 'lobby:%d:%d' % (lobby_version(), include_private)
+        result = cache.get(key)
+    if result is None:
+        games = Game.objects.filter(is_active=True)
+        if not include_private:
+            games = games.exclude(name__startswith='Private')
+        result = []
+        # the primary has what moved the lobby version
+        with primary_reads():
+            for shard_games in sharding.each_shard(games):
+                result.extend(shard_games.values_list('id', 'name'))
+        result.sort()
+        if key is not None:
+            cache.set(key, result, LOBBY_CACHE_TIMEOUT)
+    return result
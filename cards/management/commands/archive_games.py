@@ -0,0 +1,71 @@
+from __future__ import print_function
+
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.archive import (
+    archive_games,
+    restore_games,
+    hot_table_size,
+    DEFAULT_ARCHIVE_AGE,
+    DEFAULT_BATCH_SIZE,
+)
+
+
+class Command(BaseCommand):
+    args = '[game_id game_id ...]'
+    help = ('Move inactive games older than --days into the game archive, '
+            'or with --restore move the listed games back.')
+    option_list = BaseCommand.option_list + (
+        make_option('--days',
+            action='store',
+            type='int',
+            dest='days',
+            default=DEFAULT_ARCHIVE_AGE.days,
+            help='Archive inactive games not modified for this many days'),
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of games per transaction'),
+        make_option('--restore',
+            action='store_true',
+            dest='restore',
+            default=False,
+            help='Restore the archived games listed by (original) game id'),
+        )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        batch_size = options['batch_size']
+
+        before = hot_table_size()
+        if options['restore']:
+            if not args:
+                raise CommandError('--restore needs at least one game id')
+            try:
+                game_ids = [int(x) for x in args]
+            except ValueError:
+                raise CommandError('game ids must be integers')
+            batches = restore_games(game_ids, batch_size=batch_size)
+            action = 'restored'
+        else:
+            older_than = datetime.datetime.now() - datetime.timedelta(
+                days=options['days'])
+            batches = archive_games(older_than, batch_size=batch_size)
+            action = 'archived'
+
+        total = 0
+        for count in batches:
+            total += count
+            if verbosity > 1:
+                print('{} {} games'.format(action, count))
+        after = hot_table_size()
+
+        if verbosity >= 1:
+            print('{} {} games'.format(action, total))
+            print('game table before: {} rows {} bytes'.format(*before))
+            print('game table after: {} rows {} bytes'.format(*after))
@@ -0,0 +1,52 @@
+from __future__ import print_function
+
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from cards.analytics import (
+    update_card_stats,
+    reset_card_stats,
+    DEFAULT_CHUNK_SIZE,
+)
+
+
+class Command(BaseCommand):
+    help = ('Aggregate new StandardSubmission rows into the card win rate '
+            'tables, intended to be run nightly.')
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+            action='store',
+            type='int',
+            dest='chunk_size',
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of submissions per chunk/transaction'),
+        make_option('--settle-minutes',
+            action='store',
+            type='int',
+            dest='settle_minutes',
+            default=None,
+            help='Skip submissions newer than this (default game timeout)'),
+        make_option('--full',
+            action='store_true',
+            dest='full',
+            default=False,
+            help='Throw away existing stats and start from the first submission'),
+        )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        settle = None
+        if options['settle_minutes'] is not None:
+            settle = datetime.timedelta(minutes=options['settle_minutes'])
+        if options['full']:
+            reset_card_stats()
+
+        total = 0
+        for count in update_card_stats(options['chunk_size'], settle=settle):
+            total += count
+            if verbosity > 1:
+                print('processed {} submissions'.format(count))
+        if verbosity >= 1:
+            print('processed {} submissions in total'.format(total))
@@ -1,10 +1,10 @@
 from django.core.management.base import BaseCommand
 from cards.models import Game
+from cards.sharding import each_shard
 
 class Command(BaseCommand):
 
     def handle(self, *args, **options):
-        game_list = Game.objects.filter(is_active=True)
-
-        for game in game_list:
-            game.deactivate_old_game()
+        for game_list in each_shard(Game.objects.filter(is_active=True)):
+            for game in game_list:
+                game.deactivate_old_game()
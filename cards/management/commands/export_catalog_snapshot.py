@@ -0,0 +1,29 @@
+from __future__ import print_function
+
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Write the card catalog to a binary snapshot file for workers '
+            'to memory map (see CARD_SNAPSHOT).')
+    option_list = BaseCommand.option_list + (
+        make_option('--output',
+            action='store',
+            dest='output',
+            default=None,
+            help='Snapshot file to write, default settings.CARD_SNAPSHOT'),
+        )
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'CARD_SNAPSHOT', None)
+        if not path:
+            raise CommandError('Use --output or set CARD_SNAPSHOT')
+        counts = write_snapshot(path)
+        if int(options['verbosity']) >= 1:
+            print('wrote {black_cards} black cards, {white_cards} white cards, '
+                  '{card_sets} card sets to {path}'.format(path=path, **counts))
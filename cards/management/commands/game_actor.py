@@ -0,0 +1,53 @@
+from __future__ import print_function
+
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.actions import GameActor, ACTOR_MAX_AGE, ACTOR_MAX_GAMES
+
+
+class Command(BaseCommand):
+    help = ('Run the single writer for one shard of games, applying the game '
+            'actions web workers send it (see GAME_ACTOR_URL).')
+    option_list = BaseCommand.option_list + (
+        make_option('--url',
+            action='store',
+            dest='url',
+            default=None,
+            help='unix:// socket or redis:// queue, default settings.GAME_ACTOR_URL'),
+        make_option('--shard',
+            action='store',
+            type='int',
+            dest='shard',
+            default=0,
+            help='Shard to serve, 0 to GAME_ACTOR_SHARDS - 1'),
+        make_option('--max-games',
+            action='store',
+            type='int',
+            dest='max_games',
+            default=ACTOR_MAX_GAMES,
+            help='Number of games to keep in memory'),
+        make_option('--max-age',
+            action='store',
+            type='int',
+            dest='max_age',
+            default=ACTOR_MAX_AGE,
+            help='Seconds before re-reading a game from the database'),
+        )
+
+    def handle(self, *args, **options):
+        url = options['url'] or getattr(settings, 'GAME_ACTOR_URL', None)
+        if not url:
+            raise CommandError('Use --url or set GAME_ACTOR_URL')
+        shards = getattr(settings, 'GAME_ACTOR_SHARDS', 1)
+        if not 0 <= options['shard'] < shards:
+            raise CommandError('--shard must be between 0 and %d' % (shards - 1))
+        actor = GameActor(
+            options['shard'], shards,
+            max_games=options['max_games'], max_age=options['max_age'])
+        if int(options['verbosity']) >= 1:
+            print('game actor for shard {} of {} on {}'.format(
+                options['shard'], shards, url))
+        actor.serve(url)
@@ -0,0 +1,54 @@
+from __future__ import print_function
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from cards.sharding import (
+    misplaced_games,
+    rebalance,
+    shard_aliases,
+    shard_for,
+    DEFAULT_BATCH_SIZE,
+)
+
+
+class Command(BaseCommand):
+    help = ('Move games (and their submissions) that are not on the '
+            'database settings.GAME_SHARDS puts them on.')
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of games loaded at a time'),
+        make_option('--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only list the games that would be moved'),
+        )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        batch_size = options['batch_size']
+
+        if options['dry_run']:
+            moves = ((game.pk, game._state.db, shard_for(game.pk))
+                     for game in misplaced_games(batch_size))
+            action = 'would move'
+        else:
+            moves = rebalance(batch_size)
+            action = 'moved'
+
+        total = 0
+        for game_id, source, target in moves:
+            total += 1
+            if verbosity > 1 or options['dry_run']:
+                print('{} game {} from {} to {}'.format(
+                    action, game_id, source, target))
+
+        if verbosity >= 1:
+            print('{} {} games, shards: {}'.format(
+                action, total, ', '.join(shard_aliases())))
@@ -0,0 +1,48 @@
+from __future__ import print_function
+
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.eventlog import replay
+
+
+class Command(BaseCommand):
+    args = '<game_id>'
+    help = ('Step through a game logged with settings.GAME_EVENT_LOG, '
+            'printing each action and the state after it.')
+    option_list = BaseCommand.option_list + (
+        make_option('--gamedata',
+            action='store_true',
+            dest='gamedata',
+            default=False,
+            help='Print the whole gamedata after each action'),
+        )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: replay_game <game_id>')
+        try:
+            game_id = int(args[0])
+        except ValueError:
+            raise CommandError('Game id must be a number: %r' % args[0])
+
+        events = 0
+        try:
+            for event, gamedata, game_state in replay(game_id):
+                events += 1
+                print('#{} {} {} {} round {} czar {!r} {}'.format(
+                    event.seq, event.created, event.action,
+                    json.dumps(event.data.get('kwargs', {}), sort_keys=True),
+                    gamedata.get('round'), gamedata.get('card_czar'),
+                    game_state))
+                if event.data.get('reshuffles'):
+                    print('    reshuffled {}'.format(
+                        ', '.join(event.data['reshuffles'])))
+                if options['gamedata']:
+                    print(json.dumps(gamedata, indent=4, sort_keys=True))
+        except ValueError as info:
+            raise CommandError(str(info))
+        if not events:
+            raise CommandError('No events for game %d' % game_id)
@@ -0,0 +1,20 @@
+from __future__ import print_function
+
+from django.core.management.base import BaseCommand
+
+from cards.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = ('Load views, URLs, templates and the card catalog the way a '
+            'worker does at boot with CAH_WARMUP set, print the timings.')
+
+    def handle(self, *args, **options):
+        total = 0.0
+        for name, seconds in warm_up().items():
+            if seconds is None:
+                print('{:<12} failed'.format(name))
+            else:
+                total += seconds
+                print('{:<12} {:8.3f}s'.format(name, seconds))
+        print('{:<12} {:8.3f}s'.format('total', total))
@@ -0,0 +1,226 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Per view request metrics, kept in this process.
+
+MetricsMiddleware records, for every request and by view:
+
+    wall time
+    ORM query count and time
+    template render time (TemplateResponse views)
+    gamedata bytes decoded and encoded (Game.gamedata)
+    shared cache L1/L2 hits and misses (cards.sharedcache)
+
+Times and query counts go into histograms, the rest into counters,
+render_prometheus() (the staff only /metrics page) shows them in the
+Prometheus text format. Every worker process has its own numbers.
+
+Queries are timed by a cursor wrapper installed on each new database
+connection, debug cursors (DEBUG, assertNumQueries) are not counted.
+Recording is a thread local lookup and a dict update, cheap enough to
+leave on.
+"""
+
+import collections
+import threading
+import time
+
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.backends.utils import CursorWrapper
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# (metric name, help, buckets, request value)
+HISTOGRAMS = [
+    ('cah_request_seconds', 'Request wall time', TIME_BUCKETS, 'seconds'),
+    ('cah_db_seconds', 'ORM query time per request', TIME_BUCKETS,
+     'db_seconds'),
+    ('cah_db_queries', 'ORM queries per request', COUNT_BUCKETS, 'db_queries'),
+    ('cah_template_seconds', 'Template render time per request',
+     TIME_BUCKETS, 'template_seconds'),
+]
+# (metric name, help, request value)
+COUNTERS = [
+    ('cah_requests_total', 'Requests', 'requests'),
+    ('cah_gamedata_decoded_bytes_total', 'Game.gamedata JSON decoded',
+     'gamedata_decoded_bytes'),
+    ('cah_gamedata_encoded_bytes_total', 'Game.gamedata JSON encoded',
+     'gamedata_encoded_bytes'),
+    ('cah_cache_l1_hits_total', 'Shared cache hits in this process',
+     'cache_l1_hits'),
+    ('cah_cache_l2_hits_total', 'Shared cache hits in the shared tier',
+     'cache_l2_hits'),
+    ('cah_cache_misses_total', 'Shared cache misses', 'cache_misses'),
+]
+UNRESOLVED_VIEW = '<unresolved>'
+
+_local = threading.local()
+_lock = threading.Lock()
+# view name: {value name: [bucket counts..., sum, count]} for histograms,
+# {value name: total} for counters
+_histograms = collections.defaultdict(dict)
+_counters = collections.defaultdict(collections.Counter)
+
+
+def add(name, value=1):
+    """Add `value` to `name` for the current request, if there is one."""
+    values = getattr(_local, 'values', None)
+    if values is not None:
+        values[name] += value
+
+
+def current(name):
+    """`name`'s value so far in the current request, 0 outside requests."""
+    values = getattr(_local, 'values', None)
+    if values is None:
+        return 0
+    return values[name]
+
+
+def start_request():
+    _local.values = collections.Counter()
+    _local.start = time.time()
+
+
+def finish_request(view_name):
+    """Record the current request under `view_name`."""
+    values = getattr(_local, 'values', None)
+    if values is None:
+        return
+    values['seconds'] = time.time() - _local.start
+    values['requests'] = 1
+    _local.values = None
+    record(view_name, values)
+
+
+def record(view_name, values):
+    with _lock:
+        histograms = _histograms[view_name]
+        for name, _, buckets, key in HISTOGRAMS:
+            observed = histograms.get(key)
+            if observed is None:
+                observed = histograms[key] = [0] * (len(buckets) + 2)
+            value = values.get(key, 0)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    observed[index] += 1
+            observed[-2] += value
+            observed[-1] += 1
+        counters = _counters[view_name]
+        for name, _, key in COUNTERS:
+            counters[key] += values.get(key, 0)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    """Returns the metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        views = sorted(_histograms)
+        for name, help_text, buckets, key in HISTOGRAMS:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s histogram' % name)
+            for view_name in views:
+                observed = _histograms[view_name][key]
+                label = 'view="%s"' % _label(view_name)
+                for bound, count in zip(buckets, observed):
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (
+                        name, label, bound, count))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (
+                    name, label, observed[-1]))
+                lines.append('%s_sum{%s} %r' % (name, label, float(observed[-2])))
+                lines.append('%s_count{%s} %d' % (name, label, observed[-1]))
+        for name, help_text, key in COUNTERS:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s counter' % name)
+            for view_name in views:
+                lines.append('%s{view="%s"} %d' % (
+                    name, _label(view_name), _counters[view_name][key]))
+    return '\n'.join(lines) + '\n'
+
+
+class TimedCursorWrapper(CursorWrapper):
+
+    def _timed(self, method, *args):
+        start = time.time()
+        try:
+            return method(*args)
+        finally:
+            add('db_queries')
+            add('db_seconds', time.time() - start)
+
+    def execute(self, sql, params=None):
+        return self._timed(super(TimedCursorWrapper, self).execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(super(TimedCursorWrapper, self).executemany,
+                           sql, param_list)
+
+    def callproc(self, procname, params=None):
+        return self._timed(super(TimedCursorWrapper, self).callproc,
+                           procname, params)
+
+
+def time_queries(connection):
+    """Make `connection` (a DatabaseWrapper) time its queries."""
+    if not getattr(connection, 'queries_timed', False):
+        connection.make_cursor = lambda cursor: TimedCursorWrapper(
+            cursor, connection)
+        connection.queries_timed = True
+
+
+def _connection_created(sender, connection, **kwargs):
+    time_queries(connection)
+
+
+def view_name(request):
+    """Dotted path of the view handling `request`."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return UNRESOLVED_VIEW
+    return '%s.%s' % (match.func.__module__,
+                      getattr(match.func, '__name__', match.view_name))
+
+
+class MetricsMiddleware(object):
+
+    """Records the metrics of each request, best listed first."""
+
+    def __init__(self):
+        connection_created.connect(_connection_created,
+                                   dispatch_uid='cards.metrics')
+        for connection in connections.all():
+            time_queries(connection)
+
+    def process_request(self, request):
+        start_request()
+
+    def process_template_response(self, request, response):
+        # called last of the middleware (listed first), just before
+        # the response is rendered
+        start = time.time()
+
+        def rendered(response):
+            add('template_seconds', time.time() - start)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def process_response(self, request, response):
+        finish_request(view_name(request))
+        return response
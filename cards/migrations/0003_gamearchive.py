@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0002_auto_20150520_1637'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameArchive',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('game_id', models.IntegerField(unique=True)),
+                ('name', models.CharField(max_length=140)),
+                ('game_state', models.CharField(max_length=140)),
+                ('created', models.DateTimeField()),
+                ('modified', models.DateTimeField(db_index=True)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('rounds', models.IntegerField(default=0)),
+                ('player_count', models.IntegerField(default=0)),
+                ('submission_count', models.IntegerField(default=0)),
+                ('gamedata_z', models.BinaryField()),
+                ('submissions_z', models.BinaryField()),
+            ],
+        ),
+    ]
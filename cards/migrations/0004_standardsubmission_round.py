@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0003_gamearchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='standardsubmission',
+            name='player_name',
+            field=models.CharField(default=b'', max_length=140, blank=True),
+        ),
+        migrations.AddField(
+            model_name='standardsubmission',
+            name='round',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='standardsubmission',
+            index_together=set([('game', 'round')]),
+        ),
+    ]
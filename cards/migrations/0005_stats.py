@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cards', '0004_standardsubmission_round'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameStanding',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('game_id', models.IntegerField()),
+                ('player_name', models.CharField(max_length=140)),
+                ('wins', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('period', models.CharField(max_length=4, choices=[(b'day', b'Day'), (b'week', b'Week')])),
+                ('period_start', models.DateField()),
+                ('player_name', models.CharField(max_length=140)),
+                ('wins', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('player_name', models.CharField(unique=True, max_length=140)),
+                ('wins', models.IntegerField(default=0, db_index=True)),
+                ('last_win', models.DateTimeField(null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaderboardentry',
+            unique_together=set([('period', 'period_start', 'player_name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='leaderboardentry',
+            index_together=set([('period', 'period_start', 'wins')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='gamestanding',
+            unique_together=set([('game_id', 'player_name')]),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0005_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsWatermark',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(unique=True, max_length=100)),
+                ('last_id', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BlackCardStats',
+            fields=[
+                ('black_card', models.OneToOneField(related_name='stats', primary_key=True, serialize=False, to='cards.BlackCard')),
+                ('played', models.IntegerField(default=0, db_index=True)),
+                ('wins', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CardPairStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('played', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0, db_index=True)),
+                ('black_card', models.ForeignKey(to='cards.BlackCard')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WhiteCardStats',
+            fields=[
+                ('white_card', models.OneToOneField(related_name='stats', primary_key=True, serialize=False, to='cards.WhiteCard')),
+                ('played', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cardpairstats',
+            name='white_card',
+            field=models.ForeignKey(to='cards.WhiteCard'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cardpairstats',
+            unique_together=set([('black_card', 'white_card')]),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+
+import six
+from django.db import models, migrations
+
+
+def card_text_hash(text, *extra):
+    """cards.models.card_text_hash() as of this migration, a copy so
+    later changes to it do not change what this migration writes."""
+    normalized = u' '.join(six.text_type(text).lower().split())
+    for value in extra:
+        normalized += u'\x00%s' % (value,)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def fill_text_hash(apps, schema_editor):
+    """Hash the first (lowest id) card of each text, later duplicates keep
+    NULL as running games may still refer to them."""
+    for model_name, hash_fields in (
+            ('BlackCard', ('pick', 'draw')),
+            ('WhiteCard', ())):
+        model = apps.get_model('cards', model_name)
+        seen = set()
+        for row in model.objects.order_by('id').values_list(
+                'id', 'text', *hash_fields).iterator():
+            text_hash = card_text_hash(*row[1:])
+            if text_hash not in seen:
+                seen.add(text_hash)
+                model.objects.filter(id=row[0]).update(text_hash=text_hash)
+
+
+def clear_text_hash(apps, schema_editor):
+    pass  # the column is dropped
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0006_card_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blackcard',
+            name='text_hash',
+            field=models.CharField(max_length=40, unique=True, null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='whitecard',
+            name='text_hash',
+            field=models.CharField(max_length=40, unique=True, null=True, editable=False),
+        ),
+        migrations.RunPython(fill_text_hash, clear_text_hash),
+    ]
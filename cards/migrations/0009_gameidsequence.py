@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0008_catalogversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameIdSequence',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('last_id', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import cards.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0009_gameidsequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='gamedata',
+            field=cards.models.GameDataField(),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0010_game_gamedata_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('seq', models.PositiveIntegerField()),
+                ('action', models.CharField(max_length=20)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('data', jsonfield.fields.JSONField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='event_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='snapshot_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gameevent',
+            name='game',
+            field=models.ForeignKey(to='cards.Game'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='gameevent',
+            unique_together=set([('game', 'seq')]),
+        ),
+    ]
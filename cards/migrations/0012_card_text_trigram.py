@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import DatabaseError, migrations, transaction
+
+TABLES = ('black_cards', 'white_cards')
+
+
+def add_trigram_indexes(apps, schema_editor):
+    """pg_trgm and a trigram index on the card texts, for cards.search.
+    Without them (not PostgreSQL, or the user may not create the
+    extension) cards.search uses its in memory index."""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(
+                'CREATE INDEX %s_text_trgm ON %s USING gin (text gin_trgm_ops)'
+                % (table, table))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute('DROP INDEX IF EXISTS %s_text_trgm' % table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0011_game_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0012_card_text_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundWin',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('game_id', models.IntegerField()),
+                ('round', models.IntegerField()),
+                ('player_name', models.CharField(max_length=140)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='roundwin',
+            unique_together=set([('game_id', 'round')]),
+        ),
+    ]
@@ -4,6 +4,7 @@
 from __future__ import print_function
 
 import datetime
+import itertools
 import random
 import hashlib
 try: 
@@ -11,13 +12,20 @@ try:
 except ImportError:
     from urllib.parse import urlencode
 
+import six
 from six.moves import xrange
 from django.db import models
 from django.db.models import F
-from django.db.models.signals import pre_save
-from django.db import connection, transaction
+from django.db.models.signals import (
+    pre_save,
+    post_save,
+    post_delete,
+    m2m_changed,
+)
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.utils.html import strip_tags
 
 
@@ -27,7 +35,7 @@ from model_utils.models import TimeStampedModel
 # this is so wrong....
 from django.utils.safestring import mark_safe
 
-from . import log
+from . import log, metrics
 
 TWITTER_SUBMISSION_LENGTH = 93
 
@@ -35,6 +43,7 @@ ONE_HOUR = datetime.timedelta(seconds=60 * 60 * 1)
 ONE_MINUTE = datetime.timedelta(seconds=60)
 
 DEFAULT_HAND_SIZE = 10
+DEFAULT_CARD_SETS = ['v1.0', 'v1.2', 'v1.3', 'v1.4']
 
 def default_game_timeout():
     if settings.DEBUG:
@@ -72,6 +81,25 @@ class GameError(BaseGameException):
     pass
 
 
+class GameDataField(JSONField):
+
+    """JSONField counting the JSON it decodes and encodes in the request
+    metrics (see cards.metrics)."""
+
+    def pre_init(self, value, obj):
+        result = super(GameDataField, self).pre_init(value, obj)
+        if result is not value and isinstance(value, six.string_types):
+            metrics.add('gamedata_decoded_bytes', len(value))
+        return result
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        result = super(GameDataField, self).get_db_prep_value(
+            value, connection, prepared)
+        if result is not None:
+            metrics.add('gamedata_encoded_bytes', len(result))
+        return result
+
+
 class Game(TimeStampedModel):
 
     name = models.CharField(
@@ -84,8 +112,12 @@ class Game(TimeStampedModel):
     """
 
     is_active = models.BooleanField(default=True)
+    # with the event log (cards.eventlog) gamedata is a snapshot, of the
+    # state after GameEvent number snapshot_seq, event_seq is the last event
+    snapshot_seq = models.PositiveIntegerField(default=0)
+    event_seq = models.PositiveIntegerField(default=0)
 
-    gamedata = JSONField()
+    gamedata = GameDataField()
                          # NOTE character export/import (and this includes
                          # Admin editing) screws up json payload....
     """gamedata  is a dict
@@ -111,6 +143,7 @@ class Game(TimeStampedModel):
         used_black_deck = [ of card black numbers ],
         used_white_deck = [ of card white numbers ],
         filled_in_texts = None | [ (player name, filled in black card text), ],
+        submission_ids = {dict of player name: StandardSubmission id for this round},
         password = None|string,  # TODO NOTE probably want a bool/str in model too/instead, for reporting (e.g. listing active games and whether they have a password)
     }
 
@@ -127,6 +160,27 @@ class Game(TimeStampedModel):
         modified_str = self.modified.strftime('%Y-%m-%d %H:%M')
         return mark_safe('%s %s - %s' % (is_active, modified_str, self.name))
 
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        """Saving never writes event_seq, only cards.eventlog moves it, and
+        only updates the row if no events were logged since the game was
+        loaded. Otherwise the game catches up with them and tries again."""
+        from cards import eventlog
+        filtered = base_qs.filter(pk=pk_val)
+        while True:
+            values = [value for value in values
+                      if value[0].attname != 'event_seq']
+            if not values:
+                return filtered.exists()
+            if filtered.filter(event_seq=self.event_seq)._update(values) > 0:
+                return True
+            event_seq = filtered.values_list('event_seq', flat=True).first()
+            if event_seq is None:
+                return False
+            eventlog.advance(self, event_seq)
+            values = [(field, model, getattr(self, field.attname))
+                      for field, model, _ in values]
+
     def deactivate_old_game(self, older_than=None):
         """Check if game should be deactived due to time out, using.
 
@@ -176,37 +230,82 @@ class Game(TimeStampedModel):
                 # fill in black card blanks.... and cache in gamedata
                 black_card_id = self.gamedata['current_black_card']
                 temp_black_card = BlackCard.objects.get(id=black_card_id)
+                # a player leaving during selection gets us here again,
+                # re-use the submissions already recorded for this round
+                old_submission_ids = self.gamedata.get('submission_ids') or {}
+                submission_ids = {}
                 filled_in_texts = []
                 for player_name in self.gamedata['submissions']:
                     white_card_list = self.gamedata['submissions'][player_name]
                     tmp_text = temp_black_card.replace_blanks(white_card_list)
-                    submission = StandardSubmission.objects.create(
-                        blackcard=BlackCard.objects.get(id=black_card_id),
-                        game=self,
-                        complete_submission=tmp_text,
-                    )
-                    for card in white_card_list:
-                        submission.submissions.add(WhiteCard.objects.get(id=card))
+                    submission_id = old_submission_ids.get(player_name)
+                    if submission_id is None:
+                        # save() rather than objects.create(), so it is
+                        # routed to the game's shard
+                        submission = StandardSubmission(
+                            blackcard=temp_black_card,
+                            game=self,
+                            round=self.gamedata['round'],
+                            player_name=player_name,
+                            complete_submission=tmp_text,
+                        )
+                        submission.save()
+                        submission.submissions.add(*white_card_list)
+                        submission_id = submission.id
+                    submission_ids[player_name] = submission_id
                     filled_in_texts.append((player_name, tmp_text))
                 random.shuffle(filled_in_texts)
                 self.gamedata[
                     'filled_in_texts'] = filled_in_texts  # FIXME rename this
+                self.gamedata['submission_ids'] = submission_ids
         else:
             if self.game_state == GAMESTATE_SELECTION:
                 self.game_state = GAMESTATE_SUBMISSION
                 self.gamedata['filled_in_texts'] = []
+                self.gamedata['submission_ids'] = {}
 
     def deal_white_card(self):
         if len(self.gamedata['white_deck']) == 0:
             # re-use discard white cards
             tmp_white_deck = self.gamedata['used_white_deck']
             self.gamedata['used_white_deck'] = []
+            self.note_reshuffle('white_deck')
             random.shuffle(tmp_white_deck)
             self.gamedata['white_deck'] = tmp_white_deck
 
         white_card = self.gamedata['white_deck'].pop()
         return white_card
 
+    def note_reshuffle(self, deck_name):
+        """Remember that the discards of `deck_name` were shuffled back, for
+        the event log."""
+        self.__dict__.setdefault('reshuffles', []).append(deck_name)
+
+    def pick_winner(self, czar_name, winner):
+        """Card czar `czar_name` picked the submission of player `winner`,
+        record it and start the next round with `winner` as czar."""
+        submission_id = (self.gamedata.get('submission_ids') or {}).get(winner)
+        submissions = self.submissions_queryset()
+        if submission_id is not None:
+            submissions.filter(pk=submission_id).update(winner=True)
+        else:
+            # game was in selection before submission ids were recorded
+            winning_submission = submissions.filter(
+                game=self,
+                blackcard=self.gamedata['current_black_card'],
+                submissions__in=self.gamedata['submissions'][winner]
+            )[:1]
+            submissions.filter(
+                pk__in=list(winning_submission.values_list('pk', flat=True))
+            ).update(winner=True)
+        self.start_new_round(czar_name, winner, winner)
+
+    def submissions_queryset(self):
+        """StandardSubmission queryset on the database (shard) this game
+        is on."""
+        return StandardSubmission.objects.using(
+            self._state.db or DEFAULT_DB_ALIAS)
+
     def start_new_round(self, czar_name=None, winner=None, winner_id=None):
         """NOTE this does not reset a game, it resets the cards on the table
         ready for the next round."""
@@ -220,10 +319,14 @@ class Game(TimeStampedModel):
         self.gamedata['round'] += 1
         self.gamedata['last_round_winner'] = winner
         self.gamedata['filled_in_texts'] = None
+        self.gamedata['submission_ids'] = {}
         self.game_state = GAMESTATE_SUBMISSION
 
         if winner:
             self.gamedata['players'][winner]['wins'] += 1
+            from cards import stats  # avoid circular import
+            stats.record_win(self.id, winner,
+                             game_round=self.gamedata['round'] - 1)
 
         # check the pick number of previous black card, deal that many cards
         prev_black_card_id = self.gamedata['current_black_card']
@@ -244,6 +347,7 @@ class Game(TimeStampedModel):
             # re-use discard black cards
             tmp_black_deck = self.gamedata['used_black_deck']
             self.gamedata['used_black_deck'] = []
+            self.note_reshuffle('black_deck')
             random.shuffle(tmp_black_deck)
             self.gamedata['black_deck'] = tmp_black_deck
         self.gamedata['current_black_card'] = self.gamedata[
@@ -269,7 +373,8 @@ class Game(TimeStampedModel):
                 self.gamedata['used_white_deck'].append(x)
 
     def create_game(self, card_sets=None, initial_hand_size=DEFAULT_HAND_SIZE, password=None):
-        """Where `card_sets` is an iterable collection of CardSet."""
+        """Where `card_sets` is an iterable collection of CardSet (or CardSet
+        names), defaults to DEFAULT_CARD_SETS."""
 
         log.logger.debug('New Game called')
         """Create shuffled decks
@@ -280,25 +385,14 @@ class Game(TimeStampedModel):
         Also take a look at http://code.google.com/p/gcge/
         """
 
-        card_sets = card_sets or CardSet.objects.get(
-            name='Second Version')  # default card deck
-        # TODO add cardset(s) used to Games model?
-
-        shuffled_white = []
-        shuffled_black = []
+        from cards import catalog  # avoid circular import
 
-        for card_set_name in card_sets:
-            card_pack = CardSet.objects.get(name=card_set_name)
-            shuffled_white += [x[0]
-                               for x in card_pack.white_card.values_list('id')]
-            shuffled_black += [x[0]
-                               for x in card_pack.black_card.values_list('id')]
-
-        # Now remove dupes.. if this was via a direct SQL would simple SELECT DISTINCT..... WHERE .. cardset_name in ()....
-        # TODO check if ORM query look for multiple entries and remove dupes
-        # from ManyToMany
-        shuffled_white = list(set(shuffled_white))
-        shuffled_black = list(set(shuffled_black))
+        card_sets = card_sets or DEFAULT_CARD_SETS
+        # TODO add cardset(s) used to Games model?
+        card_set_names = [
+            getattr(card_set, 'name', card_set) for card_set in card_sets
+        ]
+        shuffled_white, shuffled_black = catalog.card_pool(card_set_names)
 
         random.shuffle(shuffled_white)
         random.shuffle(shuffled_black)
@@ -320,6 +414,7 @@ class Game(TimeStampedModel):
             'used_black_deck': [],
             'mode': 'submitting',
             'filled_in_texts': None,
+            'submission_ids': {},
             'prev_filled_in_question': None,
             'password': password,
         }
@@ -377,6 +472,14 @@ class Game(TimeStampedModel):
             # last_round_winner cleanup -- FIXME I'm not sure this is used/needed, remove from model/template? appears to only be used in old player template which should also be removed
             # unset session name?? probably not a good idea
 
+    def standings(self):
+        """Returns list of (player name, player dict) sorted by wins (most
+        first) then player name."""
+        return sorted(
+            self.gamedata['players'].items(),
+            key=lambda item: (-item[1]['wins'], item[0])
+        )
+
     def can_be_played(self):
         if (
             self.is_active and
@@ -390,6 +493,12 @@ class Game(TimeStampedModel):
 
 def game_pre_save(sender, **kwargs):
     game = kwargs['instance']
+    if kwargs.get('raw'):
+        # fixture loading or restoring from the archive, name is already final
+        return
+    if game.__dict__.get('caught_up'):
+        # gamedata includes all the events, see cards.eventlog.catch_up()
+        game.snapshot_seq = game.event_seq
     if not game.is_active:
         # and previously was active; kwargs['update_fields'] ....
         game.name = 'DONE %s - %s' % (game.modified, game.name)
@@ -397,6 +506,15 @@ def game_pre_save(sender, **kwargs):
 pre_save.connect(game_pre_save, sender=Game)
 
 
+def game_post_save(sender, **kwargs):
+    from cards import eventlog, gamestate
+    if kwargs.get('created') and not kwargs.get('raw'):
+        eventlog.game_created(kwargs['instance'])
+    gamestate.game_saved(kwargs['instance'], kwargs.get('created'))
+
+post_save.connect(game_post_save, sender=Game)
+
+
 class Player(TimeStampedModel):
 
     # These are the fields I can think of for now, but we're not using it yet,
@@ -419,11 +537,54 @@ class Player(TimeStampedModel):
 BLANK_MARKER = u"\uFFFD"
 
 
-class BlackCard(models.Model):
+def card_text_hash(text, *extra):
+    """Hash of card text ignoring case and whitespace differences, plus any
+    `extra` values that make two cards different (e.g. pick/draw)."""
+    normalized = u' '.join(six.text_type(text).lower().split())
+    for value in extra:
+        normalized += u'\x00%s' % (value,)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class CardTextHashMixin(object):
+
+    """Maintains text_hash for BlackCard and WhiteCard.
+
+    text_hash is unique so each card text exists once and card sets share
+    cards. Cards that were duplicates before text_hash existed have NULL
+    and are left alone.
+    """
+
+    hash_fields = ()
+
+    def compute_text_hash(self):
+        return card_text_hash(
+            self.text, *[getattr(self, name) for name in self.hash_fields])
+
+    def validate_unique(self, exclude=None):
+        super(CardTextHashMixin, self).validate_unique(exclude=exclude)
+        duplicates = type(self)._default_manager.filter(
+            text_hash=self.compute_text_hash())
+        if self.pk is not None:
+            duplicates = duplicates.exclude(pk=self.pk)
+        if duplicates.exists():
+            raise ValidationError({'text': ['This card already exists.']})
+
+    def save(self, *args, **kwargs):
+        if self.pk is None or self.text_hash is not None:
+            self.text_hash = self.compute_text_hash()
+        super(CardTextHashMixin, self).save(*args, **kwargs)
+
+
+class BlackCard(CardTextHashMixin, models.Model):
     text = models.CharField(max_length=255)
     draw = models.SmallIntegerField(default=0)
     pick = models.SmallIntegerField(default=1)
     watermark = models.CharField(max_length=100, null=True)
+    text_hash = models.CharField(
+        max_length=40, unique=True, null=True, editable=False)
+
+    hash_fields = ('pick', 'draw')
 
     class Meta:
         db_table = 'black_cards'
@@ -440,8 +601,8 @@ class BlackCard(models.Model):
 
         # assume num_blanks count is valid and len(white_card_num_list) ==
         # num_blanks
-        white_card_text_dict = dict(WhiteCard.objects.filter(
-            id__in=white_card_num_list).values_list('id', 'text'))
+        from cards import catalog
+        white_card_text_dict = catalog.white_card_texts(white_card_num_list)
         log.logger.debug(
             'black card, white_card_text_dict %r', white_card_text_dict)
         for white_id in white_card_num_list:
@@ -469,9 +630,11 @@ class BlackCard(models.Model):
             return str(self)
 
 
-class WhiteCard(models.Model):
+class WhiteCard(CardTextHashMixin, models.Model):
     text = models.CharField(max_length=255)
     watermark = models.CharField(max_length=100, null=True)
+    text_hash = models.CharField(
+        max_length=40, unique=True, null=True, editable=False)
 
     class Meta:
         db_table = 'white_cards'
@@ -504,6 +667,36 @@ class CardSet(models.Model):
         return mark_safe(self.name)
 
 
+class CatalogVersion(models.Model):
+
+    """Single row, version is bumped whenever cards or card sets change so
+    caches built from the catalog know they are stale, see cards.catalog.
+    """
+    version = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class GameIdSequence(models.Model):
+
+    """Single row (on the default database), hands out Game ids when games
+    are sharded over several databases, see cards.sharding.
+    """
+    last_id = models.IntegerField(default=0)
+
+
+def catalog_changed(sender, **kwargs):
+    if kwargs.get('raw') or kwargs.get('action', 'post_').startswith('pre_'):
+        return
+    from cards import catalog  # avoid circular import
+    catalog.catalog_changed()
+
+for tmp_model in (BlackCard, WhiteCard, CardSet):
+    post_save.connect(catalog_changed, sender=tmp_model)
+    post_delete.connect(catalog_changed, sender=tmp_model)
+m2m_changed.connect(catalog_changed, sender=CardSet.black_card.through)
+m2m_changed.connect(catalog_changed, sender=CardSet.white_card.through)
+
+
 class SubmittedCard(models.Model):
 
     TYPE_CHOICES = (
@@ -529,11 +722,16 @@ class SubmittedCard(models.Model):
 class StandardSubmission(TimeStampedModel):
 
     game = models.ForeignKey(Game, null=True)
+    round = models.IntegerField(default=0)  # gamedata['round'] when submitted
+    player_name = models.CharField(max_length=140, blank=True, default='')
     blackcard = models.ForeignKey(BlackCard, null=True)
     submissions = models.ManyToManyField(WhiteCard, null=True)
     winner = models.BooleanField(default=False)
     complete_submission = models.TextField(blank=True, null=True)
 
+    class Meta:
+        index_together = [('game', 'round')]
+
     def __str__(self):
         return self.blackcard.short_str
 
@@ -551,19 +749,261 @@ class StandardSubmission(TimeStampedModel):
         return text
 
 
+class GameEvent(models.Model):
+
+    """One game action, see cards.eventlog. `data` holds the action's
+    arguments and the patch it made to the game's gamedata."""
+    game = models.ForeignKey(Game)
+    seq = models.PositiveIntegerField()
+    action = models.CharField(max_length=20)
+    created = models.DateTimeField(auto_now_add=True)
+    data = JSONField()
+
+    class Meta:
+        unique_together = ('game', 'seq')
+
+    def __str__(self):
+        return '%s #%d %s' % (self.game_id, self.seq, self.action)
+
+
+class GameArchive(models.Model):
+
+    """Cold storage for a finished game, see cards.archive.
+
+    The game's gamedata and its StandardSubmission rows are kept as zlib
+    compressed json, the remaining columns are a summary that can be
+    listed without decompressing anything.
+    """
+    game_id = models.IntegerField(unique=True)
+    name = models.CharField(max_length=140)
+    game_state = models.CharField(max_length=140)
+    created = models.DateTimeField()
+    modified = models.DateTimeField(db_index=True)
+    archived = models.DateTimeField(auto_now_add=True)
+    rounds = models.IntegerField(default=0)
+    player_count = models.IntegerField(default=0)
+    submission_count = models.IntegerField(default=0)
+    gamedata_z = models.BinaryField()
+    submissions_z = models.BinaryField()
+
+    def __str__(self):
+        return self.name
+
+
+class PlayerStats(models.Model):
+
+    """Wins per player across all games, maintained by cards.stats."""
+    player_name = models.CharField(max_length=140, unique=True)
+    user = models.ForeignKey(
+        User,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL
+    )
+    wins = models.IntegerField(default=0, db_index=True)
+    last_win = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return self.player_name
+
+
+class GameStanding(models.Model):
+
+    """Wins per player per game, maintained by cards.stats.
+
+    game_id is deliberately not a foreign key so standings survive the
+    game being archived.
+    """
+    game_id = models.IntegerField()
+    player_name = models.CharField(max_length=140)
+    wins = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('game_id', 'player_name')]
+
+    def __str__(self):
+        return '%s (%d)' % (self.player_name, self.game_id)
+
+
+class RoundWin(models.Model):
+
+    """The winner of each round of each game, cards.stats counts a win
+    only when it adds the round's row. The pick may be applied again
+    (retried after an event log conflict, or after the game's shard
+    rolled back the round while 'default' kept the stats).
+    """
+    game_id = models.IntegerField()
+    round = models.IntegerField()
+    player_name = models.CharField(max_length=140)
+
+    class Meta:
+        unique_together = [('game_id', 'round')]
+
+    def __str__(self):
+        return '%s (%d, round %d)' % (self.player_name, self.game_id,
+                                      self.round)
+
+
+class LeaderboardEntry(models.Model):
+
+    """Wins per player for a day or week, maintained by cards.stats."""
+    PERIOD_DAY = 'day'
+    PERIOD_WEEK = 'week'
+    PERIOD_CHOICES = (
+        (PERIOD_DAY, 'Day'),
+        (PERIOD_WEEK, 'Week'),
+    )
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    player_name = models.CharField(max_length=140)
+    wins = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('period', 'period_start', 'player_name')]
+        index_together = [('period', 'period_start', 'wins')]
+
+    def __str__(self):
+        return '%s %s %s' % (self.period, self.period_start, self.player_name)
+
+
+class WhiteCardStats(models.Model):
+
+    """How often a white card was submitted and won, see cards.analytics."""
+    white_card = models.OneToOneField(
+        WhiteCard, primary_key=True, related_name='stats')
+    played = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+
+
+class BlackCardStats(models.Model):
+
+    """How many submissions a black card received and how many of those
+    were picked as winner (i.e. completed rounds), see cards.analytics."""
+    black_card = models.OneToOneField(
+        BlackCard, primary_key=True, related_name='stats')
+    played = models.IntegerField(default=0, db_index=True)
+    wins = models.IntegerField(default=0)
+
+
+class CardPairStats(models.Model):
+
+    """Black and white card combinations, see cards.analytics."""
+    black_card = models.ForeignKey(BlackCard)
+    white_card = models.ForeignKey(WhiteCard)
+    played = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0, db_index=True)
+
+    class Meta:
+        unique_together = [('black_card', 'white_card')]
+
+
+class AnalyticsWatermark(models.Model):
+
+    """Highest row id a batch job has already processed."""
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s: %d' % (self.name, self.last_id)
+
+
+IMPORT_CHUNK_SIZE = 500
+
+
+def _chunks(iterable, size):
+    """Yield lists of up to `size` items from any iterable (including
+    generators, nothing is read ahead)."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _import_cards(cardset, model, entries, chunk_size=IMPORT_CHUNK_SIZE,
+                  verbosity=1):
+    """Link cards from `entries` (iterable of dicts of model fields) to
+    `cardset`, re-using existing cards with the same text_hash and bulk
+    inserting the rest, a few queries per chunk.
+
+    Returns number of (distinct) cards in the set.
+    """
+    if model is BlackCard:
+        through = CardSet.black_card.through
+        card_field = 'blackcard_id'
+    else:
+        through = CardSet.white_card.through
+        card_field = 'whitecard_id'
+
+    linked = set()
+    count = 0
+    for chunk in _chunks(entries, chunk_size):
+        # TODO support tuples/lists as well as dict
+        cards = {}
+        for entry in chunk:
+            card = model(**entry)
+            card.text_hash = card.compute_text_hash()
+            cards.setdefault(card.text_hash, card)
+        existing = dict(model.objects.filter(
+            text_hash__in=list(cards)).values_list('text_hash', 'id'))
+        model.objects.bulk_create([
+            card for text_hash, card in cards.items()
+            if text_hash not in existing
+        ])
+        if len(existing) < len(cards):
+            # bulk_create() does not return ids, look them up
+            existing = dict(model.objects.filter(
+                text_hash__in=list(cards)).values_list('text_hash', 'id'))
+        new_links = set(existing.values()) - linked
+        through.objects.bulk_create([
+            through(cardset_id=cardset.id, **{card_field: card_id})
+            for card_id in new_links
+        ])
+        linked.update(new_links)
+        count += len(new_links)
+        if verbosity > 1:
+            print('{} {} cards'.format(count, model.__name__))
+    return count
+
+
+def _delete_cardset(cardset, chunk_size=IMPORT_CHUNK_SIZE):
+    """Delete `cardset` and the cards only it uses."""
+    for model, through, card_field in (
+            (BlackCard, CardSet.black_card.through, 'blackcard_id'),
+            (WhiteCard, CardSet.white_card.through, 'whitecard_id')):
+        links = through.objects.filter(cardset_id=cardset.id)
+        card_ids = list(links.values_list(card_field, flat=True))
+        links.delete()
+        for chunk in _chunks(card_ids, chunk_size):
+            # orphans, i.e. not in any other card set
+            model.objects.filter(id__in=chunk, cardset__isnull=True).delete()
+    cardset.delete()
+
+
 @transaction.atomic
-def dict2db(d, verbosity=1, replace_existing=False):
+def dict2db(d, verbosity=1, replace_existing=False,
+            chunk_size=IMPORT_CHUNK_SIZE):
     """Import complete card sets.
-    Does not allow using existing cards, cardset needs to include the card
-    definitions for all cards it uses.
+    Cardset needs to include the card definitions for all cards it uses,
+    cards that already exist (same text_hash) are shared with the other
+    cardsets using them instead of being duplicated.
     
     replace_existing parameter will DELETE the cardset AND the black and
-    white cards it uses, if those cards are used in other cardsets they
-    will be broken!"""
+    white cards that are not used by any other cardset.
+
+    Cards are inserted with bulk_create, `chunk_size` cards at a time."""
 
+    from cards import catalog  # avoid circular import
+
+    with catalog.batch_changes():
+        return _dict2db(d, verbosity, replace_existing, chunk_size)
+
+
+def _dict2db(d, verbosity, replace_existing, chunk_size):
     result = []
     for cardset_name in d:
-        b_count = w_count = 0
         if verbosity >= 1:
             print('cardset_name: {}'.format(cardset_name))
         cs = d[cardset_name]
@@ -574,9 +1014,7 @@ def dict2db(d, verbosity=1, replace_existing=False):
                 cardset = CardSet.objects.get(name=cardset_name)
                 if verbosity >= 1:
                     print('deleting cards and cardset: {}'.format(cardset_name))
-                cardset.black_card.all().delete()
-                cardset.white_card.all().delete()
-                cardset.delete()
+                _delete_cardset(cardset, chunk_size)
             except CardSet.DoesNotExist:
                 pass
         cardset = CardSet(name=cardset_name, description=description)
@@ -586,31 +1024,13 @@ def dict2db(d, verbosity=1, replace_existing=False):
         cardset.save()
         if verbosity > 1:
             print(cardset)
-        blackcards = cs.get('blackcards')
-        if blackcards:
-            for entry in blackcards:
-                if verbosity > 1:
-                    print(entry)
-                # TODO support tuples/lists as well as dict
-                black_card = BlackCard(**entry)
-                if verbosity > 1:
-                    print(repr(black_card))
-                black_card.save()
-                cardset.black_card.add(black_card)
-                b_count += 1
+        b_count = _import_cards(
+            cardset, BlackCard, cs.get('blackcards') or [], chunk_size,
+            verbosity)
         if verbosity > 1:
             print('-' * 65)
-
-        whitecards = cs.get('whitecards')
-        if whitecards:
-            for entry in whitecards:
-                if verbosity > 1:
-                    print(entry)
-                white_card = WhiteCard(**entry)
-                if verbosity > 1:
-                    print(repr(white_card))
-                white_card.save()
-                cardset.white_card.add(white_card)
-                w_count += 1
+        w_count = _import_cards(
+            cardset, WhiteCard, cs.get('whitecards') or [], chunk_size,
+            verbosity)
         result.append((cardset_name, b_count, w_count))
     return result
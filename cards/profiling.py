@@ -0,0 +1,155 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Run requests under cProfile and keep the last few profiles.
+
+ProfilingMiddleware profiles a request when
+
+    a staff member asks for it, with ?profile=1 or an X-Profile: 1 header
+    it is sampled, settings.PROFILE_SAMPLE_RATE (0 to 1) of all requests
+
+The profile (view, template rendering and the middleware after this
+one) is kept in the shared cache in a ring buffer of
+settings.PROFILE_BUFFER_SIZE entries shared by all workers, tagged with
+the view, game id, player count, gamedata size, time and query count.
+The staff only /profiles pages list them, show the top functions and
+download them as .prof files (for pstats, snakeviz and so on).
+"""
+
+import cProfile
+import json
+import marshal
+import random
+import time
+
+from django.conf import settings
+
+from cards import metrics
+from cards.sharedcache import cache
+
+DEFAULT_BUFFER_SIZE = 50
+PROFILE_TIMEOUT = 7 * 24 * 60 * 60
+SEQ_KEY = 'profile_seq'
+
+
+def buffer_size():
+    return getattr(settings, 'PROFILE_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)
+
+
+def sample_rate():
+    return getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+
+
+def _meta_key(slot):
+    return 'profile:meta:%d' % slot
+
+
+def _data_key(slot):
+    return 'profile:data:%d' % slot
+
+
+def note_game(request, game):
+    """Tag the profile of `request`, if it is profiled, with `game`."""
+    tags = getattr(request, 'profile_tags', None)
+    if tags is not None:
+        tags['game_id'] = game.id
+        tags['players'] = len(game.gamedata.get('players') or {})
+        tags['gamedata_bytes'] = len(json.dumps(game.gamedata))
+
+
+def should_profile(request):
+    if request.GET.get('profile') == '1' or request.META.get(
+            'HTTP_X_PROFILE') == '1':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+    rate = sample_rate()
+    return bool(rate) and random.random() < rate
+
+
+def save(meta, profiler):
+    """Store a finished `profiler` with `meta` (a dict), returns its number."""
+    profiler.create_stats()
+    seq = cache.incr(SEQ_KEY)
+    slot = seq % buffer_size()
+    meta = dict(meta, seq=seq)
+    cache.set_many({
+        _meta_key(slot): meta,
+        _data_key(slot): marshal.dumps(profiler.stats),
+    }, PROFILE_TIMEOUT)
+    return seq
+
+
+def profiles():
+    """Returns the meta of the stored profiles, newest first."""
+    found = cache.get_many([_meta_key(slot) for slot in range(buffer_size())])
+    return sorted(found.values(), key=lambda meta: -meta['seq'])
+
+
+def get(seq):
+    """Returns (meta, .prof file contents) of profile `seq`, None if it
+    is not (or no longer) stored."""
+    slot = seq % buffer_size()
+    found = cache.get_many([_meta_key(slot), _data_key(slot)])
+    meta = found.get(_meta_key(slot))
+    data = found.get(_data_key(slot))
+    if meta is None or data is None or meta['seq'] != seq:
+        return None
+    return meta, data
+
+
+def top_functions(data, limit=40):
+    """Returns the `limit` functions of .prof `data` with the highest
+    cumulative time, as dicts."""
+    result = []
+    for (filename, line, name), (primitive_calls, calls, total_time,
+                                 cumulative_time, _) in marshal.loads(
+                                     data).items():
+        result.append({
+            'function': '%s:%d(%s)' % (filename, line, name),
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'total_time': total_time,
+            'cumulative_time': cumulative_time,
+        })
+    result.sort(key=lambda row: -row['cumulative_time'])
+    return result[:limit]
+
+
+class ProfilingMiddleware(object):
+
+    """Profiles requests (see should_profile()), list after
+    AuthenticationMiddleware and last, so the profile covers the view."""
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not should_profile(request):
+            return None
+        request.profile_tags = {'game_id': None, 'players': None,
+                                'gamedata_bytes': None}
+        if 'pk' in view_kwargs:
+            # the game views, note_game() adds the rest
+            request.profile_tags['game_id'] = int(view_kwargs['pk'])
+        request.profile_queries = metrics.current('db_queries')
+        request.profile_start = time.time()
+        request.profiler = cProfile.Profile()
+        request.profiler.enable()
+        return None
+
+    def process_response(self, request, response):
+        profiler = getattr(request, 'profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        request.profiler = None
+        seconds = time.time() - request.profile_start
+        save(dict(
+            request.profile_tags,
+            created=time.time(),
+            method=request.method,
+            path=request.get_full_path(),
+            view=metrics.view_name(request),
+            status=response.status_code,
+            seconds=seconds,
+            queries=metrics.current('db_queries') - request.profile_queries,
+        ), profiler)
+        return response
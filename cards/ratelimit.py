@@ -0,0 +1,243 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Token bucket rate limits per client and endpoint.
+
+settings.RATE_LIMITS gives each scope (an endpoint or group of them) a
+budget of (tokens per second, burst). A client has a bucket per scope
+holding up to burst tokens that refills at the rate, every request takes
+a token and a client with an empty bucket gets a 429 with a Retry-After
+header.
+
+A client is the pair of its IP address and session if it has a session
+(is logged in or its session cookie loads as a session with data), the
+clients of an address also share a bucket with RATE_LIMIT_ADDRESS_FACTOR
+times the budget. Clients without a session, including those sending a
+made up session cookie with each request, share their address's bucket
+with the scope's budget.
+
+With a Redis shared cache (SHARED_CACHE_URL) the buckets are kept there
+and updated atomically by a script, so the budget holds over all the
+workers. Otherwise, or while Redis is unreachable, each process keeps
+its own buckets.
+
+Every process also counts the requests of its clients per
+TALKERS_WINDOW seconds, top_talkers() (the staff only /ratelimit page)
+lists the busiest of the current and the last window.
+"""
+
+import collections
+import functools
+import hashlib
+import math
+import threading
+import time
+
+import redis
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from cards.sharedcache import RedisBackend, cache
+import cards.log as log
+
+DEFAULT_RATE_LIMITS = {
+    # GameDetail, polled by main.js every 30 seconds
+    'game-api': (0.5, 10),
+    # game actions, submitting cards, picking a winner, joining, exiting
+    'game-action': (1, 10),
+}
+# the clients (sessions) of one IP address, e.g. behind a NAT, together
+# get this many times a client's budget
+DEFAULT_ADDRESS_FACTOR = 10
+MAX_LOCAL_BUCKETS = 10000
+TALKERS_WINDOW = 60  # seconds
+MAX_TALKERS = 10000
+
+# KEYS[1] bucket, ARGV rate, burst, now; returns the seconds to wait
+# (as a string, Lua numbers are returned as integers)
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(bucket[1]) or burst
+local stamp = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+_lock = threading.Lock()
+_buckets = {}  # bucket key: [tokens, stamp]
+_scripts = {}  # redis url: registered TAKE_TOKEN_SCRIPT
+# (client, scope): [requests, limited] this and the last window
+_talkers = collections.defaultdict(lambda: [0, 0])
+_last_talkers = {}
+_window_start = [time.time()]
+
+
+def rate_limits():
+    return getattr(settings, 'RATE_LIMITS', DEFAULT_RATE_LIMITS)
+
+
+def client_ip(request):
+    if getattr(settings, 'RATE_LIMIT_TRUST_X_FORWARDED_FOR', False):
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded_for:
+            # the address the proxy in front of us saw
+            return forwarded_for.rsplit(',', 1)[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def address_factor():
+    return getattr(settings, 'RATE_LIMIT_ADDRESS_FACTOR',
+                   DEFAULT_ADDRESS_FACTOR)
+
+
+def has_session(request):
+    """Whether `request` comes with a real session, not just any session
+    cookie (which Django accepts without looking it up)."""
+    session = getattr(request, 'session', None)
+    session_key = session.session_key if session is not None else None
+    if not session_key:
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return True
+    # request.user loaded the session already, a made up cookie (a bad
+    # signature, a key not stored) loads as an empty one
+    return bool(session.keys())
+
+
+def client_id(request):
+    """The client making `request`, its IP address and a hash of its
+    session key if it has_session()."""
+    if not has_session(request):
+        return client_ip(request)
+    return '%s/%s' % (client_ip(request), hashlib.sha1(
+        request.session.session_key.encode('utf-8')).hexdigest()[:12])
+
+
+def _take_local(key, rate, burst, now):
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            if len(_buckets) >= MAX_LOCAL_BUCKETS:
+                # forget the buckets that have refilled
+                for old_key, (tokens, stamp) in list(_buckets.items()):
+                    if tokens + (now - stamp) * rate >= burst:
+                        del _buckets[old_key]
+            bucket = _buckets[key] = [burst, now]
+        tokens = min(burst, bucket[0] + max(0, now - bucket[1]) * rate)
+        wait = 0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / float(rate)
+        bucket[:] = [tokens, now]
+        return wait
+
+
+def _take_shared(backend, key, rate, burst, now):
+    script = _scripts.get(backend.url)
+    if script is None:
+        script = _scripts[backend.url] = backend.redis.register_script(
+            TAKE_TOKEN_SCRIPT)
+    return float(script(keys=[key], args=[rate, burst, repr(now)]))
+
+
+def take_token(scope, client, factor=1):
+    """Take a token from `client`'s bucket for `scope`, with `factor` times
+    its budget, returns 0 or the seconds until there is one."""
+    rate, burst = rate_limits()[scope]
+    rate, burst = rate * factor, burst * factor
+    key = 'ratelimit:%s:%s' % (scope, client)
+    if factor != 1:
+        key += ':x%s' % factor
+    now = time.time()
+    backend = cache.backend
+    if isinstance(backend, RedisBackend):
+        try:
+            return _take_shared(backend, key, rate, burst, now)
+        except redis.RedisError:
+            log.logger.exception('shared rate limit failed, using local')
+    return _take_local(key, rate, burst, now)
+
+
+def _count(scope, client, limited):
+    with _lock:
+        now = time.time()
+        if now - _window_start[0] >= TALKERS_WINDOW:
+            _last_talkers.clear()
+            _last_talkers.update(_talkers)
+            _talkers.clear()
+            _window_start[0] = now
+        elif len(_talkers) >= MAX_TALKERS and (client, scope) not in _talkers:
+            return
+        counts = _talkers[(client, scope)]
+        counts[0] += 1
+        if limited:
+            counts[1] += 1
+
+
+def top_talkers(limit=20):
+    """Returns the `limit` (client, scope, requests, limited) with the most
+    requests in the current and the last window."""
+    with _lock:
+        totals = collections.defaultdict(lambda: [0, 0])
+        for talkers in (_last_talkers, _talkers):
+            for talker, counts in talkers.items():
+                totals[talker][0] += counts[0]
+                totals[talker][1] += counts[1]
+        result = [(client, scope, counts[0], counts[1])
+                  for (client, scope), counts in totals.items()]
+    result.sort(key=lambda talker: (-talker[2], talker[0], talker[1]))
+    return result[:limit]
+
+
+def reset():
+    with _lock:
+        _buckets.clear()
+        _talkers.clear()
+        _last_talkers.clear()
+        _window_start[0] = time.time()
+
+
+def too_many_requests(wait):
+    seconds = int(math.ceil(wait))
+    response = HttpResponse(
+        'Too many requests, try again in %d seconds\n' % seconds,
+        content_type='text/plain', status=429)
+    response['Retry-After'] = str(seconds)
+    return response
+
+
+def rate_limit(scope, methods=('GET', 'HEAD', 'POST')):
+    """View decorator, limit requests with one of `methods` to the budget
+    of `scope` in settings.RATE_LIMITS. Scopes missing from it are not
+    limited. Use with method_decorator() on class based views' dispatch."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method in methods and scope in rate_limits():
+                client = client_id(request)
+                wait = take_token(scope, client)
+                address = client_ip(request)
+                if client != address:
+                    # and the address's share
+                    wait = max(wait, take_token(scope, address,
+                                                address_factor()))
+                _count(scope, client, wait > 0)
+                if wait > 0:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
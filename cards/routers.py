@@ -0,0 +1,174 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Send read only queries to a replica database.
+
+With settings.DATABASE_REPLICA naming a DATABASES alias, ReplicaRouter
+sends reads of the catalog and stats models to it, and reads of any
+model inside replica_reads() blocks (API game detail, submission
+history). Everything else, all writes, reads in transactions and reads
+in requests pinned to the primary, uses 'default'.
+
+Reads inside primary_reads() blocks use 'default' too. Wrap in one the
+queries that fill a cache under a version read from the primary, such as
+the catalog and lobby versions. A lagging replica would otherwise get
+its old data cached as the new version's.
+
+PrimaryPinningMiddleware pins a browser to the primary for
+REPLICA_PIN_SECONDS after it writes, so players see their own
+submission even if the replica is lagging. Only writes inside a request
+(between the middleware's process_request and process_response) pin,
+and session saves do not, nearly every request saves its session.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import ContextDecorator
+
+PIN_COOKIE = 'primary_pin'
+DEFAULT_PIN_SECONDS = 5
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# models only written by imports, admin and the stats jobs, a lagging
+# replica is fine for these. CatalogVersion is not one of them, a stale
+# version would be cached as the current one.
+REPLICA_MODELS = frozenset([
+    'cards.blackcard',
+    'cards.whitecard',
+    'cards.cardset',
+    'cards.playerstats',
+    'cards.gamestanding',
+    'cards.leaderboardentry',
+    'cards.whitecardstats',
+    'cards.blackcardstats',
+    'cards.cardpairstats',
+])
+# writes that do not pin the request to the primary
+NO_PIN_MODELS = frozenset([
+    'sessions.session',
+])
+
+_state = threading.local()
+
+
+def replica_alias():
+    return getattr(settings, 'DATABASE_REPLICA', None)
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+def pin_to_primary():
+    """Use the primary for the rest of this request."""
+    _state.pinned = True
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def reset(in_request=False):
+    _state.in_request = in_request
+    _state.pinned = False
+    _state.wrote = False
+    _state.replica_depth = 0
+    _state.primary_depth = 0
+
+
+class replica_reads(ContextDecorator):
+
+    """Reads of any model in this block (or decorated function) may use
+    the replica."""
+
+    def __enter__(self):
+        _state.replica_depth = getattr(_state, 'replica_depth', 0) + 1
+
+    def __exit__(self, *exc_info):
+        _state.replica_depth -= 1
+
+
+class primary_reads(ContextDecorator):
+
+    """Reads in this block (or decorated function) use the primary, even
+    inside replica_reads()."""
+
+    def __enter__(self):
+        _state.primary_depth = getattr(_state, 'primary_depth', 0) + 1
+
+    def __exit__(self, *exc_info):
+        _state.primary_depth -= 1
+
+
+def _model_label(model):
+    opts = model._meta
+    if opts.auto_created:
+        # many to many through table, route with the model it belongs to
+        opts = opts.auto_created._meta
+    return '%s.%s' % (opts.app_label, opts.model_name)
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replica = replica_alias()
+        if not replica or is_pinned():
+            return None
+        if getattr(_state, 'primary_depth', 0):
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # reading to write, see the transaction's own changes
+            return None
+        if (getattr(_state, 'replica_depth', 0) or
+                _model_label(model) in REPLICA_MODELS):
+            return replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        if (getattr(_state, 'in_request', False) and
+                _model_label(model) not in NO_PIN_MODELS):
+            _state.wrote = True
+            pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = (DEFAULT_DB_ALIAS, replica_alias())
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        replica = replica_alias()
+        if replica and db == replica:
+            # a copy of the primary, migrated by replication
+            return False
+        return None
+
+
+class PrimaryPinningMiddleware(object):
+
+    """Pins requests to the primary while writing, and for
+    REPLICA_PIN_SECONDS after a request that wrote."""
+
+    def process_request(self, request):
+        reset(in_request=True)
+        if request.method not in SAFE_METHODS:
+            pin_to_primary()
+            return
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            pin_to_primary()
+
+    def process_response(self, request, response):
+        if getattr(_state, 'wrote', False) and replica_alias():
+            seconds = pin_seconds()
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + seconds), max_age=seconds,
+                httponly=True)
+        reset()
+        return response
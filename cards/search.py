@@ -0,0 +1,235 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Card text search, by words and by similarity.
+
+Card texts are normalized (lower case, words only, no punctuation or
+blanks) and split into trigrams, the three character pieces of the text
+padded with a space at either end. Two ways of searching them:
+
+    contains(model, text)   cards having every word of `text` in them
+    similar(model, text)    cards whose trigrams mostly match those of
+                            `text`, for spotting (near) duplicates
+
+On PostgreSQL with the pg_trgm extension (migration 0012 adds it and
+the trigram indexes, if the database user may) both are answered by the
+database with its trigram indexes. Elsewhere each process builds a
+TrigramIndex, an inverted index of trigram: card ids over the texts of
+all the cards, for the current catalog_version() (see cards.catalog).
+"""
+
+import array
+import collections
+import math
+import re
+import threading
+
+import six
+
+from django.db import connections, router
+
+from cards import catalog
+from cards.routers import primary_reads
+
+# similar() results at least this similar (0 to 1)
+SIMILAR_THRESHOLD = 0.5
+SIMILAR_LIMIT = 5
+# contains() without pg_trgm returns at most this many cards, the ids end
+# up in an IN (...) and SQLite takes up to 999 parameters
+CONTAINS_LIMIT = 500
+ID_ARRAY_TYPECODE = 'i'
+
+_words_re = re.compile(r'[^\W_]+', re.UNICODE)
+_lock = threading.Lock()
+_indexes = {}  # model: (catalog version, TrigramIndex)
+_has_pg_trgm = {}  # database alias: bool
+
+
+def normalize(text):
+    """Lower case words of `text`, single space separated."""
+    return u' '.join(_words_re.findall(six.text_type(text).lower()))
+
+
+def trigrams(normalized, pad=True):
+    """Set of trigrams of `normalized` text, padded with spaces (as
+    indexed) or not (as a substring of an indexed text)."""
+    if pad:
+        normalized = u' %s ' % normalized
+    return set(normalized[pos:pos + 3] for pos in range(len(normalized) - 2))
+
+
+class TrigramIndex(object):
+
+    """Inverted trigram index over (id, text) `rows`."""
+
+    def __init__(self, rows):
+        self.texts = {}  # id: normalized text
+        self.sizes = {}  # id: number of trigrams
+        postings = collections.defaultdict(list)
+        for card_id, text in rows:
+            normalized = normalize(text)
+            grams = trigrams(normalized)
+            self.texts[card_id] = normalized
+            self.sizes[card_id] = len(grams)
+            for gram in grams:
+                postings[gram].append(card_id)
+        self.postings = dict(
+            (gram, array.array(ID_ARRAY_TYPECODE, ids))
+            for gram, ids in postings.items())
+
+    def _candidates(self, word):
+        """Most texts _with_word(`word`) looks at."""
+        grams = trigrams(word, pad=False)
+        if not grams:
+            return len(self.texts)
+        return min(len(self.postings.get(gram, ())) for gram in grams)
+
+    def _with_word(self, word):
+        grams = trigrams(word, pad=False)
+        if not grams:
+            # shorter than a trigram, look at every text
+            return set(card_id for card_id, text in self.texts.items()
+                       if word in text)
+        posting_lists = sorted(
+            (self.postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set(posting_lists[0])
+        for ids in posting_lists[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(ids)
+        return set(card_id for card_id in candidates
+                   if word in self.texts[card_id])
+
+    def contains(self, text):
+        """Returns the set of ids of the texts with every word of `text`."""
+        words = normalize(text).split()
+        if not words:
+            return set()
+        # longest (fewest candidates) first, later words are looked up in
+        # the texts found so far unless the index has fewer candidates
+        words.sort(key=len, reverse=True)
+        result = self._with_word(words[0])
+        for word in words[1:]:
+            if len(result) > self._candidates(word):
+                result &= self._with_word(word)
+            else:
+                result = set(card_id for card_id in result
+                             if word in self.texts[card_id])
+        return result
+
+    def similar(self, text, threshold=SIMILAR_THRESHOLD, limit=SIMILAR_LIMIT):
+        """Returns up to `limit` (similarity, id) of the texts most similar
+        to `text`, at least `threshold` similar, most similar first.
+        Similarity is the shared trigrams over all the trigrams of both
+        texts, 1 for the same words."""
+        grams = trigrams(normalize(text))
+        if not grams or threshold <= 0:
+            return []
+        # a text this similar shares at least min_shared trigrams, so it
+        # has one of the rarest len(grams) - min_shared + 1
+        min_shared = int(math.ceil(threshold * len(grams)))
+        rarest = sorted(grams, key=lambda gram: len(self.postings.get(gram, ())))
+        candidates = set()
+        for gram in rarest[:len(grams) - min_shared + 1]:
+            candidates.update(self.postings.get(gram, ()))
+        # and has between threshold and 1 / threshold as many trigrams
+        min_size = threshold * len(grams)
+        max_size = len(grams) / threshold
+        result = []
+        for card_id in candidates:
+            if not min_size <= self.sizes[card_id] <= max_size:
+                continue
+            shared = len(grams & trigrams(self.texts[card_id]))
+            score = float(shared) / (len(grams) + self.sizes[card_id] - shared)
+            if score >= threshold:
+                result.append((score, card_id))
+        result.sort(key=lambda match: (-match[0], match[1]))
+        return result[:limit]
+
+
+def card_index(model):
+    """The TrigramIndex of the texts of all `model` (BlackCard or
+    WhiteCard) cards, built once per process and catalog version."""
+    version = catalog.catalog_version()
+    with _lock:
+        cached = _indexes.get(model)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    with primary_reads():
+        index = TrigramIndex(
+            model.objects.values_list('id', 'text').iterator())
+    with _lock:
+        _indexes[model] = (version, index)
+    return index
+
+
+def reset():
+    with _lock:
+        _indexes.clear()
+        _has_pg_trgm.clear()
+
+
+def has_pg_trgm(alias):
+    """Whether database `alias` is PostgreSQL with pg_trgm installed."""
+    if alias not in _has_pg_trgm:
+        connection = connections[alias]
+        available = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                available = cursor.fetchone() is not None
+        _has_pg_trgm[alias] = available
+    return _has_pg_trgm[alias]
+
+
+def _text_column(model, alias):
+    connection = connections[alias]
+    return '%s.%s' % (connection.ops.quote_name(model._meta.db_table),
+                      connection.ops.quote_name('text'))
+
+
+def _like_escape(word):
+    return word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def contains(model, text, queryset=None):
+    """Returns `queryset` (default all) of `model` cards filtered to those
+    with every word of `text` in their text, ignoring case and
+    punctuation (at most CONTAINS_LIMIT of them without pg_trgm)."""
+    if queryset is None:
+        queryset = model.objects.all()
+    if has_pg_trgm(queryset.db):
+        words = normalize(text).split()
+        if not words:
+            return queryset.none()
+        column = _text_column(model, queryset.db)
+        # ILIKE '%word%' is answered by the gin_trgm_ops index
+        return queryset.extra(
+            where=['%s ILIKE %%s' % column] * len(words),
+            params=['%%%s%%' % _like_escape(word) for word in words])
+    ids = sorted(card_index(model).contains(text))[:CONTAINS_LIMIT]
+    return queryset.filter(pk__in=ids)
+
+
+def similar(model, text, threshold=SIMILAR_THRESHOLD, limit=SIMILAR_LIMIT):
+    """Returns up to `limit` (similarity, card) of the `model` cards most
+    similar to `text`, at least `threshold` similar, most similar first."""
+    alias = router.db_for_read(model)
+    if has_pg_trgm(alias):
+        column = _text_column(model, alias)
+        normalized = normalize(text)
+        # the % operator (similarity above pg_trgm.similarity_threshold,
+        # 0.3 by default) is answered by the gin_trgm_ops index
+        cards = model.objects.using(alias).extra(
+            select={'similarity': 'similarity(%s, %%s)' % column},
+            select_params=[normalized],
+            where=['%s %%%% %%s' % column],
+            params=[normalized],
+            order_by=['-similarity', 'id'])[:limit]
+        return [(card.similarity, card) for card in cards
+                if card.similarity >= threshold]
+    matches = card_index(model).similar(text, threshold, limit)
+    cards = model.objects.in_bulk([card_id for _, card_id in matches])
+    return [(score, cards[card_id]) for score, card_id in matches
+            if card_id in cards]
@@ -0,0 +1,245 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Spread games over several databases.
+
+settings.GAME_SHARDS lists the DATABASES aliases holding games, a game
+lives on GAME_SHARDS[game id % len(GAME_SHARDS)] together with its
+StandardSubmission rows (and their white card links) and GameEvent
+rows (cards.eventlog). The default,
+['default'], is no sharding at all.
+
+Game ids are handed out by the GameIdSequence row on 'default' so they
+are unique over all shards, submission ids are only unique within a
+shard. Everything else (cards, users, stats, archives) stays on
+'default'. Every shard has the full schema, with foreign key
+constraints enforced (PostgreSQL) the shards need a copy of the card
+tables, e.g. replicated from 'default'.
+
+ShardRouter routes saves of games and submissions by game id, queries
+need to say which shard they want, use get_game(), find_game(),
+game_queryset() and shard_aliases(). Related card lookups from a
+submission (submission.blackcard, submission.submissions.all()) go to
+'default', read the white card links through the m2m through model on
+the game's shard. After changing GAME_SHARDS run the rebalance_games
+command to move games to their new shard.
+"""
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Max
+
+from cards.models import Game, GameEvent, GameIdSequence, StandardSubmission
+
+DEFAULT_BATCH_SIZE = 100
+
+SHARDED_MODELS = frozenset([
+    Game,
+    GameEvent,
+    StandardSubmission,
+    StandardSubmission.submissions.through,
+])
+
+
+def shard_aliases():
+    return list(getattr(settings, 'GAME_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def game_aliases():
+    """shard_aliases() plus 'default', which keeps the games from before
+    sharding until rebalance_games moves them, for jobs that have to see
+    every game or submission."""
+    aliases = shard_aliases()
+    if DEFAULT_DB_ALIAS not in aliases:
+        aliases.append(DEFAULT_DB_ALIAS)
+    return aliases
+
+
+def sharding_enabled():
+    return shard_aliases() != [DEFAULT_DB_ALIAS]
+
+
+def shard_for(game_id):
+    aliases = shard_aliases()
+    return aliases[game_id % len(aliases)]
+
+
+def game_queryset(model, game_id):
+    """`model` (Game or StandardSubmission) queryset on the shard of
+    `game_id`. Without sharding the queryset is left to the other routers
+    (e.g. the replica router)."""
+    queryset = model.objects.all()
+    if sharding_enabled():
+        queryset = queryset.using(shard_for(game_id))
+    return queryset
+
+
+def get_game(game_id):
+    """Game.objects.get(pk=game_id) from the right shard, with the event
+    log (cards.eventlog) applied."""
+    from cards import eventlog
+    return eventlog.catch_up(game_queryset(Game, game_id).get(pk=game_id))
+
+
+def find_game(**lookup):
+    """Game.objects.get(**lookup), searching every shard, with the event
+    log (cards.eventlog) applied."""
+    from cards import eventlog
+    if not sharding_enabled():
+        return eventlog.catch_up(Game.objects.get(**lookup))
+    for alias in shard_aliases():
+        try:
+            return eventlog.catch_up(Game.objects.using(alias).get(**lookup))
+        except Game.DoesNotExist:
+            pass
+    raise Game.DoesNotExist('Game matching %r does not exist' % (lookup,))
+
+
+def game_exists(**lookup):
+    try:
+        find_game(**lookup)
+    except Game.DoesNotExist:
+        return False
+    return True
+
+
+def each_shard(queryset):
+    """Yields `queryset` on every shard."""
+    if not sharding_enabled():
+        yield queryset
+        return
+    for alias in shard_aliases():
+        yield queryset.using(alias)
+
+
+def allocate_game_id():
+    """Returns a new Game id, unique over all the shards."""
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        sequence = GameIdSequence.objects.using(DEFAULT_DB_ALIAS)
+        if not sequence.filter(pk=1).update(last_id=F('last_id') + 1):
+            # first sharded game, carry on from the existing games
+            last_id = max([
+                Game.objects.using(alias).aggregate(Max('id'))['id__max'] or 0
+                for alias in shard_aliases() + [DEFAULT_DB_ALIAS]
+            ])
+            sequence.create(pk=1, last_id=last_id + 1)
+        return sequence.get(pk=1).last_id
+
+
+def _game_id(instance):
+    if isinstance(instance, Game):
+        if instance.pk is None:
+            instance.pk = allocate_game_id()
+        return instance.pk
+    if isinstance(instance, (StandardSubmission, GameEvent)):
+        return instance.game_id
+    return None
+
+
+class ShardRouter(object):
+
+    """Put games and their submissions on the shard for the game id. Must
+    come before other routers in DATABASE_ROUTERS."""
+
+    def _db_for(self, model, hints):
+        if not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if model in SHARDED_MODELS:
+            game_id = _game_id(instance) if instance is not None else None
+            if game_id is not None:
+                return shard_for(game_id)
+            return None
+        if instance is not None and instance._state.db not in (
+                None, DEFAULT_DB_ALIAS):
+            # e.g. submission.blackcard, everything but games is on default
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding_enabled():
+            # games and submissions refer to cards and users by id
+            return True
+        return None
+
+
+def move_game(game, target):
+    """Copy `game`, its submissions and events to database alias `target`
+    and delete them from where they were. Submissions get new ids on the
+    target, gamedata['submission_ids'] is updated to match (the event log
+    is folded into gamedata first, older events keep the old ids)."""
+    from cards import eventlog
+    source = game._state.db
+    through = StandardSubmission.submissions.through
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        events = list(GameEvent.objects.using(source).filter(
+            game_id=game.id).order_by('seq'))
+        eventlog.catch_up(game)
+        game.snapshot_seq = game.event_seq
+        white_cards = {}
+        for submission_id, white_card_id in through.objects.using(
+                source).filter(standardsubmission__game_id=game.id).order_by(
+                'id').values_list('standardsubmission_id', 'whitecard_id'):
+            white_cards.setdefault(submission_id, []).append(white_card_id)
+        submissions = list(StandardSubmission.objects.using(source).filter(
+            game_id=game.id).order_by('id'))
+
+        new_ids = {}
+        game.save_base(using=target, raw=True, force_insert=True)
+        links = []
+        for submission in submissions:
+            old_id = submission.id
+            submission.id = None
+            submission.save_base(using=target, raw=True, force_insert=True)
+            new_ids[old_id] = submission.id
+            links.extend(through(standardsubmission_id=submission.id,
+                                 whitecard_id=white_card_id)
+                         for white_card_id in white_cards.get(old_id, []))
+        through.objects.using(target).bulk_create(links)
+        for event in events:
+            event.id = None
+            event.save_base(using=target, raw=True, force_insert=True)
+
+        submission_ids = game.gamedata.get('submission_ids') or {}
+        if submission_ids:
+            game.gamedata['submission_ids'] = dict(
+                (player_name, new_ids.get(submission_id, submission_id))
+                for player_name, submission_id in submission_ids.items())
+            Game.objects.using(target).filter(pk=game.id).update(
+                gamedata=game.gamedata)
+
+        # deletes submissions (and their white card links) too
+        Game.objects.using(source).filter(pk=game.id).delete()
+    game._state.db = target
+
+
+def misplaced_games(batch_size=DEFAULT_BATCH_SIZE):
+    """Yields games that are not on their shard, at most `batch_size`
+    loaded at a time."""
+    for alias in game_aliases():
+        last_id = 0
+        while True:
+            games = list(Game.objects.using(alias).filter(
+                pk__gt=last_id).order_by('pk')[:batch_size])
+            if not games:
+                break
+            last_id = games[-1].pk
+            for game in games:
+                if shard_for(game.pk) != alias:
+                    yield game
+
+
+def rebalance(batch_size=DEFAULT_BATCH_SIZE):
+    """Move every game not on its shard. Generator, yields (game id,
+    from alias, to alias) per game moved."""
+    for game in misplaced_games(batch_size):
+        source = game._state.db
+        target = shard_for(game.pk)
+        move_game(game, target)
+        yield game.pk, source, target
@@ -0,0 +1,464 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Cache shared by all the workers, with a small per process cache in
+front of it.
+
+    L1  bounded LRU dict in this process, entries live at most
+        SHARED_CACHE_L1_TIMEOUT seconds
+    L2  Redis (SHARED_CACHE_URL = redis://...), shared by every worker
+
+Every set()/delete() publishes the changed keys on a Redis channel, the
+other workers drop them from their L1, so L1 only serves stale data if
+an invalidation message is lost, and then for at most the L1 timeout.
+incr() goes straight to L2 (Redis INCR) so counters are exact across
+workers.
+
+The Redis may be shared with other users (socket.io, push notifications),
+every key is prefixed with SHARED_CACHE_KEY_PREFIX and clear() only
+deletes the keys with that prefix.
+
+Without SHARED_CACHE_URL the L2 is the Django default cache (what
+everything used before), SHARED_CACHE_URL = fake:// is an in-memory
+backend for tests and single process development. is_shared() tells
+whether the L2 really is seen by every worker, a LocMemCache default
+cache is not (unless settings.SHARED_CACHE_SINGLE_PROCESS says there is
+only one worker), callers whose cached data must agree between workers
+(versions, cached pages) check it.
+"""
+
+import collections
+import json
+import re
+import threading
+import time
+import uuid
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import redis
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache import cache as django_cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from cards import metrics
+import cards.log as log
+
+DEFAULT_L1_SIZE = 1000
+DEFAULT_L1_TIMEOUT = 5  # seconds
+INVALIDATE_CHANNEL = 'shared_cache:invalidate'
+CLEAR_ALL = '*'
+DEFAULT_KEY_PREFIX = 'cah:shared:'
+CLEAR_BATCH_SIZE = 500  # keys per SCAN/DEL in RedisBackend.clear()
+PICKLE_PROTOCOL = 2  # readable by Python 2 and 3 workers
+# Django cache backends only the process itself sees
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class LRUCache(object):
+
+    """Bounded, thread safe, dict with per entry expiry."""
+
+    def __init__(self, max_size=DEFAULT_L1_SIZE, timeout=DEFAULT_L1_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = collections.OrderedDict()  # key: (expires, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            if entry[0] < time.time():
+                return default
+            self._data[key] = entry  # most recently used last
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        if self.max_size <= 0:
+            return
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + timeout, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FakeBackend(object):
+
+    """In-memory L2 with publish/subscribe, share one instance between
+    several TwoTierCache objects to stand in for several workers."""
+
+    shared = True
+
+    def __init__(self):
+        self._data = {}  # key: (expires or None, value)
+        self._lock = threading.Lock()
+        self._subscribers = collections.defaultdict(list)
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] < time.time():
+            del self._data[key]
+            entry = None
+        return entry
+
+    def get_many(self, keys):
+        with self._lock:
+            result = {}
+            for key in keys:
+                entry = self._alive(key)
+                if entry is not None:
+                    result[key] = entry[1]
+            return result
+
+    def set_many(self, mapping, timeout=None):
+        expires = None if timeout is None else time.time() + timeout
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expires, value)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            entry = self._alive(key)
+            value = int(entry[1]) + delta if entry is not None else delta
+            self._data[key] = (entry[0] if entry else None, value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def publish(self, channel, message):
+        for callback in list(self._subscribers[channel]):
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers[channel].append(callback)
+
+    def close(self):
+        pass
+
+
+class DjangoCacheBackend(object):
+
+    """L2 in the Django default cache, no publish/subscribe."""
+
+    def __init__(self, cache=None):
+        self.cache = cache or django_cache
+
+    @property
+    def shared(self):
+        cache = self.cache
+        if cache is django_cache:
+            # a proxy for this thread's instance
+            cache = caches[DEFAULT_CACHE_ALIAS]
+        return not isinstance(cache, PROCESS_LOCAL_CACHES)
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set_many(self, mapping, timeout=None):
+        self.cache.set_many(mapping, timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(keys)
+
+    def incr(self, key, delta=1):
+        self.cache.add(key, 0, None)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # expired between add() and incr()
+            self.cache.add(key, 0, None)
+            return self.cache.incr(key, delta)
+
+    def clear(self):
+        self.cache.clear()
+
+    def publish(self, channel, message):
+        pass
+
+    def subscribe(self, channel, callback):
+        pass
+
+    def close(self):
+        pass
+
+
+class RedisBackend(object):
+
+    """L2 in Redis, keys prefixed with `key_prefix`."""
+
+    shared = True
+
+    def __init__(self, url, key_prefix=DEFAULT_KEY_PREFIX):
+        self.url = url
+        self.key_prefix = key_prefix
+        self.redis = redis.StrictRedis.from_url(url)
+        self._closed = False
+        self._pubsubs = set()
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return self.key_prefix + key
+
+    def get_many(self, keys):
+        return dict((key, value) for key, value in zip(
+            keys, self.redis.mget([self._key(key) for key in keys]))
+            if value is not None)
+
+    def set_many(self, mapping, timeout=None):
+        pipe = self.redis.pipeline()
+        for key, value in mapping.items():
+            if timeout is None:
+                pipe.set(self._key(key), value)
+            else:
+                pipe.setex(self._key(key), max(1, int(timeout)), value)
+        pipe.execute()
+
+    def delete_many(self, keys):
+        if keys:
+            self.redis.delete(*[self._key(key) for key in keys])
+
+    def incr(self, key, delta=1):
+        return self.redis.incr(self._key(key), delta)
+
+    def _scan(self, pattern):
+        """Yields lists of the keys matching `pattern` (SCAN, not in the
+        pinned redis client)."""
+        cursor = 0
+        while True:
+            cursor, keys = self.redis.execute_command(
+                'SCAN', cursor, 'MATCH', pattern, 'COUNT', CLEAR_BATCH_SIZE)
+            if keys:
+                yield keys
+            if int(cursor) == 0:
+                return
+
+    def clear(self):
+        """Delete this cache's keys, not the whole database."""
+        pattern = re.sub(r'([\\*?\[\]])', r'\\\1', self.key_prefix) + '*'
+        for keys in self._scan(pattern):
+            self.redis.delete(*keys)
+
+    def publish(self, channel, message):
+        self.redis.publish(channel, message)
+
+    def subscribe(self, channel, callback):
+        thread = threading.Thread(
+            target=self._listen, args=(channel, callback),
+            name='shared cache invalidation')
+        thread.daemon = True
+        thread.start()
+
+    def _listen(self, channel, callback):
+        while True:
+            pubsub = self.redis.pubsub()
+            with self._lock:
+                if self._closed:
+                    return
+                self._pubsubs.add(pubsub)
+            try:
+                pubsub.subscribe(channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        callback(message['data'])
+            except Exception:
+                if self._closed:
+                    return
+                log.logger.exception('shared cache invalidation listener')
+                # nothing is known about what was missed
+                callback(json.dumps({'sender': None, 'keys': CLEAR_ALL}))
+                time.sleep(1)
+            finally:
+                with self._lock:
+                    self._pubsubs.discard(pubsub)
+                pubsub.close()
+
+    def close(self):
+        """Stop the invalidation listeners (they see their unsubscribe
+        and return) and drop the connections."""
+        with self._lock:
+            self._closed = True
+            pubsubs = list(self._pubsubs)
+        for pubsub in pubsubs:
+            try:
+                pubsub.unsubscribe()
+            except redis.RedisError:
+                pubsub.close()
+        self.redis.connection_pool.disconnect()
+
+
+class TwoTierCache(object):
+
+    def __init__(self, backend, l1_size=DEFAULT_L1_SIZE,
+                 l1_timeout=DEFAULT_L1_TIMEOUT, channel=INVALIDATE_CHANNEL):
+        self.backend = backend
+        self.l1 = LRUCache(l1_size, l1_timeout)
+        self.channel = channel
+        self.id = uuid.uuid4().hex
+        self.stats = collections.Counter()
+        backend.subscribe(channel, self._invalidated)
+
+    def _invalidated(self, message):
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+        message = json.loads(message)
+        if message.get('sender') == self.id:
+            return
+        if message['keys'] == CLEAR_ALL:
+            self.l1.clear()
+        else:
+            for key in message['keys']:
+                self.l1.delete(key)
+
+    def _publish(self, keys):
+        self.backend.publish(self.channel, json.dumps(
+            {'sender': self.id, 'keys': keys}))
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        result = {}
+        missing = []
+        for key in keys:
+            value = self.l1.get(key, self)
+            if value is self:
+                missing.append(key)
+            else:
+                result[key] = value
+        self.stats['l1_hits'] += len(result)
+        metrics.add('cache_l1_hits', len(result))
+        if missing:
+            found = self.backend.get_many(missing)
+            for key, data in found.items():
+                value = pickle.loads(data)
+                self.l1.set(key, value)
+                result[key] = value
+            self.stats['l2_hits'] += len(found)
+            self.stats['misses'] += len(missing) - len(found)
+            metrics.add('cache_l2_hits', len(found))
+            metrics.add('cache_misses', len(missing) - len(found))
+        return result
+
+    def set(self, key, value, timeout=None):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, mapping, timeout=None):
+        self.backend.set_many(dict(
+            (key, pickle.dumps(value, PICKLE_PROTOCOL))
+            for key, value in mapping.items()), timeout)
+        for key, value in mapping.items():
+            self.l1.set(key, value, timeout)
+        self._publish(list(mapping))
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        self.backend.delete_many(keys)
+        for key in keys:
+            self.l1.delete(key)
+        self._publish(list(keys))
+
+    def incr(self, key, delta=1):
+        """Atomically add `delta` to the counter `key` (missing counters
+        start at 0), returns the new value. Counters are not pickled, use
+        incr() (not get()) to read them."""
+        return self.backend.incr(key, delta)
+
+    def clear(self):
+        self.backend.clear()
+        self.l1.clear()
+        self._publish(CLEAR_ALL)
+
+    def close(self):
+        self.backend.close()
+        self.l1.clear()
+
+
+def backend_for_url(url, key_prefix=DEFAULT_KEY_PREFIX):
+    if not url:
+        return DjangoCacheBackend()
+    if url.startswith('redis://'):
+        return RedisBackend(url, key_prefix)
+    if url.startswith('fake://'):
+        return FakeBackend()
+    raise ValueError('unsupported SHARED_CACHE_URL %r' % url)
+
+
+def get_cache():
+    """Returns this process' TwoTierCache, configured from settings."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TwoTierCache(
+                    backend_for_url(
+                        getattr(settings, 'SHARED_CACHE_URL', None),
+                        getattr(settings, 'SHARED_CACHE_KEY_PREFIX',
+                                DEFAULT_KEY_PREFIX)),
+                    l1_size=getattr(settings, 'SHARED_CACHE_L1_SIZE', DEFAULT_L1_SIZE),
+                    l1_timeout=getattr(settings, 'SHARED_CACHE_L1_TIMEOUT', DEFAULT_L1_TIMEOUT),
+                )
+    return _cache
+
+
+def is_shared():
+    """Whether every worker sees the same L2 (see the module docstring)."""
+    if getattr(settings, 'SHARED_CACHE_SINGLE_PROCESS', False):
+        return True
+    return get_cache().backend.shared
+
+
+def reset_cache():
+    """Close and forget this process' TwoTierCache, the next use builds a
+    new one. Call before forking, the children must not share its
+    connections and do not get its invalidation listener thread."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = None
+
+
+class CacheProxy(object):
+
+    """Module level stand in for get_cache(), so settings are only read
+    when the cache is first used."""
+
+    def __getattr__(self, name):
+        return getattr(get_cache(), name)
+
+
+cache = CacheProxy()
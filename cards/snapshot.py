@@ -0,0 +1,283 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Compact binary snapshot of the card catalog.
+
+The export_catalog_snapshot command writes card texts, pick/draw and
+card set membership to a file, CatalogSnapshot memory maps it so all
+the workers on a machine share the same (read only) pages instead of
+each loading the cards from the database.
+
+The file is little endian:
+
+    header      magic, format, catalog version and the record counts
+    black cards (id, text offset, text length, pick, draw) sorted by id
+    white cards (id, text offset, text length) sorted by id
+    card sets   (name offset, name length, black start, black count,
+                white start, white count) sorted by name
+    card ids    uint32 card set members, indexed by the card set records
+    text        utf-8 card texts and card set names
+
+A snapshot records the catalog_version() it was taken at and is only
+used while that is still the current version.
+"""
+
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from django.conf import settings
+
+from cards import catalog
+from cards.models import BlackCard, WhiteCard, CardSet
+from cards.routers import primary_reads
+import cards.log as log
+
+MAGIC = b'CAHCAT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<6sHQIIII')
+BLACK_RECORD = struct.Struct('<IIIBB')
+WHITE_RECORD = struct.Struct('<III')
+SET_RECORD = struct.Struct('<IIIIII')
+ID_ARRAY_TYPECODE = 'I'
+
+_snapshot = None
+_rejected = None  # (path, mtime) of the last stale snapshot seen
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class StaleSnapshot(SnapshotError):
+    pass
+
+
+class _Text(object):
+
+    """Accumulates the text section, returns (offset, length) per string."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, text):
+        data = text.encode('utf-8')
+        self.chunks.append(data)
+        offset = self.size
+        self.size += len(data)
+        return offset, len(data)
+
+
+def _id_bytes(ids):
+    packed = array.array(ID_ARRAY_TYPECODE, ids)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return getattr(packed, 'tobytes', getattr(packed, 'tostring', None))()
+
+
+@primary_reads()
+def write_snapshot(path, version=None):
+    """Write the current catalog to `path` (replacing it atomically, so
+    workers with the old file mapped are not affected).
+
+    Returns dict of black_cards, white_cards and card_sets counts.
+    """
+    if version is None:
+        # before reading the cards, so a concurrent change makes the
+        # snapshot stale rather than mislabelled
+        version = catalog.db_catalog_version()
+    text = _Text()
+    records = []
+
+    black_ids = []
+    for card_id, card_text, pick, draw in BlackCard.objects.order_by(
+            'id').values_list('id', 'text', 'pick', 'draw').iterator():
+        offset, length = text.add(card_text)
+        records.append(BLACK_RECORD.pack(card_id, offset, length, pick, draw))
+        black_ids.append(card_id)
+
+    white_ids = []
+    for card_id, card_text in WhiteCard.objects.order_by(
+            'id').values_list('id', 'text').iterator():
+        offset, length = text.add(card_text)
+        records.append(WHITE_RECORD.pack(card_id, offset, length))
+        white_ids.append(card_id)
+
+    members = {}
+    for through, card_field, index in (
+            (CardSet.black_card.through, 'blackcard_id', 0),
+            (CardSet.white_card.through, 'whitecard_id', 1)):
+        for name, card_id in through.objects.order_by(
+                'cardset__name', card_field).values_list(
+                'cardset__name', card_field).iterator():
+            members.setdefault(name, ([], []))[index].append(card_id)
+    set_names = sorted(CardSet.objects.values_list('name', flat=True))
+    member_ids = []
+    for name in set_names:
+        black, white = members.get(name, ([], []))
+        offset, length = text.add(name)
+        records.append(SET_RECORD.pack(
+            offset, length,
+            len(member_ids), len(black),
+            len(member_ids) + len(black), len(white)))
+        member_ids.extend(black)
+        member_ids.extend(white)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, version, len(black_ids),
+                         len(white_ids), len(set_names), len(member_ids))
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.catalog', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            for record in records:
+                f.write(record)
+            f.write(_id_bytes(member_ids))
+            for chunk in text.chunks:
+                f.write(chunk)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return {
+        'black_cards': len(black_ids),
+        'white_cards': len(white_ids),
+        'card_sets': len(set_names),
+    }
+
+
+class CatalogSnapshot(object):
+
+    """Read only, memory mapped view of a snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError('%s is empty' % path)
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise SnapshotError('%s is not a catalog snapshot' % path)
+        (magic, format_version, self.version, self.black_count,
+         self.white_count, self.set_count, id_count) = HEADER.unpack_from(
+            self._map, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            self.close()
+            raise SnapshotError('%s is not a version %d catalog snapshot' % (
+                path, FORMAT_VERSION))
+        self._black_offset = HEADER.size
+        self._white_offset = (
+            self._black_offset + self.black_count * BLACK_RECORD.size)
+        self._set_offset = (
+            self._white_offset + self.white_count * WHITE_RECORD.size)
+        self._id_offset = self._set_offset + self.set_count * SET_RECORD.size
+        self._text_offset = self._id_offset + id_count * 4
+
+    def close(self):
+        self._map.close()
+
+    def _text(self, offset, length):
+        start = self._text_offset + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    def _ids(self, start, count):
+        start = self._id_offset + start * 4
+        return list(struct.unpack_from('<%dI' % count, self._map, start))
+
+    def _find(self, offset, record, count, card_id):
+        """Binary search the (id sorted) table at `offset`."""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            values = record.unpack_from(self._map, offset + middle * record.size)
+            if values[0] == card_id:
+                return values
+            elif values[0] < card_id:
+                low = middle + 1
+            else:
+                high = middle
+        raise KeyError(card_id)
+
+    def black_card(self, card_id):
+        """Returns (text, pick, draw), KeyError if there is no such card."""
+        _, offset, length, pick, draw = self._find(
+            self._black_offset, BLACK_RECORD, self.black_count, card_id)
+        return self._text(offset, length), pick, draw
+
+    def white_card(self, card_id):
+        """Returns the card text, KeyError if there is no such card."""
+        _, offset, length = self._find(
+            self._white_offset, WHITE_RECORD, self.white_count, card_id)
+        return self._text(offset, length)
+
+    def _set_records(self):
+        for num in range(self.set_count):
+            yield SET_RECORD.unpack_from(
+                self._map, self._set_offset + num * SET_RECORD.size)
+
+    def card_set_names(self):
+        return [self._text(record[0], record[1])
+                for record in self._set_records()]
+
+    def card_set_ids(self, card_set_name):
+        """Returns (white card ids, black card ids) of the named card set,
+        like catalog.card_set_ids(). Unknown card sets have no cards."""
+        names = self.card_set_names()
+        num = bisect.bisect_left(names, card_set_name)
+        if num == len(names) or names[num] != card_set_name:
+            return [], []
+        record = SET_RECORD.unpack_from(
+            self._map, self._set_offset + num * SET_RECORD.size)
+        _, _, black_start, black_count, white_start, white_count = record
+        return (self._ids(white_start, white_count),
+                self._ids(black_start, black_count))
+
+
+def load_snapshot(path, version=None):
+    """Map the snapshot at `path`, raises StaleSnapshot if it was not taken
+    at `version` (default the current catalog_version())."""
+    snapshot = CatalogSnapshot(path)
+    if version is None:
+        version = catalog.catalog_version()
+    if snapshot.version != version:
+        snapshot.close()
+        raise StaleSnapshot('%s is catalog version %d, current is %d' % (
+            path, snapshot.version, version))
+    return snapshot
+
+
+def current_snapshot():
+    """Returns the CatalogSnapshot from settings.CARD_SNAPSHOT for this
+    process, or None if there is none or it is stale (callers then use
+    the database)."""
+    global _snapshot, _rejected
+    path = getattr(settings, 'CARD_SNAPSHOT', None)
+    if not path:
+        return None
+    version = catalog.catalog_version()
+    if _snapshot is not None:
+        if _snapshot.path == path and _snapshot.version == version:
+            return _snapshot
+        _snapshot.close()
+        _snapshot = None
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _rejected == (path, mtime):
+        # do not map the same stale file again on every call
+        return None
+    try:
+        _snapshot = load_snapshot(path, version)
+    except SnapshotError as info:
+        log.logger.warning('not using catalog snapshot: %s', info)
+        _rejected = (path, mtime)
+    return _snapshot
@@ -1,6 +1,12 @@
 window.LongPolling = (function($) {
-    var _timeout = null,
+    var POLL_INTERVAL = 30000,
+        MAX_POLL_INTERVAL = 300000,
+        _timeout = null,
+        _interval = POLL_INTERVAL,
         _options = {},
+        schedulePoll = function() {
+            _timeout = window.setTimeout(doLongPoll, _interval);
+        },
         doLongPoll = function() {
             $.ajax({
                 url: '/game/' + _options.gameId + '/api',
@@ -13,17 +19,44 @@ window.LongPolling = (function($) {
                     if (res.gamedata.round != state.round) {
                         location.reload(true);
                     }
+                    _interval = POLL_INTERVAL;
+                }
+            ).fail(function(xhr) {
+                    // back off, at least as long as a 429 asks us to
+                    var retryAfter = parseInt(xhr.getResponseHeader('Retry-After'), 10) * 1000;
+                    _interval = Math.min(MAX_POLL_INTERVAL,
+                                         Math.max(_interval * 2, retryAfter || 0));
                 }
-            );
+            ).always(schedulePoll);
         };
 
     return {
         startLongPolling: function(options) {
             _options = $.extend({}, options);
-            _timeout = window.setInterval(doLongPoll, 30000);
+            _interval = POLL_INTERVAL;
+            schedulePoll();
+        },
+        // served by cah.asgi, falls back to polling the API without it
+        startEventStream: function(options) {
+            var self = this,
+                source;
+            if (!window.EventSource) {
+                return self.startLongPolling(options);
+            }
+            source = new EventSource('/game/' + options.gameId + '/events?version=' + options.version);
+            source.addEventListener('state', function(event) {
+                if (JSON.parse(event.data).version != options.version) {
+                    location.reload(true);
+                }
+            });
+            source.onerror = function() {
+                if (source.readyState == EventSource.CLOSED) {
+                    self.startLongPolling(options);
+                }
+            };
         },
         stopLongPolling: function() {
-            window.clearInterval(_timeout);
+            window.clearTimeout(_timeout);
         }
     };
 }(jQuery));
@@ -0,0 +1,121 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Incrementally maintained win counters.
+
+Game.start_new_round() calls record_win() whenever a round has a
+winner, which bumps the per player, per game and per day/week counters
+so leaderboards never need to look inside gamedata. The stats are on
+'default', they commit separately from a game on another shard, so a
+round's win is counted once (see RoundWin), however often the pick is
+applied.
+"""
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from cards.models import (
+    GameStanding,
+    LeaderboardEntry,
+    PlayerStats,
+    RoundWin,
+)
+from cards.sharedcache import cache
+
+LEADERBOARD_PERIODS = (
+    LeaderboardEntry.PERIOD_DAY,
+    LeaderboardEntry.PERIOD_WEEK,
+)
+LEADERBOARD_SIZE = 10
+LEADERBOARD_CACHE_TIMEOUT = 60  # seconds
+
+
+def period_start(period, when):
+    """Returns the date the day/week containing datetime `when` starts."""
+    day = when.date()
+    if period == LeaderboardEntry.PERIOD_WEEK:
+        day -= datetime.timedelta(days=day.weekday())
+    return day
+
+
+def _increment(model, lookup, defaults=None, **extra):
+    """Add one win to the `model` row matching `lookup`, creating it (with
+    `defaults`) if needed."""
+    updated = model.objects.filter(**lookup).update(wins=F('wins') + 1, **extra)
+    if updated:
+        return
+    values = dict(lookup, wins=1, **extra)
+    values.update(defaults or {})
+    try:
+        with transaction.atomic():
+            model.objects.create(**values)
+    except IntegrityError:
+        # someone else created it first
+        model.objects.filter(**lookup).update(wins=F('wins') + 1, **extra)
+
+
+@transaction.atomic
+def record_win(game_id, player_name, when=None, game_round=None):
+    """Count a win of `player_name` in game `game_id`, unless round
+    `game_round` of the game already has its win counted. Returns whether
+    it was counted."""
+    if game_round is not None:
+        try:
+            with transaction.atomic():
+                RoundWin.objects.create(game_id=game_id, round=game_round,
+                                        player_name=player_name)
+        except IntegrityError:
+            return False
+    when = when or datetime.datetime.now()
+    user = None
+    if not PlayerStats.objects.filter(player_name=player_name).exists():
+        user = User.objects.filter(username=player_name).first()
+    _increment(
+        PlayerStats,
+        {'player_name': player_name},
+        defaults={'user': user},
+        last_win=when,
+    )
+    _increment(GameStanding, {'game_id': game_id, 'player_name': player_name})
+    for period in LEADERBOARD_PERIODS:
+        _increment(LeaderboardEntry, {
+            'period': period,
+            'period_start': period_start(period, when),
+            'player_name': player_name,
+        })
+    return True
+
+
+def leaderboard(period=None, when=None, size=LEADERBOARD_SIZE):
+    """Returns list of (player name, wins), most wins first.
+
+    `period` is one of LEADERBOARD_PERIODS, or None for all time.
+    Results are cached (cards.sharedcache) for LEADERBOARD_CACHE_TIMEOUT
+    seconds, not under a version, so a process local cache will do.
+    """
+    if period is None:
+        cache_key = 'leaderboard:all:%d' % size
+        queryset = PlayerStats.objects.all()
+    else:
+        if period not in LEADERBOARD_PERIODS:
+            raise ValueError('unknown leaderboard period %r' % period)
+        start = period_start(period, when or datetime.datetime.now())
+        cache_key = 'leaderboard:%s:%s:%d' % (period, start.isoformat(), size)
+        queryset = LeaderboardEntry.objects.filter(
+            period=period, period_start=start)
+
+    result = cache.get(cache_key)
+    if result is None:
+        result = list(queryset.order_by('-wins', 'player_name').values_list(
+            'player_name', 'wins')[:size])
+        cache.set(cache_key, result, LEADERBOARD_CACHE_TIMEOUT)
+    return result
+
+
+def game_standings(game_id):
+    """Returns list of (player name, wins) for a (possibly archived) game."""
+    return list(GameStanding.objects.filter(game_id=game_id).order_by(
+        '-wins', 'player_name').values_list('player_name', 'wins'))
@@ -0,0 +1,125 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from django.test import TestCase
+
+from cards import actions
+from cards.models import Game, GameError, GAMESTATE_SELECTION
+from cards.tests.model_tests import create_card_set, create_started_game
+
+
+class GameActionTests(TestCase):
+
+    def setUp(self):
+        create_card_set()
+        self.game = create_started_game()
+
+    def reload(self):
+        return Game.objects.get(pk=self.game.pk)
+
+    def test_perform_in_process(self):
+        game = actions.perform(self.game, 'join', player_name='d')
+        self.assertTrue('d' in self.reload().gamedata['players'])
+        game = actions.perform(game, 'exit', player_name='d')
+        self.assertFalse('d' in self.reload().gamedata['players'])
+
+    def command(self, action, **kwargs):
+        return {'id': 'x', 'game_id': self.game.pk, 'action': action,
+                'kwargs': kwargs}
+
+    def test_actor_applies_commands(self):
+        actor = actions.GameActor()
+        for player_name in ('b', 'c'):
+            card = self.game.gamedata['players'][player_name]['hand'][0]
+            reply = actor.handle(self.command(
+                'submit', player_name=player_name, white_card_list=[card]))
+            self.assertEqual(reply, {'id': 'x', 'ok': True})
+        self.assertEqual(self.reload().game_state, GAMESTATE_SELECTION)
+
+        reply = actor.handle(self.command('pick', czar_name='a', winner='b'))
+        self.assertTrue(reply['ok'])
+        game = self.reload()
+        self.assertEqual(game.gamedata['card_czar'], 'b')
+        self.assertEqual(game.gamedata['players']['b']['wins'], 1)
+
+    def test_actor_rereads_changed_games(self):
+        actor = actions.GameActor()
+        self.assertTrue(actor.handle(self.command('join', player_name='d'))['ok'])
+        cached = actor.games[self.game.pk][0]
+        self.assertTrue(actor.get_game(self.game.pk) is cached)
+        # e.g. deactivate_old_games
+        game = self.reload()
+        game.is_active = False
+        game.save()
+        reloaded = actor.get_game(self.game.pk)
+        self.assertFalse(reloaded is cached)
+        self.assertFalse(reloaded.is_active)
+        self.assertTrue('d' in reloaded.gamedata['players'])
+
+    def test_actor_errors(self):
+        actor = actions.GameActor()
+        reply = actor.handle(self.command('submit', player_name='a',
+                                          white_card_list=[]))
+        self.assertEqual(reply['error_type'], 'GameError')
+        self.assertRaises(GameError, actions._raise_for_reply, reply)
+        self.assertFalse(self.game.pk in actor.games)
+
+        reply = actor.handle(dict(self.command('exit', player_name='a'),
+                                  game_id=self.game.pk + 1000))
+        self.assertEqual(reply['error_type'], 'DoesNotExist')
+
+        reply = actions.GameActor(shard=1, shards=2).handle(
+            dict(self.command('exit', player_name='a'), game_id=2))
+        self.assertEqual(reply['error_type'], 'error')
+        self.assertRaises(actions.ActorError, actions._raise_for_reply, reply)
+
+    def test_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        url = 'unix://%s/actor{shard}.sock' % directory
+        path = os.path.join(directory, 'actor0.sock')
+        replies = []
+
+        def client():
+            while not os.path.exists(path):
+                time.sleep(0.01)
+            replies.append(actions.ActorClient(url, shards=1).send(
+                self.game.pk, 'join', {'player_name': 'd'}))
+
+        thread = threading.Thread(target=client)
+        thread.start()
+        try:
+            # the actor (and the database) stay in this thread
+            actions.GameActor().serve_unix(url, requests=1)
+        finally:
+            thread.join()
+            shutil.rmtree(directory)
+        self.assertTrue(replies[0]['ok'])
+        self.assertTrue('d' in self.reload().gamedata['players'])
+
+    def test_unix_socket_restart(self):
+        directory = tempfile.mkdtemp()
+        url = 'unix://%s/actor{shard}.sock' % directory
+        path = os.path.join(directory, 'actor0.sock')
+        try:
+            # an actor that was killed leaves its socket behind
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(path)
+            stale.close()
+            actions.GameActor().serve_unix(url, requests=0)
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_idle_connection(self):
+        actor = actions.GameActor(connection_timeout=0.1)
+        conn, idle_client = socket.socketpair()
+        try:
+            start = time.time()
+            actor.handle_connection(conn)
+            self.assertTrue(time.time() - start < 5)
+        finally:
+            idle_client.close()
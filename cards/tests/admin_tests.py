@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from cards import search
+from cards.models import CardSet, Game, StandardSubmission, WhiteCard
+from cards.tests.model_tests import create_card_set, create_started_game
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        search.reset()
+        create_card_set()
+        User.objects.create_superuser('staff', 'staff@example.com', 'secret')
+        self.client.login(username='staff', password='secret')
+
+    def changelist(self, model, **params):
+        url = reverse('admin:cards_%s_changelist' % model._meta.model_name)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def play_round(self, game):
+        czar = game.gamedata['card_czar']
+        players = sorted(name for name in game.gamedata['players'] if name != czar)
+        for player_name in players:
+            card = game.gamedata['players'][player_name]['hand'][0]
+            game.submit_white_cards(player_name, [card])
+        game.pick_winner(czar, players[0])
+        game.save()
+
+    def test_game_changelist(self):
+        game = create_started_game()
+        response, queries = self.changelist(Game)
+        listed = response.context['cl'].result_list[0]
+        self.assertEqual(listed.pk, game.pk)
+        self.assertFalse('gamedata' in listed.__dict__)
+
+        response = self.client.get(
+            reverse('admin:cards_game_change', args=(game.pk,)))
+        self.assertEqual(response.status_code, 200)
+
+        response, _ = self.changelist(Game, q='Test')
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+    def test_submission_changelist_queries(self):
+        game = create_started_game()
+        self.play_round(game)
+        _, queries = self.changelist(StandardSubmission)
+        for _ in range(2):
+            self.play_round(game)
+        response, more_queries = self.changelist(StandardSubmission)
+        self.assertEqual(len(response.context['cl'].result_list), 6)
+        self.assertEqual(more_queries, queries)
+
+        response, _ = self.changelist(StandardSubmission, q=str(game.pk))
+        self.assertEqual(len(response.context['cl'].result_list), 6)
+
+    def test_card_search(self):
+        card = WhiteCard.objects.get(text='test white 3')
+        response, _ = self.changelist(WhiteCard, q='  TEST white   3 ')
+        self.assertEqual(list(response.context['cl'].result_list), [card])
+        response, _ = self.changelist(WhiteCard, q=str(card.pk))
+        self.assertEqual(list(response.context['cl'].result_list), [card])
+        # not a whole card text, by its start
+        response, _ = self.changelist(WhiteCard, q='TEST')
+        self.assertEqual(len(response.context['cl'].result_list), 60)
+        # by words anywhere in it
+        response, _ = self.changelist(WhiteCard, q='WHITE 57')
+        self.assertEqual([card.text for card in response.context['cl'].result_list],
+                         ['test white 57'])
+        response, _ = self.changelist(WhiteCard, q='black')
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+    def test_card_set_change_form(self):
+        card_set = CardSet.objects.get(name='test')
+        response = self.client.get(
+            reverse('admin:cards_cardset_change', args=(card_set.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'test white 3')
@@ -0,0 +1,109 @@
+import datetime
+import warnings
+
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from cards import analytics
+from cards.models import (
+    BlackCard,
+    WhiteCard,
+    StandardSubmission,
+    WhiteCardStats,
+    BlackCardStats,
+    CardPairStats,
+    AnalyticsWatermark,
+)
+from cards.tests.model_tests import create_card_set
+
+NO_SETTLE = datetime.timedelta(seconds=-60)
+
+
+class CardStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_card_set(black=2, white=3)
+        self.black = list(BlackCard.objects.order_by('id'))
+        self.white = list(WhiteCard.objects.order_by('id'))
+
+    def submit(self, black, white, winner=False):
+        submission = StandardSubmission.objects.create(
+            blackcard=black, winner=winner)
+        submission.submissions.add(white)
+        return submission
+
+    def test_aggregate_incrementally(self):
+        self.submit(self.black[0], self.white[0], winner=True)
+        self.submit(self.black[0], self.white[1])
+        self.submit(self.black[1], self.white[0])
+        counts = list(analytics.update_card_stats(chunk_size=2, settle=NO_SETTLE))
+        self.assertEqual(counts, [2, 1])
+
+        white = WhiteCardStats.objects.get(white_card=self.white[0])
+        self.assertEqual((white.played, white.wins), (2, 1))
+        black = BlackCardStats.objects.get(black_card=self.black[0])
+        self.assertEqual((black.played, black.wins), (2, 1))
+        pair = CardPairStats.objects.get(
+            black_card=self.black[0], white_card=self.white[0])
+        self.assertEqual((pair.played, pair.wins), (1, 1))
+
+        # only new rows are processed on the next run
+        last = self.submit(self.black[0], self.white[0], winner=True)
+        self.assertEqual(
+            list(analytics.update_card_stats(settle=NO_SETTLE)), [1])
+        white = WhiteCardStats.objects.get(white_card=self.white[0])
+        self.assertEqual((white.played, white.wins), (3, 2))
+        self.assertEqual(AnalyticsWatermark.objects.get().last_id, last.id)
+
+    def test_update_queries(self):
+        create_card_set(name='more', black=1, white=analytics.KEYS_PER_QUERY)
+        black = BlackCard.objects.latest('id')
+        white = list(WhiteCard.objects.filter(cardset__name='more'))
+        for card in white:
+            self.submit(black, card, winner=card.pk % 2)
+        list(analytics.update_card_stats(settle=NO_SETTLE))
+        for card in white:
+            self.submit(black, card, winner=True)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(analytics.update_card_stats(
+                settle=NO_SETTLE)), [len(white)])
+        # one per stats table, not one per card
+        updates = [query for query in queries.captured_queries
+                   if 'stats" SET' in query['sql']]
+        self.assertEqual(len(updates), 3)
+        for card in white:
+            stats = CardPairStats.objects.get(black_card=black, white_card=card)
+            self.assertEqual((stats.played, stats.wins),
+                             (2, 1 + card.pk % 2))
+        self.assertEqual(BlackCardStats.objects.get(black_card=black).played,
+                         2 * len(white))
+
+    def test_unsettled_rows_are_skipped(self):
+        self.submit(self.black[0], self.white[0])
+        self.assertEqual(list(analytics.update_card_stats()), [])
+
+    def test_hall_of_fame(self):
+        for _ in range(analytics.HALL_OF_FAME_MIN_PLAYED):
+            self.submit(self.black[0], self.white[0], winner=True)
+            self.submit(self.black[0], self.white[1])
+        list(analytics.update_card_stats(settle=NO_SETTLE))
+        result = analytics.hall_of_fame('test')
+        self.assertEqual(
+            [row[0] for row in result['white_cards']],
+            [self.white[0].text, self.white[1].text])
+        self.assertEqual(result['white_cards'][0][3], 1.0)
+        self.assertEqual(result['pairs'][0][:2], (self.black[0].text, self.white[0].text))
+        self.assertEqual(analytics.hall_of_fame('no such set')['white_cards'], [])
+        # not a valid memcached key
+        name = u'caf\xe9 %s' % ('x' * 250)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            self.assertEqual(analytics.hall_of_fame(name)['white_cards'], [])
+
+        response = self.client.get(reverse('hall-of-fame-view'))
+        self.assertEqual(response.status_code, 200)
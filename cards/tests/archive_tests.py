@@ -0,0 +1,64 @@
+import datetime
+
+from django.test import TestCase
+
+from cards.archive import archive_games, restore_games
+from cards.models import (
+    Game,
+    GameArchive,
+    BlackCard,
+    WhiteCard,
+    StandardSubmission,
+)
+from cards import factories
+
+
+class ArchiveGamesTests(TestCase):
+
+    def setUp(self):
+        self.game = factories.GameFactory.create(
+            name='Old game',
+            is_active=False,
+            gamedata={'round': 3, 'players': {'a': {}, 'b': {}}},
+        )
+        self.black_card = BlackCard.objects.create(text='Why?')
+        self.white_card = WhiteCard.objects.create(text='Because.')
+        submission = StandardSubmission.objects.create(
+            game=self.game,
+            blackcard=self.black_card,
+            complete_submission='Why? Because',
+            winner=True,
+        )
+        submission.submissions.add(self.white_card)
+        self.submission_id = submission.id
+        self.game_name = Game.objects.get(pk=self.game.pk).name
+        self.older_than = datetime.datetime.now() + datetime.timedelta(days=1)
+
+    def test_archive_moves_game_and_submissions(self):
+        self.assertEqual(sum(archive_games(self.older_than)), 1)
+        self.assertFalse(Game.objects.filter(pk=self.game.pk).exists())
+        self.assertFalse(StandardSubmission.objects.exists())
+        archive = GameArchive.objects.get(game_id=self.game.pk)
+        self.assertEqual(archive.rounds, 3)
+        self.assertEqual(archive.player_count, 2)
+        self.assertEqual(archive.submission_count, 1)
+
+    def test_active_and_recent_games_are_kept(self):
+        factories.GameFactory.create(name='Live', is_active=True, gamedata={})
+        older_than = datetime.datetime.now() - datetime.timedelta(days=1)
+        self.assertEqual(sum(archive_games(older_than)), 0)
+        self.assertEqual(sum(archive_games(self.older_than)), 1)
+        self.assertTrue(Game.objects.filter(name='Live').exists())
+
+    def test_restore_round_trip(self):
+        list(archive_games(self.older_than))
+        self.assertEqual(sum(restore_games([self.game.pk])), 1)
+        self.assertFalse(GameArchive.objects.exists())
+        game = Game.objects.get(pk=self.game.pk)
+        self.assertEqual(game.name, self.game_name)
+        self.assertEqual(game.gamedata['round'], 3)
+        submission = StandardSubmission.objects.get(pk=self.submission_id)
+        self.assertTrue(submission.winner)
+        self.assertEqual(
+            list(submission.submissions.values_list('id', flat=True)),
+            [self.white_card.id])
@@ -0,0 +1,169 @@
+import json
+import sys
+import types
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+
+@skipIf(sys.version_info < (3, 5), 'cah.asgi needs Python 3.5+')
+class GameEventsApplicationTests(SimpleTestCase):
+
+    def setUp(self):
+        import asyncio
+        from cah import asgi
+
+        self.asyncio = asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.versions = {1: 3}
+
+        def wsgi_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [environ['PATH_INFO'].encode('latin-1')]
+
+        self.app = asgi.GameEventsApplication(
+            wsgi_app=wsgi_app,
+            state_versions=lambda game_ids: dict(
+                (game_id, self.versions.get(game_id, 0))
+                for game_id in game_ids))
+
+    def tearDown(self):
+        self.app._listener.cancel()
+        self.loop.run_until_complete(self.asyncio.gather(
+            self.app._listener, return_exceptions=True))
+        self.app.executor.shutdown()
+        self.loop.close()
+
+    def request(self, path, query_string=b'', method='GET'):
+        """Starts a request, returns (task, list of sent messages)."""
+        inbox = self.asyncio.Queue()
+        inbox.put_nowait({'type': 'http.request', 'body': b''})
+        outbox = []
+
+        def send(message):
+            outbox.append(message)
+            future = self.loop.create_future()
+            future.set_result(None)
+            return future
+
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'query_string': query_string, 'headers': []}
+        task = self.loop.create_task(self.app(scope, inbox.get, send))
+        return task, outbox
+
+    def run_request(self, *args, **kwargs):
+        task, outbox = self.request(*args, **kwargs)
+        self.loop.run_until_complete(self.asyncio.wait_for(task, 5))
+        return outbox
+
+    def test_poll_stale_version(self):
+        outbox = self.run_request('/game/1/poll', b'version=2')
+        self.assertEqual(json.loads(outbox[1]['body'].decode('utf-8')),
+                         {'version': 3, 'changed': True})
+
+    def test_poll_waits_for_change(self):
+        task, outbox = self.request('/game/1/poll', b'version=3')
+        self.loop.run_until_complete(self.asyncio.sleep(0.1))
+        self.assertEqual(outbox, [])
+        self.app.hub.publish(1, 4)
+        self.loop.run_until_complete(self.asyncio.wait_for(task, 5))
+        self.assertEqual(json.loads(outbox[1]['body'].decode('utf-8')),
+                         {'version': 4, 'changed': True})
+
+    def test_other_paths_go_to_django(self):
+        outbox = self.run_request('/game/1/')
+        self.assertEqual(outbox[0]['status'], 200)
+        self.assertEqual(outbox[1]['body'], b'/game/1/')
+
+    def test_presence_needs_player(self):
+        outbox = self.run_request('/game/1/presence', method='POST')
+        self.assertEqual(outbox[0]['status'], 403)
+        outbox = self.run_request('/game/1/presence')
+        self.assertEqual(json.loads(outbox[1]['body'].decode('utf-8')),
+                         {'players': []})
+
+
+
+class FakeRedis(object):
+
+    """Stands in for an aioredis connection (and its channel), in plain
+    functions returning futures, this module also has to import on
+    Python 2."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.closed = False
+
+    def result(self, value):
+        future = self.loop.create_future()
+        future.set_result(value)
+        return future
+
+    def subscribe(self, channel_name):
+        return self.result([self])
+
+    def wait_message(self):
+        # never a message
+        return self.loop.create_future()
+
+    def close(self):
+        self.closed = True
+
+
+@skipIf(sys.version_info < (3, 5), 'cah.asgi needs Python 3.5+')
+class RedisListenerTests(SimpleTestCase):
+
+    def setUp(self):
+        import asyncio
+        from cah import asgi
+
+        self.asyncio = asyncio
+        self.asgi = asgi
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.pool_attempts = 0
+        self.subscribers = []
+
+        def create_redis_pool(url):
+            self.pool_attempts += 1
+            future = self.loop.create_future()
+            if self.pool_attempts == 1:
+                future.set_exception(OSError('Redis is not up yet'))
+            else:
+                future.set_result(FakeRedis(self.loop))
+            return future
+
+        def create_redis(url):
+            self.subscribers.append(FakeRedis(self.loop))
+            return self.subscribers[-1].result(self.subscribers[-1])
+
+        aioredis = types.ModuleType('aioredis')
+        aioredis.create_redis_pool = create_redis_pool
+        aioredis.create_redis = create_redis
+        self.saved = (sys.modules.get('aioredis'), asgi.REDIS_RETRY_INTERVAL)
+        sys.modules['aioredis'] = aioredis
+        asgi.REDIS_RETRY_INTERVAL = 0
+        self.app = asgi.GameEventsApplication(
+            wsgi_app=lambda environ, start_response: [],
+            events_url='redis://example.com')
+
+    def tearDown(self):
+        aioredis, self.asgi.REDIS_RETRY_INTERVAL = self.saved
+        if aioredis is None:
+            del sys.modules['aioredis']
+        else:
+            sys.modules['aioredis'] = aioredis
+        self.loop.close()
+
+    def test_redis_down_at_start(self):
+        listener = self.loop.create_task(self.app.listen_redis())
+        self.loop.run_until_complete(self.asyncio.sleep(0.1))
+        self.assertEqual(self.pool_attempts, 2)
+        self.assertTrue(isinstance(self.app.presence_store,
+                                   self.asgi.RedisPresence))
+        self.assertEqual(len(self.subscribers), 1)
+        listener.cancel()
+        self.loop.run_until_complete(self.asyncio.gather(
+            listener, return_exceptions=True))
+        self.assertTrue(self.subscribers[0].closed)
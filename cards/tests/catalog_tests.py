@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from cards import catalog
+from cards.models import CardSet, WhiteCard, Game, dict2db
+from cards.tests.model_tests import create_card_set
+
+
+class CardPoolTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.first = create_card_set('first', black=2, white=3)
+        self.second = create_card_set('second', black=1, white=2)
+        # a card in both sets
+        self.second.white_card.add(self.first.white_card.all()[0])
+
+    def test_card_pool_is_deduplicated(self):
+        white, black = catalog.card_pool(['first', 'second'])
+        self.assertEqual(len(white), 5)
+        self.assertEqual(len(set(white)), 5)
+        self.assertEqual(len(black), 3)
+
+    def test_constant_queries(self):
+        catalog.catalog_version()
+        with self.assertNumQueries(2):
+            catalog.card_pool(['first', 'second', 'unknown'])
+        with self.assertNumQueries(0):
+            catalog.card_pool(['first', 'second', 'unknown'])
+        # only the combination is new, card sets are already cached
+        with self.assertNumQueries(0):
+            catalog.card_pool(['first'])
+
+    def test_pool_cache_stats(self):
+        before = catalog.card_pool_stats()
+        catalog.warm_card_pools([['second', 'first']])
+        white, black = catalog.card_pool(['first', 'second'])
+        self.assertEqual(len(white), 5)
+        self.assertEqual(len(black), 3)
+        after = catalog.card_pool_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertTrue(0 < after['hit_rate'] <= 1)
+
+    def test_import_invalidates(self):
+        white, _ = catalog.card_pool(['first'])
+        dict2db({'first': {
+            'description': 'replaced',
+            'whitecards': [{'text': 'Only card'}],
+        }}, verbosity=0, replace_existing=True)
+        white, black = catalog.card_pool(['first'])
+        self.assertEqual(white, [WhiteCard.objects.get(text='Only card').id])
+        self.assertEqual(black, [])
+
+    def test_admin_style_changes_invalidate(self):
+        catalog.card_pool(['second'])
+        self.second.white_card.add(WhiteCard.objects.create(text='New'))
+        white, _ = catalog.card_pool(['second'])
+        self.assertEqual(len(white), 4)
+
+    def test_create_game_accepts_card_set_objects(self):
+        game = Game(name='Test')
+        gamedata = game.create_game(CardSet.objects.filter(name='second'))
+        self.assertEqual(len(gamedata['white_deck']), 3)
+        self.assertEqual(len(gamedata['black_deck']), 1)
@@ -0,0 +1,157 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from cards import actions, eventlog, sharding
+from cards.models import Game, GameEvent
+from cards.tests.model_tests import create_card_set, create_started_game
+
+
+def play_round(game):
+    czar = game.gamedata['card_czar']
+    players = sorted(name for name in game.gamedata['players'] if name != czar)
+    for player_name in players:
+        card = game.gamedata['players'][player_name]['hand'][0]
+        game = actions.perform(game, 'submit', player_name=player_name,
+                               white_card_list=[card])
+    return actions.perform(game, 'pick', czar_name=czar, winner=players[0])
+
+
+class PatchTests(TestCase):
+
+    def check(self, before, after):
+        patch = eventlog.diff(before, after)
+        self.assertEqual(eventlog.apply_patch(copy.deepcopy(before), patch),
+                         after)
+        return patch
+
+    def test_diff(self):
+        before = {'deck': [1, 2, 3, 4], 'players': {'a': {'hand': [5, 6, 7]}},
+                  'round': 1, 'gone': None}
+        after = {'deck': [1, 2, 3], 'players': {'a': {'hand': [5, 7, 4]},
+                                                'b': {'hand': []}},
+                 'round': 2}
+        patch = self.check(before, after)
+        self.assertTrue(['splice', ['deck'], 3, 1, []] in patch)
+        self.assertTrue(['del', ['gone']] in patch)
+        self.assertEqual(self.check(before, before), [])
+        self.check([1, 2], [3, 1, 2, 4])
+        self.check({'a': [1]}, {'a': {'b': 1}})
+
+
+class EventLogTests(TestCase):
+
+    def setUp(self):
+        create_card_set(white=200)
+
+    def test_disabled(self):
+        game = play_round(create_started_game())
+        self.assertFalse(GameEvent.objects.exists())
+        self.assertEqual(Game.objects.get(pk=game.pk).gamedata, game.gamedata)
+
+    @override_settings(GAME_EVENT_LOG=True, GAME_SNAPSHOT_EVERY=5)
+    def test_events_and_snapshots(self):
+        game = create_started_game()
+        self.assertEqual(list(GameEvent.objects.values_list('seq', 'action')),
+                         [(0, eventlog.CREATE)])
+        for num in range(4):
+            game = play_round(game)
+        # 3 actions a round
+        self.assertEqual(game.event_seq, 12)
+        stored = Game.objects.get(pk=game.pk)
+        self.assertEqual((stored.snapshot_seq, stored.event_seq), (10, 12))
+        self.assertNotEqual(stored.gamedata, game.gamedata)
+        self.assertEqual(stored.game_state, game.game_state)
+
+        loaded = sharding.get_game(game.pk)
+        self.assertEqual(loaded.gamedata, game.gamedata)
+        self.assertEqual(loaded.gamedata['round'], 5)
+        event = GameEvent.objects.get(game=game, seq=12)
+        self.assertEqual(event.action, 'pick')
+        self.assertEqual(sorted(event.data['kwargs']), ['czar_name', 'winner'])
+
+    @override_settings(GAME_EVENT_LOG=True)
+    def test_replay(self):
+        game = create_started_game()
+        for num in range(3):
+            game = play_round(game)
+        states = [(event.seq, copy.deepcopy(gamedata), game_state)
+                  for event, gamedata, game_state in eventlog.replay(game.pk)]
+        self.assertEqual([seq for seq, _, _ in states], list(range(10)))
+        self.assertEqual(states[0][1]['round'], 1)
+        self.assertEqual(states[-1][1], game.gamedata)
+        self.assertEqual(states[-1][2], game.game_state)
+
+    @override_settings(GAME_EVENT_LOG=True)
+    def test_conflict(self):
+        game = create_started_game()
+        stale = sharding.get_game(game.pk)
+        game = play_round(game)
+        joined = actions.perform(stale, 'join', player_name='d')
+        self.assertEqual(joined.gamedata['round'], game.gamedata['round'])
+        self.assertEqual(joined.event_seq, game.event_seq + 1)
+        loaded = sharding.get_game(game.pk)
+        self.assertEqual(loaded.gamedata, joined.gamedata)
+        self.assertTrue('d' in loaded.gamedata['players'])
+
+    @override_settings(GAME_EVENT_LOG=True, GAME_SNAPSHOT_EVERY=100)
+    def test_stale_save(self):
+        game = create_started_game()
+        stale = sharding.get_game(game.pk)
+        game = play_round(game)
+        # e.g. the lobby or the admin saving the game they loaded earlier
+        stale.save()
+        stored = Game.objects.get(pk=game.pk)
+        self.assertEqual((stored.snapshot_seq, stored.event_seq), (3, 3))
+        self.assertEqual(stale.gamedata, game.gamedata)
+
+        stale = Game.objects.get(pk=game.pk)  # not caught up
+        game = play_round(sharding.get_game(game.pk))
+        stale.is_active = False
+        stale.save()
+        stored = Game.objects.get(pk=game.pk)
+        self.assertEqual((stored.snapshot_seq, stored.event_seq), (3, 6))
+        self.assertFalse(stored.is_active)
+        loaded = sharding.get_game(game.pk)
+        self.assertEqual(loaded.gamedata, game.gamedata)
+        # and actions still work
+        play_round(loaded)
+        self.assertEqual(Game.objects.get(pk=game.pk).event_seq, 9)
+
+    @override_settings(GAME_EVENT_LOG=True, GAME_SNAPSHOT_EVERY=100)
+    def test_rename(self):
+        game = create_started_game()
+        hand = game.gamedata['players']['b']['hand']
+        # joined as b, then signed up as bob
+        User.objects.create_user('bob', password='secret')
+        self.client.login(username='bob', password='secret')
+        session = self.client.session
+        session['session_details'] = {'name': 'b'}
+        session.save()
+        # signed cookie sessions, the cookie is the session
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        response = self.client.get(reverse('game-view', kwargs={'pk': game.pk}))
+        self.assertEqual(response.context_data['player_name'], 'bob')
+        event = GameEvent.objects.get(game=game, seq=game.event_seq + 1)
+        self.assertEqual(event.action, 'rename')
+
+        game = play_round(sharding.get_game(game.pk))
+        players = game.gamedata['players']
+        self.assertEqual(sorted(players), ['a', 'bob', 'c'])
+        self.assertEqual(players['bob']['hand'][:len(hand) - 1], hand[1:])
+        states = list(eventlog.replay(game.pk))
+        self.assertEqual(states[-1][1], game.gamedata)
+
+    def test_turned_off(self):
+        with self.settings(GAME_EVENT_LOG=True):
+            game = play_round(create_started_game())
+        loaded = sharding.get_game(game.pk)
+        self.assertEqual(loaded.gamedata, game.gamedata)
+        loaded = actions.perform(loaded, 'join', player_name='d')
+        stored = Game.objects.get(pk=game.pk)
+        self.assertEqual(stored.snapshot_seq, stored.event_seq)
+        self.assertEqual(stored.gamedata, loaded.gamedata)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import io
+from collections import OrderedDict
+
+from django.test import SimpleTestCase
+
+from game import CardsParser, DEFAULT_BLANK_MARKER
+
+CARDS_FILE = u'cards=First card.<>Caf\xe9 ™ au lait.<>Why __________?<>First card.<>Last'.encode('utf-8')
+
+
+class CardsParserTests(SimpleTestCase):
+
+    def parse(self, chunk_size, **kwargs):
+        return list(CardsParser().itercards(
+            io.BytesIO(CARDS_FILE), chunk_size=chunk_size, **kwargs))
+
+    def test_itercards(self):
+        self.assertEqual(self.parse(len(CARDS_FILE)), [
+            u'First card.',
+            u'Caf\xe9 ™ au lait.',
+            u'Why __________?',
+            u'Last',
+        ])
+
+    def test_chunk_boundaries(self):
+        # every chunk size splits the file somewhere else, inside "<>",
+        # "cards=", the blank marker and the multi-byte characters
+        expected = self.parse(len(CARDS_FILE), look_for_blanks=True)
+        self.assertEqual(expected[2], u'Why %s?' % DEFAULT_BLANK_MARKER)
+        for chunk_size in range(1, len(CARDS_FILE)):
+            self.assertEqual(
+                self.parse(chunk_size, look_for_blanks=True), expected,
+                'chunk size %d' % chunk_size)
+
+    def test_split_separator(self):
+        separator = CARDS_FILE.index(b'<>')
+        # the first chunk ends with "<"
+        self.assertEqual(self.parse(separator + 1)[:2], [
+            u'First card.', u'Caf\xe9 ™ au lait.'])
+
+    def test_split_character(self):
+        # the first chunk ends with the first byte of the trademark sign
+        trademark = CARDS_FILE.index(u'™'.encode('utf-8'))
+        self.assertEqual(self.parse(trademark + 1)[1],
+                         u'Caf\xe9 ™ au lait.')
+
+    def test_seen(self):
+        seen = OrderedDict.fromkeys([u'Last', u'Existing'])
+        self.assertEqual(self.parse(4, seen=seen), [
+            u'First card.', u'Caf\xe9 ™ au lait.', u'Why __________?'])
+        self.assertEqual(list(seen), [
+            u'Last', u'Existing', u'First card.', u'Caf\xe9 ™ au lait.',
+            u'Why __________?'])
+
+    def test_parsefile(self):
+        result = CardsParser().parsefile(
+            io.BytesIO(CARDS_FILE), existing_cards=[u'Existing'])
+        self.assertEqual(result, sorted([
+            u'Existing', u'First card.', u'Caf\xe9 ™ au lait.',
+            u'Why __________?', u'Last']))
@@ -0,0 +1,76 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from cards import metrics
+from cards.tests.model_tests import create_card_set, create_started_game
+
+GAME_VIEW = 'view="cards.views.game_views.GameView"'
+
+
+def sample(text, line_start):
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError('%r not in metrics' % line_start)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        metrics.reset()
+        create_card_set()
+        self.game = create_started_game()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def scrape(self):
+        User.objects.create_superuser('staff', 'staff@example.com', 'secret')
+        self.client.login(username='staff', password='secret')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode('utf-8')
+
+    def test_game_view(self):
+        for _ in range(2):
+            self.client.get(reverse('game-view', kwargs={'pk': self.game.id}))
+        text = self.scrape()
+        self.assertEqual(sample(text, 'cah_requests_total{%s}' % GAME_VIEW), 2)
+        self.assertEqual(sample(
+            text, 'cah_request_seconds_count{%s}' % GAME_VIEW), 2)
+        self.assertEqual(sample(
+            text, 'cah_request_seconds_bucket{%s,le="+Inf"}' % GAME_VIEW), 2)
+        self.assertTrue(sample(text, 'cah_db_queries_sum{%s}' % GAME_VIEW) > 0)
+        self.assertTrue(sample(
+            text, 'cah_template_seconds_sum{%s}' % GAME_VIEW) > 0)
+        self.assertTrue(sample(
+            text, 'cah_gamedata_decoded_bytes_total{%s}' % GAME_VIEW) > 0)
+
+    def test_lobby_cache(self):
+        # the game list is cached
+        self.client.get(reverse('lobby-view'))
+        self.client.get(reverse('lobby-view'))
+        text = self.scrape()
+        lobby_view = 'view="cards.views.game_views.LobbyView"'
+        self.assertEqual(sample(
+            text, 'cah_cache_misses_total{%s}' % lobby_view), 1)
+        self.assertEqual(sample(
+            text, 'cah_cache_l2_hits_total{%s}' % lobby_view), 1)
+
+    def test_staff_only(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_histogram_buckets(self):
+        metrics.record('view', {'seconds': 0.03, 'db_queries': 3})
+        metrics.record('view', {'seconds': 3})
+        text = metrics.render_prometheus()
+        self.assertTrue('cah_request_seconds_bucket{view="view",le="0.025"} 0\n' in text)
+        self.assertTrue('cah_request_seconds_bucket{view="view",le="0.05"} 1\n' in text)
+        self.assertTrue('cah_request_seconds_bucket{view="view",le="5"} 2\n' in text)
+        self.assertTrue('cah_db_queries_bucket{view="view",le="5"} 2\n' in text)
+        self.assertTrue('cah_db_queries_sum{view="view"} 3.0\n' in text)
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
 from cards.models import (
@@ -6,11 +7,75 @@ from cards.models import (
     BlackCard,
     WhiteCard,
     CardSet,
+    StandardSubmission,
+    GAMESTATE_SELECTION,
+    dict2db,
     )
 
 
+def create_card_set(name='test', black=5, white=60):
+    card_set = CardSet.objects.create(name=name, description=name)
+    for num in range(black):
+        card_set.black_card.add(
+            BlackCard.objects.create(text=u'%s black %d \uFFFD' % (name, num)))
+    for num in range(white):
+        card_set.white_card.add(
+            WhiteCard.objects.create(text=u'%s white %d' % (name, num)))
+    return card_set
+
+
+def create_started_game(players=('a', 'b', 'c'), card_sets=('test',)):
+    game = Game(name='Test')
+    game.gamedata = game.create_game(list(card_sets))
+    for player_name in players:
+        game.add_player(player_name)
+    game.start_new_round(winner_id=players[0])
+    game.save()
+    return game
+
+
 class GameModelTests(TestCase):
-    pass
+
+    def setUp(self):
+        create_card_set()
+        self.game = create_started_game()
+
+    def submit_all(self):
+        for player_name in ('b', 'c'):
+            card = self.game.gamedata['players'][player_name]['hand'][0]
+            self.game.submit_white_cards(player_name, [card])
+
+    def test_submissions_carry_round_and_player(self):
+        self.submit_all()
+        self.assertEqual(self.game.game_state, GAMESTATE_SELECTION)
+        submission_ids = self.game.gamedata['submission_ids']
+        self.assertEqual(sorted(submission_ids), ['b', 'c'])
+        submission = StandardSubmission.objects.get(pk=submission_ids['c'])
+        self.assertEqual(submission.player_name, 'c')
+        self.assertEqual(submission.round, self.game.gamedata['round'])
+
+    def test_pick_winner_marks_only_that_submission(self):
+        self.submit_all()
+        winning_id = self.game.gamedata['submission_ids']['c']
+        round_number = self.game.gamedata['round']
+        self.game.pick_winner('a', 'c')
+        self.assertEqual(
+            list(StandardSubmission.objects.filter(
+                winner=True).values_list('id', flat=True)),
+            [winning_id])
+        self.assertEqual(self.game.gamedata['card_czar'], 'c')
+        self.assertEqual(self.game.gamedata['round'], round_number + 1)
+        self.assertEqual(self.game.gamedata['players']['c']['wins'], 1)
+
+    def test_player_leaving_during_selection_reuses_submissions(self):
+        self.game.add_player('d')
+        self.submit_all()
+        card = self.game.gamedata['players']['d']['hand'][0]
+        self.game.submit_white_cards('d', [card])
+        self.game.del_player('b')
+        self.assertEqual(StandardSubmission.objects.count(), 3)
+        self.assertEqual(
+            sorted(self.game.gamedata['submission_ids']), ['c', 'd'])
 
 
 class PlayerModelTests(TestCase):
@@ -25,4 +90,57 @@ class WhiteCardModelTests(TestCase):
     pass
 
 class CardSetModelTests(TestCase):
-    pass
\ No newline at end of file
+
+    def import_cards(self, num_black=3, num_white=7, **kwargs):
+        return dict2db({'test': {
+            'description': 'test',
+            'blackcards': ({'text': 'Black %d' % num, 'pick': 1}
+                           for num in range(num_black)),
+            'whitecards': ({'text': 'White %d' % num}
+                           for num in range(num_white)),
+        }}, verbosity=0, chunk_size=2, **kwargs)
+
+    def test_dict2db(self):
+        self.assertEqual(self.import_cards(), [('test', 3, 7)])
+        card_set = CardSet.objects.get(name='test')
+        self.assertEqual(card_set.black_card.count(), 3)
+        self.assertEqual(
+            sorted(card_set.white_card.values_list('text', flat=True)),
+            ['White %d' % num for num in range(7)])
+
+    def test_dict2db_replace_existing(self):
+        self.import_cards()
+        self.import_cards(num_black=1, num_white=2, replace_existing=True)
+        self.assertEqual(BlackCard.objects.count(), 1)
+        self.assertEqual(WhiteCard.objects.count(), 2)
+        self.assertEqual(CardSet.objects.get().white_card.count(), 2)
+
+    def test_dict2db_shares_existing_cards(self):
+        self.import_cards()
+        result = dict2db({'other': {
+            'description': 'other',
+            'whitecards': [
+                {'text': 'white  0'},  # same card, whitespace/case differ
+                {'text': 'WHITE 0'},
+                {'text': 'Something new'},
+            ],
+        }}, verbosity=0)
+        self.assertEqual(result, [('other', 0, 2)])
+        self.assertEqual(WhiteCard.objects.count(), 8)
+        self.assertEqual(
+            CardSet.objects.get(name='other').white_card.count(), 2)
+
+        # replacing 'test' keeps the card 'other' still uses
+        self.import_cards(num_black=0, num_white=0, replace_existing=True)
+        self.assertEqual(
+            list(WhiteCard.objects.order_by('text').values_list(
+                'text', flat=True)),
+            ['Something new', 'White 0'])
+
+    def test_duplicate_card_fails_validation(self):
+        WhiteCard.objects.create(text='Hello')
+        self.assertRaises(
+            ValidationError, WhiteCard(text=' hello ').validate_unique)
+        # different pick makes a different black card
+        BlackCard.objects.create(text='Why?', pick=1)
+        BlackCard(text='Why?', pick=2).validate_unique()
\ No newline at end of file
@@ -0,0 +1,280 @@
+"""Query count and time budgets of the views, for games of a realistic
+size: two full card sets, twenty players and forty rounds of history.
+
+The query budgets are tight, a view doing more queries than before is a
+regression. The time budgets are generous, they only catch something
+going badly wrong (a query per card or per submission). Set
+CAH_PERF_RESULTS to a file name to have the measurements written there
+as JSON, to compare them between commits:
+
+    CAH_PERF_RESULTS=perf.json python manage.py test cards.tests.perf_tests
+
+"""
+import json
+import os
+import platform
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from cards import sharding
+from cards.models import (
+    BlackCard,
+    CardSet,
+    Game,
+    GAMESTATE_SELECTION,
+    GAMESTATE_SUBMISSION,
+    WhiteCard,
+)
+
+CARD_SETS = (('base', 90, 460), ('expansion', 60, 300))
+PLAYERS = ['player%d' % num for num in range(20)]
+ROUNDS = 40
+LOBBY_GAMES = 50
+PASSWORD = 'secret'
+
+# name: measurement, for CAH_PERF_RESULTS
+results = {}
+
+
+def write_results():
+    path = os.environ.get('CAH_PERF_RESULTS')
+    if not path:
+        return
+    with open(path, 'w') as f:
+        json.dump({
+            'created': time.time(),
+            'python': platform.python_version(),
+            'views': results,
+        }, f, indent=4, sort_keys=True)
+
+
+def create_card_sets():
+    for name, num_black, num_white in CARD_SETS:
+        card_set = CardSet.objects.create(name=name, description=name)
+        card_set.black_card.add(*[
+            BlackCard.objects.create(
+                text=u'%s question %d, ____ and ____?' % (name, num),
+                pick=1 + num % 2)
+            for num in range(num_black)])
+        card_set.white_card.add(*[
+            WhiteCard.objects.create(text=u'%s answer number %d' % (name, num))
+            for num in range(num_white)])
+
+
+def play_round(game):
+    """Everyone submits, the czar picks the first player's submission
+    (player0 and player1 take turns winning)."""
+    czar = game.gamedata['card_czar']
+    pick = BlackCard.objects.get(id=game.gamedata['current_black_card']).pick
+    for player_name in PLAYERS:
+        if player_name != czar:
+            hand = game.gamedata['players'][player_name]['hand']
+            game.submit_white_cards(player_name, hand[:pick])
+    game.pick_winner(czar, [name for name in PLAYERS if name != czar][0])
+
+
+def create_big_game(name='Big game'):
+    game = Game(name=name)
+    game.gamedata = game.create_game([card_set for card_set, _, _ in CARD_SETS])
+    game.save()
+    for player_name in PLAYERS:
+        game.add_player(player_name)
+    game.start_new_round(winner_id=PLAYERS[0])
+    for _ in range(ROUNDS):
+        play_round(game)
+    game.save()
+    return game
+
+
+def card_set_json(num_black, num_white):
+    return json.dumps({'imported': {
+        'description': 'imported',
+        'blackcards': [{'text': 'Imported question %d ____' % num, 'pick': 1}
+                       for num in range(num_black)],
+        'whitecards': [{'text': 'Imported answer %d' % num}
+                       for num in range(num_white)],
+    }})
+
+
+class PerfTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_card_sets()
+        cls.game_id = create_big_game().id
+        # the lobby lists every active game
+        gamedata = Game.objects.get(id=cls.game_id).gamedata
+        Game.objects.bulk_create([
+            Game(name='Lobby game %d' % num, gamedata=gamedata)
+            for num in range(LOBBY_GAMES)])
+        for player_name in PLAYERS:
+            User.objects.create_user(player_name, password=PASSWORD)
+        User.objects.create_superuser('staff', 'staff@example.com', PASSWORD)
+
+    @classmethod
+    def tearDownClass(cls):
+        super(PerfTestCase, cls).tearDownClass()
+        write_results()
+
+    def setUp(self):
+        # measure without the game, catalog and page caches
+        django_cache.clear()
+        self.game = sharding.get_game(self.game_id)
+
+    def login(self, username):
+        self.assertTrue(self.client.login(username=username,
+                                          password=PASSWORD))
+        django_cache.clear()
+
+    def set_state(self, game_state):
+        """Play until the game is in `game_state`."""
+        game = self.game
+        czar = game.gamedata['card_czar']
+        if game_state == GAMESTATE_SELECTION:
+            pick = BlackCard.objects.get(
+                id=game.gamedata['current_black_card']).pick
+            for player_name in PLAYERS:
+                if player_name != czar:
+                    game.submit_white_cards(
+                        player_name,
+                        game.gamedata['players'][player_name]['hand'][:pick])
+        game.save()
+        self.assertEqual(game.game_state, game_state)
+        django_cache.clear()
+        return czar
+
+    def measure(self, name, max_queries, max_seconds, func):
+        """Runs `func` and checks it made at most `max_queries` queries (on
+        all the databases) and took at most `max_seconds`. Returns what
+        `func` returned."""
+        captures = [CaptureQueriesContext(connections[alias])
+                    for alias in connections]
+        for capture in captures:
+            capture.__enter__()
+        start = time.time()
+        try:
+            result = func()
+        finally:
+            seconds = time.time() - start
+            for capture in captures:
+                capture.__exit__(None, None, None)
+        queries = sum(len(capture) for capture in captures)
+        results[name] = {
+            'queries': queries,
+            'max_queries': max_queries,
+            'seconds': seconds,
+            'max_seconds': max_seconds,
+        }
+        self.assertTrue(
+            queries <= max_queries, '%s made %d queries, budget %d:\n%s' % (
+                name, queries, max_queries, '\n'.join(
+                    query['sql'] for capture in captures
+                    for query in capture.captured_queries)))
+        self.assertTrue(seconds <= max_seconds, '%s took %.3fs, budget %.3fs'
+                        % (name, seconds, max_seconds))
+        return result
+
+    def get(self, name, max_queries, max_seconds, url, status=200, **kwargs):
+        response = self.measure(name, max_queries, max_seconds,
+                                lambda: self.client.get(url, **kwargs))
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def post(self, name, max_queries, max_seconds, url, data, status=302):
+        response = self.measure(name, max_queries, max_seconds,
+                                lambda: self.client.post(url, data))
+        self.assertEqual(response.status_code, status)
+        return response
+
+
+class LobbyPerfTests(PerfTestCase):
+
+    def test_lobby(self):
+        self.get('lobby', 1, 1, reverse('lobby-view'))
+
+    def test_lobby_staff(self):
+        self.login('staff')
+        self.get('lobby-staff', 2, 1, reverse('lobby-view'))
+
+
+class GamePerfTests(PerfTestCase):
+
+    def url(self, name):
+        return reverse(name, kwargs={'pk': self.game_id})
+
+    def test_game_view_czar(self):
+        self.login(self.set_state(GAMESTATE_SELECTION))
+        response = self.get('game-view-czar', 4, 1, self.url('game-view'))
+        self.assertTrue(response.context_data['show_form'])
+
+    def test_game_view_player(self):
+        czar = self.set_state(GAMESTATE_SUBMISSION)
+        self.login([name for name in PLAYERS if name != czar][0])
+        response = self.get('game-view-player', 6, 1, self.url('game-view'))
+        self.assertTrue(response.context_data['show_form'])
+
+    def test_game_view_observer(self):
+        self.get('game-view-observer', 3, 1, self.url('game-view'))
+        self.get('game-view-observer-cached', 0, 0.5, self.url('game-view'))
+
+    def test_game_view_submit(self):
+        czar = self.set_state(GAMESTATE_SUBMISSION)
+        player_name = [name for name in PLAYERS if name != czar][0]
+        self.login(player_name)
+        hand = self.game.gamedata['players'][player_name]['hand']
+        pick = BlackCard.objects.get(
+            id=self.game.gamedata['current_black_card']).pick
+        data = dict(('card_selection_%d' % (num + 1), card_id)
+                    for num, card_id in enumerate(hand[:pick]))
+        self.post('game-view-submit', 7, 1, self.url('game-view'), data)
+
+    def test_game_view_pick(self):
+        czar = self.set_state(GAMESTATE_SELECTION)
+        self.login(czar)
+        # won before, a first win also creates the player's stats rows
+        winner = [name for name in PLAYERS if name != czar][0]
+        self.assertTrue(self.game.gamedata['players'][winner]['wins'])
+        # 3 of them for the round's RoundWin row, in its own savepoint
+        self.post('game-view-pick', 18, 1, self.url('game-view'),
+                  {'card_selection_1': winner})
+
+    def test_join(self):
+        self.get('game-join-form', 1, 1, self.url('game-join-view'))
+        self.client.post(self.url('game-join-view'),
+                         {'player_name': 'newcomer'})
+        django_cache.clear()
+        self.get('game-join', 4, 1, self.url('game-join-view'), status=302)
+        self.assertTrue('newcomer' in sharding.get_game(
+            self.game_id).gamedata['players'])
+
+    def test_exit(self):
+        self.login(PLAYERS[-1])
+        self.get('game-exit-form', 2, 1, self.url('game-exit-view'))
+        self.post('game-exit', 5, 1, self.url('game-exit-view'),
+                  {'really_exit': 'yes'})
+        self.assertFalse(PLAYERS[-1] in sharding.get_game(
+            self.game_id).gamedata['players'])
+
+    def test_qrcode(self):
+        self.get('game-qrcode', 1, 1, self.url('game-qrcode-view'))
+
+    def test_api(self):
+        response = self.get('game-detail', 1, 1, self.url('game-detail'))
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['pk'],
+                         self.game_id)
+
+
+class ImportPerfTests(PerfTestCase):
+
+    def test_import_cards(self):
+        self.login('staff')
+        self.get('import-cards', 14, 5, reverse('import-cards'),
+                 data={'json': card_set_json(90, 460)})
+        self.assertEqual(
+            CardSet.objects.get(name='imported').white_card.count(), 460)
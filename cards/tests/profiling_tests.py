@@ -0,0 +1,68 @@
+import marshal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from cards import profiling
+from cards.tests.model_tests import create_card_set, create_started_game
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        create_card_set()
+        self.game = create_started_game()
+        self.url = reverse('game-view', kwargs={'pk': self.game.id})
+
+    def login_staff(self):
+        User.objects.create_superuser('staff', 'staff@example.com', 'secret')
+        self.client.login(username='staff', password='secret')
+
+    def test_only_staff_asks(self):
+        self.client.get(self.url + '?profile=1')
+        self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(profiling.profiles(), [])
+
+    def test_profile_stored(self):
+        self.login_staff()
+        self.assertEqual(self.client.get(self.url + '?profile=1').status_code,
+                         200)
+        self.client.get(self.url)
+        profiles = profiling.profiles()
+        self.assertEqual(len(profiles), 1)
+        profile = profiles[0]
+        self.assertEqual(profile['game_id'], self.game.id)
+        self.assertEqual(profile['players'], 3)
+        self.assertTrue(profile['gamedata_bytes'] > 0)
+        self.assertEqual(profile['view'], 'cards.views.game_views.GameView')
+        self.assertEqual(profile['status'], 200)
+
+        response = self.client.get(reverse('profiles'))
+        self.assertContains(response, '/game/%d/?profile=1' % self.game.id)
+        response = self.client.get(reverse('profile', args=(profile['seq'],)))
+        self.assertContains(response, 'get_context_data')
+
+        response = self.client.get(
+            reverse('profile-download', args=(profile['seq'],)))
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(name == 'get_context_data'
+                            for _, _, name in stats))
+
+    def test_sampled_ring_buffer(self):
+        with self.settings(PROFILE_SAMPLE_RATE=1, PROFILE_BUFFER_SIZE=2):
+            for _ in range(3):
+                self.client.get(self.url)
+            seqs = [profile['seq'] for profile in profiling.profiles()]
+            self.assertEqual(len(seqs), 2)
+            self.assertEqual(profiling.get(min(seqs) - 1), None)
+        self.login_staff()
+        self.assertEqual(self.client.get(
+            reverse('profile', args=(max(seqs) + 5,))).status_code, 404)
+
+    def test_pages_staff_only(self):
+        response = self.client.get(reverse('profiles'))
+        self.assertEqual(response.status_code, 302)
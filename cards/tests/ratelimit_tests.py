@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from cards import ratelimit
+from cards.tests.model_tests import create_card_set, create_started_game
+
+
+class TokenBucketTests(TestCase):
+
+    def setUp(self):
+        ratelimit.reset()
+
+    def tearDown(self):
+        ratelimit.reset()
+
+    def test_take_local(self):
+        take = ratelimit._take_local
+        self.assertEqual(take('x', 2, 2, 100), 0)
+        self.assertEqual(take('x', 2, 2, 100), 0)
+        self.assertEqual(take('x', 2, 2, 100), 0.5)
+        self.assertEqual(take('y', 2, 2, 100), 0)
+        self.assertEqual(take('x', 2, 2, 100.5), 0)
+        # refills up to the burst only
+        self.assertEqual(take('x', 2, 2, 200), 0)
+        self.assertEqual(take('x', 2, 2, 200), 0)
+        self.assertTrue(take('x', 2, 2, 200) > 0)
+
+
+@override_settings(RATE_LIMITS={'game-api': (0.5, 3), 'game-action': (1, 1)})
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        ratelimit.reset()
+        django_cache.clear()
+        create_card_set()
+        self.game = create_started_game()
+
+    def tearDown(self):
+        ratelimit.reset()
+
+    def test_api_limited(self):
+        url = reverse('game-detail', kwargs={'pk': self.game.id})
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        # other clients have their own budget
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_session_cookies(self):
+        url = reverse('game-detail', kwargs={'pk': self.game.id})
+        # made up session cookies do not make new clients
+        for num in range(3):
+            self.client.cookies['sessionid'] = 'madeup%08d' % num
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.cookies['sessionid'] = 'madeup99999999'
+        self.assertEqual(self.client.get(url).status_code, 429)
+        # a real session does, up to the address's budget
+        User.objects.create_user('player', password='secret')
+        self.client.login(username='player', password='secret')
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 429)
+        with self.settings(RATE_LIMIT_ADDRESS_FACTOR=1):
+            self.client.logout()
+            self.client.login(username='player', password='secret')
+            self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_anonymous_session(self):
+        url = reverse('game-detail', kwargs={'pk': self.game.id})
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 429)
+        # joined a game without logging in
+        session = self.client.session
+        session['session_details'] = {'name': 'b'}
+        session.save()
+        # signed cookie sessions, the cookie is the session
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_forwarded_for(self):
+        url = reverse('game-detail', kwargs={'pk': self.game.id})
+        with self.settings(RATE_LIMIT_TRUST_X_FORWARDED_FOR=True):
+            for num in range(4):
+                response = self.client.get(
+                    url, HTTP_X_FORWARDED_FOR='10.0.0.%d, 10.0.1.1' % num)
+            self.assertEqual(response.status_code, 429)
+            response = self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.1.2')
+            self.assertEqual(response.status_code, 200)
+
+    def test_game_view_posts_limited(self):
+        url = reverse('game-view', kwargs={'pk': self.game.id})
+        self.assertNotEqual(self.client.post(url, {}).status_code, 429)
+        self.assertEqual(self.client.post(url, {}).status_code, 429)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_top_talkers(self):
+        url = reverse('game-detail', kwargs={'pk': self.game.id})
+        for _ in range(4):
+            self.client.get(url)
+        self.client.get(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(ratelimit.top_talkers(), [
+            ('127.0.0.1', 'game-api', 4, 1),
+            ('10.0.0.2', 'game-api', 1, 0),
+        ])
+
+        page = reverse('top-talkers')
+        self.assertEqual(self.client.get(page).status_code, 302)
+        User.objects.create_superuser('staff', 'staff@example.com', 'secret')
+        self.client.login(username='staff', password='secret')
+        response = self.client.get(page)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '10.0.0.2')
@@ -0,0 +1,125 @@
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache as django_cache
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import TransactionTestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from cards import catalog, gamestate, routers, search
+from cards.models import CardSet, CatalogVersion, Game, WhiteCard
+from cards.routers import primary_reads, replica_reads
+
+
+# not TestCase, its transaction would send every read to the primary
+@override_settings(DATABASE_REPLICA='replica')
+class ReplicaRouterTests(TransactionTestCase):
+
+    def setUp(self):
+        routers.reset()
+
+    def tearDown(self):
+        routers.reset()
+
+    def test_catalog_reads_use_replica(self):
+        self.assertEqual(WhiteCard.objects.all().db, 'replica')
+        self.assertEqual(CardSet.white_card.through.objects.all().db, 'replica')
+        self.assertEqual(CatalogVersion.objects.all().db, 'default')
+
+    def test_game_reads_use_primary(self):
+        self.assertEqual(Game.objects.all().db, 'default')
+        with replica_reads():
+            self.assertEqual(Game.objects.all().db, 'replica')
+        self.assertEqual(Game.objects.all().db, 'default')
+
+    def test_primary_reads(self):
+        with primary_reads():
+            self.assertEqual(WhiteCard.objects.all().db, 'default')
+            with replica_reads():
+                self.assertEqual(Game.objects.all().db, 'default')
+        self.assertEqual(WhiteCard.objects.all().db, 'replica')
+
+    def test_versioned_cache_fills_use_primary(self):
+        # a lagging replica's data would be cached as the new version's
+        django_cache.clear()
+        search.reset()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            catalog.card_set_ids(['test'])
+            search.card_index(WhiteCard)
+            with replica_reads():
+                gamestate.lobby_games()
+        self.assertEqual(replica.captured_queries, [])
+
+    def test_transactions_use_primary(self):
+        with transaction.atomic():
+            self.assertEqual(WhiteCard.objects.all().db, 'default')
+
+    def test_write_outside_request(self):
+        # e.g. a management command, no request to pin
+        WhiteCard.objects.create(text='new')
+        self.assertEqual(WhiteCard.objects.all().db, 'replica')
+
+    def test_writes_use_primary(self):
+        self.assertEqual(routers.ReplicaRouter().db_for_write(WhiteCard),
+                         'default')
+
+    def test_no_migrations_on_replica(self):
+        router = routers.ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'cards'))
+        self.assertEqual(router.allow_migrate('default', 'cards'), None)
+
+    @override_settings(DATABASE_REPLICA=None)
+    def test_disabled(self):
+        self.assertEqual(WhiteCard.objects.all().db, 'default')
+
+
+@override_settings(DATABASE_REPLICA='replica', REPLICA_PIN_SECONDS=30)
+class PrimaryPinningMiddlewareTests(TransactionTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = routers.PrimaryPinningMiddleware()
+
+    def tearDown(self):
+        routers.reset()
+
+    def test_read_only_request(self):
+        request = self.factory.get('/')
+        self.middleware.process_request(request)
+        self.assertEqual(WhiteCard.objects.all().db, 'replica')
+        response = self.middleware.process_response(request, HttpResponse())
+        self.assertFalse(routers.PIN_COOKIE in response.cookies)
+
+    def test_write_pins_to_primary(self):
+        request = self.factory.get('/')
+        self.middleware.process_request(request)
+        WhiteCard.objects.create(text='new')
+        with replica_reads():
+            self.assertEqual(WhiteCard.objects.all().db, 'default')
+            self.assertEqual(Game.objects.all().db, 'default')
+        self.middleware.process_response(request, HttpResponse())
+        # not after the request
+        self.assertEqual(WhiteCard.objects.all().db, 'replica')
+
+    def test_session_save_does_not_pin(self):
+        request = self.factory.get('/')
+        self.middleware.process_request(request)
+        SessionStore().save()
+        self.assertEqual(WhiteCard.objects.all().db, 'replica')
+        response = self.middleware.process_response(request, HttpResponse())
+        self.assertFalse(routers.PIN_COOKIE in response.cookies)
+
+    def test_pinned_after_write(self):
+        request = self.factory.post('/')
+        self.middleware.process_request(request)
+        self.assertEqual(WhiteCard.objects.all().db, 'default')
+        WhiteCard.objects.create(text='new')
+        response = self.middleware.process_response(request, HttpResponse())
+        pin = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(pin['max-age'], 30)
+
+        # the next request from the same browser still uses the primary
+        request = self.factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = pin.value
+        self.middleware.process_request(request)
+        self.assertEqual(WhiteCard.objects.all().db, 'default')
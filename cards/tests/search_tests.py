@@ -0,0 +1,113 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from cards import search
+from cards.models import BlackCard, SubmittedCard, WhiteCard
+from cards.tests.model_tests import create_card_set
+
+
+class TrigramIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = search.TrigramIndex([
+            (1, u'A windmill full of corpses.'),
+            (2, u'Full frontal nudity.'),
+            (3, u'The Pope.'),
+            (4, u'Why can\'t I sleep at night? ____'),
+        ])
+
+    def test_normalize(self):
+        self.assertEqual(search.normalize(u'  Why CAN\'T I\tsleep? ____ '),
+                         u'why can t i sleep')
+
+    def test_contains(self):
+        self.assertEqual(self.index.contains(u'FULL'), set([1, 2]))
+        self.assertEqual(self.index.contains(u'full corpse'), set([1]))
+        self.assertEqual(self.index.contains(u'mill'), set([1]))
+        self.assertEqual(self.index.contains(u'at'), set([4]))
+        self.assertEqual(self.index.contains(u'pope windmill'), set())
+        self.assertEqual(self.index.contains(u'?!'), set())
+
+    def test_similar(self):
+        self.assertEqual(self.index.similar(u'the pope'), [(1.0, 3)])
+        matches = self.index.similar(u'A windmill full of corpse')
+        self.assertEqual([card_id for _, card_id in matches], [1])
+        self.assertTrue(0.5 < matches[0][0] < 1)
+        self.assertEqual(self.index.similar(u'Something else entirely'), [])
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        search.reset()
+        create_card_set()
+
+    def test_contains(self):
+        self.assertEqual(
+            [card.text for card in search.contains(WhiteCard, u'White 42')],
+            [u'test white 42'])
+        self.assertEqual(search.contains(BlackCard, u'black').count(), 5)
+
+    def test_index_follows_catalog(self):
+        self.assertEqual(search.similar(WhiteCard, u'A brand new card'), [])
+        card = WhiteCard.objects.create(text=u'A brand new card.')
+        self.assertEqual(search.similar(WhiteCard, u'A brand new card'),
+                         [(1.0, card)])
+
+
+class SubmitCardTests(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        search.reset()
+        create_card_set()
+        self.user = User.objects.create_user('submitter', password='secret')
+        self.client.login(username='submitter', password='secret')
+
+    def submit(self, text, card_type='1', **data):
+        data.update(submitter=self.user.id, card_type=card_type, text=text)
+        return self.client.post(reverse('submit-card'), data)
+
+    def test_new_card(self):
+        response = self.submit(u'Something completely different')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(SubmittedCard.objects.count(), 1)
+
+        response = self.submit(u'something completely different')
+        self.assertContains(response, 'already submitted')
+        self.assertEqual(SubmittedCard.objects.count(), 1)
+
+    def test_duplicate(self):
+        response = self.submit(u'Test  White 3')
+        self.assertContains(response, 'This card already exists')
+        # the same words are only much like it
+        response = self.submit(u'Test White, 3!')
+        self.assertContains(response, 'There are cards much like this one')
+        # a black card with the same words is not a duplicate
+        response = self.submit(u'Test White, 3!', card_type='2')
+        self.assertEqual(response.status_code, 302)
+
+    def test_black_card_blanks(self):
+        response = self.submit(u'Test black 1 \uFFFD', card_type='2')
+        self.assertContains(response, 'This card already exists')
+        # another blank is another card
+        response = self.submit(u'Test black 1 \uFFFD \uFFFD', card_type='2')
+        self.assertContains(response, 'There are cards much like this one')
+        self.assertNotContains(response, 'This card already exists')
+        # submissions are pick 1, this is another card
+        BlackCard.objects.create(text=u'Two of \uFFFD and \uFFFD', pick=2)
+        response = self.submit(u'Two of \uFFFD and \uFFFD', card_type='2')
+        self.assertNotContains(response, 'This card already exists')
+
+    def test_near_duplicate(self):
+        response = self.submit(u'Test white 3 and 4')
+        self.assertContains(response, 'There are cards much like this one')
+        self.assertContains(response, 'test white 3')
+        self.assertEqual(SubmittedCard.objects.count(), 0)
+
+        response = self.submit(u'Test white 3 and 4', submit_anyway='on')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(SubmittedCard.objects.count(), 1)
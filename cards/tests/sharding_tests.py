@@ -0,0 +1,251 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.urlresolvers import reverse
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+
+from cards import actions, analytics, archive, eventlog, gamestate, sharding
+from cards.models import (
+    AnalyticsWatermark,
+    Game,
+    GameArchive,
+    GameEvent,
+    GameStanding,
+    PlayerStats,
+    StandardSubmission,
+    WhiteCardStats,
+)
+from cards.tests.model_tests import create_card_set, create_started_game
+
+SHARDS = ['default', 'shard1']
+
+
+def white_card_ids(submission):
+    # the white cards are on 'default', the links on the submission's shard
+    through = StandardSubmission.submissions.through
+    return list(through.objects.using(submission._state.db).filter(
+        standardsubmission=submission).values_list('whitecard_id', flat=True))
+
+
+def create_games():
+    """Returns a started game on each shard, by shard alias."""
+    first = create_started_game()
+    # consecutive ids, so on the other shard and the name is not taken
+    second = create_started_game()
+    second.name = 'Second'
+    second.save()
+    return dict((game._state.db, game) for game in (first, second))
+
+
+def submit_all(game):
+    for player_name in ('b', 'c'):
+        card = game.gamedata['players'][player_name]['hand'][0]
+        game.submit_white_cards(player_name, [card])
+
+
+class ShardingTests(TransactionTestCase):
+
+    multi_db = True
+
+    def setUp(self):
+        django_cache.clear()
+        create_card_set()
+
+    def test_disabled(self):
+        self.assertFalse(sharding.sharding_enabled())
+        game = create_started_game()
+        self.assertEqual(game._state.db, 'default')
+        self.assertEqual(sharding.get_game(game.id), game)
+
+    @override_settings(GAME_SHARDS=SHARDS)
+    def test_games_spread_over_shards(self):
+        games = create_games()
+        self.assertEqual(sorted(games), SHARDS)
+        for alias, game in games.items():
+            self.assertEqual(sharding.shard_for(game.id), alias)
+            self.assertEqual(sharding.get_game(game.id).gamedata, game.gamedata)
+            self.assertEqual(sharding.find_game(name=game.name).id, game.id)
+        self.assertFalse(sharding.game_exists(name='Third'))
+
+    @override_settings(GAME_SHARDS=SHARDS)
+    def test_submissions_on_game_shard(self):
+        game = create_games()['shard1']
+        submit_all(game)
+        game.pick_winner('a', 'c')
+        game.save()
+        submissions = StandardSubmission.objects.using('shard1')
+        self.assertEqual(submissions.filter(game=game).count(), 2)
+        self.assertEqual(submissions.get(winner=True).player_name, 'c')
+        self.assertEqual(len(white_card_ids(submissions.get(winner=True))), 1)
+        self.assertFalse(StandardSubmission.objects.using('default').exists())
+
+    @override_settings(GAME_SHARDS=SHARDS, GAME_EVENT_LOG=True)
+    def test_pick_retried(self):
+        game = create_games()['shard1']
+        for player_name in ('b', 'c'):
+            card = game.gamedata['players'][player_name]['hand'][0]
+            game = actions.perform(game, 'submit', player_name=player_name,
+                                   white_card_list=[card])
+        record = eventlog.record
+        conflicts = []
+
+        def conflict_once(*args):
+            # another process logged an event between catch up and record,
+            # the stats on 'default' are already committed
+            if not conflicts:
+                conflicts.append(args)
+                raise eventlog.Conflict('game changed')
+            return record(*args)
+
+        eventlog.record = conflict_once
+        try:
+            game = actions.perform(game, 'pick', czar_name='a', winner='c')
+        finally:
+            eventlog.record = record
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(game.gamedata['players']['c']['wins'], 1)
+        self.assertEqual(GameStanding.objects.get(
+            game_id=game.id, player_name='c').wins, 1)
+        self.assertEqual(PlayerStats.objects.get(player_name='c').wins, 1)
+
+    @override_settings(GAME_SHARDS=['shard1'])
+    def test_archive_every_shard(self):
+        # and 'default', from before it was left out of GAME_SHARDS
+        with override_settings(GAME_SHARDS=None):
+            old = create_started_game()
+            submit_all(old)
+            old.is_active = False
+            old.save()
+        new = create_started_game()
+        new.name = 'New'
+        submit_all(new)
+        new.is_active = False
+        new.save()
+        self.assertEqual(new._state.db, 'shard1')
+        self.assertEqual(archive.hot_table_size()[0], 2)
+        older_than = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.assertEqual(sum(archive.archive_games(older_than)), 2)
+        self.assertEqual(sorted(GameArchive.objects.values_list(
+            'game_id', 'submission_count')), [(old.id, 2), (new.id, 2)])
+        self.assertEqual(archive.hot_table_size()[0], 0)
+
+    @override_settings(GAME_SHARDS=SHARDS)
+    def test_card_stats_every_shard(self):
+        games = create_games()
+        for game in games.values():
+            submit_all(game)
+            game.save()
+        settle = datetime.timedelta(seconds=-60)
+        self.assertEqual(list(analytics.update_card_stats(settle=settle)),
+                         [2, 2])
+        self.assertEqual(sum(WhiteCardStats.objects.values_list(
+            'played', flat=True)), 4)
+        self.assertEqual(sorted(AnalyticsWatermark.objects.values_list(
+            'name', flat=True)), ['card_stats', 'card_stats:shard1'])
+        self.assertEqual(list(analytics.update_card_stats(settle=settle)), [])
+
+    @override_settings(GAME_SHARDS=SHARDS)
+    def test_admin(self):
+        games = create_games()
+        submit_all(games['shard1'])
+        User.objects.create_superuser('staff', 'staff@example.com', 'secret')
+        self.client.login(username='staff', password='secret')
+
+        response = self.client.get(reverse('admin:cards_game_changelist'))
+        self.assertEqual([game.pk for game in response.context['cl'].result_list],
+                         [games['default'].pk])
+        response = self.client.get(reverse('admin:cards_game_changelist'),
+                                   {'shard': 'shard1'})
+        self.assertEqual([game.pk for game in response.context['cl'].result_list],
+                         [games['shard1'].pk])
+        response = self.client.get(reverse('admin:cards_game_changelist'),
+                                   {'shard': 'nope'})
+        self.assertEqual(response.status_code, 302)
+        # by game id
+        response = self.client.get(reverse(
+            'admin:cards_game_change', args=(games['shard1'].pk,)))
+        self.assertEqual(response.status_code, 200)
+
+        submission = StandardSubmission.objects.using('shard1').latest('id')
+        response = self.client.get(
+            reverse('admin:cards_standardsubmission_changelist'),
+            {'shard': 'shard1'})
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        # from the changelist link
+        response = self.client.get(
+            reverse('admin:cards_standardsubmission_change',
+                    args=(submission.pk,)),
+            {'_changelist_filters': 'shard=shard1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['original'].game_id,
+                         games['shard1'].pk)
+
+    @override_settings(GAME_SHARDS=SHARDS)
+    def test_lobby_games(self):
+        games = create_games()
+        self.assertEqual(gamestate.lobby_games(), sorted(
+            (game.id, game.name) for game in games.values()))
+
+    def test_rebalance(self):
+        games = [create_started_game()]
+        submit_all(games[0])
+        games[0].save()
+        old_ids = games[0].gamedata['submission_ids']
+        games.append(Game(name='Second'))
+        games[1].gamedata = games[1].create_game(['test'])
+        games[1].save()
+
+        with override_settings(GAME_SHARDS=SHARDS):
+            misplaced = [game.id for game in sharding.misplaced_games()]
+            self.assertEqual(misplaced, [game.id for game in games
+                                         if sharding.shard_for(game.id) != 'default'])
+            moved = list(sharding.rebalance(batch_size=1))
+            self.assertEqual([move[0] for move in moved], misplaced)
+            self.assertEqual(list(sharding.misplaced_games()), [])
+
+            for game in games:
+                moved_game = sharding.get_game(game.id)
+                self.assertEqual(moved_game.name, game.name)
+                self.assertEqual(moved_game.gamedata['players'],
+                                 game.gamedata['players'])
+            game = sharding.get_game(games[0].id)
+            submission_ids = game.gamedata['submission_ids']
+            self.assertEqual(sorted(submission_ids), sorted(old_ids))
+            for player_name, submission_id in submission_ids.items():
+                submission = game.submissions_queryset().get(pk=submission_id)
+                self.assertEqual(submission.player_name, player_name)
+                self.assertEqual(len(white_card_ids(submission)), 1)
+
+            # new games carry on after the existing ids
+            new_game = Game(name='Third')
+            new_game.gamedata = new_game.create_game(['test'])
+            new_game.save()
+            self.assertEqual(new_game.id, games[1].id + 1)
+
+    def test_rebalance_event_log(self):
+        with override_settings(GAME_EVENT_LOG=True):
+            games = [create_started_game()]
+            games[0].name = 'First'
+            games[0].save()
+            games.append(create_started_game())
+            for game in games:
+                for player_name in ('b', 'c'):
+                    card = game.gamedata['players'][player_name]['hand'][0]
+                    actions.perform(game, 'submit', player_name=player_name,
+                                    white_card_list=[card])
+
+            with override_settings(GAME_SHARDS=SHARDS):
+                self.assertEqual(len(list(sharding.rebalance())), 1)
+                for game in games:
+                    moved_game = sharding.get_game(game.id)
+                    self.assertEqual(moved_game.event_seq, 2)
+                    submission_ids = moved_game.gamedata['submission_ids']
+                    self.assertEqual(sorted(submission_ids), ['b', 'c'])
+                    for submission_id in submission_ids.values():
+                        moved_game.submissions_queryset().get(pk=submission_id)
+                    self.assertEqual(
+                        [event.seq for event in GameEvent.objects.using(
+                            moved_game._state.db).filter(game=moved_game)],
+                        [0, 1, 2])
@@ -0,0 +1,182 @@
+import fnmatch
+
+from django.core.cache import cache as django_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from cards import gamestate
+from cards.forms.game_forms import JoinForm
+from cards.models import Game
+from cards.sharedcache import (
+    DjangoCacheBackend,
+    LRUCache,
+    FakeBackend,
+    RedisBackend,
+    TwoTierCache,
+    is_shared,
+)
+from cards.tests.model_tests import create_card_set, create_started_game
+
+
+class LRUCacheTests(TestCase):
+
+    def test_bounded(self):
+        lru = LRUCache(max_size=2, timeout=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        # b was the least recently used
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+        self.assertEqual(len(lru), 2)
+
+    def test_expiry(self):
+        lru = LRUCache(max_size=2, timeout=60)
+        lru.set('a', 1, timeout=-1)
+        self.assertEqual(lru.get('a', 'missing'), 'missing')
+
+
+class FakeRedis(object):
+
+    """The few StrictRedis commands RedisBackend uses, SCAN two keys at a
+    time."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self):
+        return self
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def setex(self, key, timeout, value):
+        self.data[key] = value
+
+    def execute(self):
+        pass
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def incr(self, key, delta):
+        self.data[key] = int(self.data.get(key, 0)) + delta
+        return self.data[key]
+
+    def execute_command(self, command, cursor, match, pattern, count, size):
+        if cursor == 0:
+            # SCAN returns the keys there were all along, deleted or not
+            self.scanned = sorted(self.data)
+        keys = self.scanned[cursor:cursor + 2]
+        cursor = cursor + 2 if cursor + 2 < len(self.scanned) else 0
+        return cursor, [key for key in keys
+                        if fnmatch.fnmatchcase(key, pattern)]
+
+
+class RedisBackendTests(TestCase):
+
+    def test_key_prefix(self):
+        # socket.io's keys in the same database
+        data = {'socketio:1': 'a', 'socketio:2': 'b'}
+        backend = RedisBackend('redis://localhost:6379/0', key_prefix='cah:')
+        backend.redis = FakeRedis(data)
+        backend.set_many({'a': '1', 'b': '2', 'c': '3'})
+        backend.incr('counter')
+        self.assertEqual(sorted(data), [
+            'cah:a', 'cah:b', 'cah:c', 'cah:counter',
+            'socketio:1', 'socketio:2'])
+        self.assertEqual(backend.get_many(['a', 'b', 'd']),
+                         {'a': '1', 'b': '2'})
+        backend.delete_many(['a'])
+        self.assertEqual(backend.get_many(['a']), {})
+        backend.clear()
+        self.assertEqual(data, {'socketio:1': 'a', 'socketio:2': 'b'})
+
+
+class TwoTierCacheTests(TestCase):
+
+    def setUp(self):
+        backend = FakeBackend()
+        # two workers sharing one L2
+        self.first = TwoTierCache(backend, l1_size=10, l1_timeout=60)
+        self.second = TwoTierCache(backend, l1_size=10, l1_timeout=60)
+
+    def test_shared(self):
+        self.first.set('key', {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.stats['l2_hits'], 1)
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.stats['l1_hits'], 1)
+        self.assertEqual(self.second.get('other', 'default'), 'default')
+        self.assertEqual(self.second.stats['misses'], 1)
+
+    def test_invalidation(self):
+        self.first.set('key', 1)
+        self.assertEqual(self.second.get('key'), 1)
+        self.first.set('key', 2)
+        self.assertEqual(self.second.get('key'), 2)
+        self.first.delete('key')
+        self.assertEqual(self.second.get('key'), None)
+        self.second.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.first.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.second.clear()
+        self.assertEqual(self.first.get_many(['a', 'b']), {})
+
+    def test_counters(self):
+        self.assertEqual(self.first.incr('counter'), 1)
+        self.assertEqual(self.second.incr('counter'), 2)
+        self.assertEqual(self.first.incr('counter', 0), 2)
+
+    def test_is_shared(self):
+        self.assertTrue(self.first.backend.shared)
+        # the test settings' default cache is a LocMemCache
+        self.assertFalse(DjangoCacheBackend().shared)
+        self.assertTrue(is_shared())
+        with override_settings(SHARED_CACHE_SINGLE_PROCESS=False):
+            self.assertFalse(is_shared())
+
+
+class GameStateTests(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        create_card_set()
+        self.game = create_started_game()
+
+    def test_state_version(self):
+        version = gamestate.state_version(self.game.id)
+        self.assertTrue(version > 0)
+        self.game.save()
+        self.assertEqual(gamestate.state_version(self.game.id), version + 1)
+
+    def test_lobby_games(self):
+        self.assertEqual(gamestate.lobby_games(), [(self.game.id, 'Test')])
+        with self.assertNumQueries(0):
+            gamestate.lobby_games()
+        private = Game(name='Private game')
+        private.gamedata = private.create_game(['test'])
+        private.save()
+        self.assertEqual(gamestate.lobby_games(), [(self.game.id, 'Test')])
+        self.assertEqual(len(gamestate.lobby_games(include_private=True)), 2)
+
+        self.game.is_active = False
+        self.game.save()
+        self.assertEqual(gamestate.lobby_games(), [])
+
+    @override_settings(SHARED_CACHE_SINGLE_PROCESS=False)
+    def test_lobby_games_process_local(self):
+        # other workers would not see the lobby version move
+        self.assertEqual(gamestate.lobby_games(), [(self.game.id, 'Test')])
+        with self.assertNumQueries(1):
+            gamestate.lobby_games()
+
+    def test_player_counter(self):
+        first = JoinForm().fields['player_name'].initial
+        second = JoinForm().fields['player_name'].initial
+        self.assertNotEqual(first, second)
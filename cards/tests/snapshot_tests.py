@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from cards import catalog, snapshot
+from cards.models import BlackCard, WhiteCard
+from cards.tests.model_tests import create_card_set
+
+
+class CatalogSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'catalog.snapshot')
+        self.first = create_card_set('first', black=2, white=3)
+        self.second = create_card_set('second', black=1, white=2)
+        self.second.white_card.add(self.first.white_card.all()[0])
+        self.black = BlackCard.objects.create(
+            text=u'\u2122 two \uFFFD and \uFFFD', pick=2, draw=1)
+
+    def tearDown(self):
+        if snapshot._snapshot is not None:
+            snapshot._snapshot.close()
+        snapshot._snapshot = None
+        snapshot._rejected = None
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        counts = snapshot.write_snapshot(self.path)
+        self.assertEqual(counts, {
+            'black_cards': 4, 'white_cards': 5, 'card_sets': 2})
+        loaded = snapshot.load_snapshot(self.path)
+        try:
+            self.assertEqual(loaded.version, catalog.catalog_version())
+            self.assertEqual(loaded.black_card(self.black.id),
+                             (self.black.text, 2, 1))
+            for card in WhiteCard.objects.all():
+                self.assertEqual(loaded.white_card(card.id), card.text)
+            self.assertRaises(KeyError, loaded.white_card, 0)
+            self.assertEqual(loaded.card_set_names(), ['first', 'second'])
+            white, black = loaded.card_set_ids('second')
+            self.assertEqual(sorted(white), sorted(
+                self.second.white_card.values_list('id', flat=True)))
+            self.assertEqual(black, list(
+                self.second.black_card.values_list('id', flat=True)))
+            self.assertEqual(loaded.card_set_ids('unknown'), ([], []))
+        finally:
+            loaded.close()
+
+    def test_stale_snapshot_rejected(self):
+        snapshot.write_snapshot(self.path)
+        WhiteCard.objects.create(text='new card')
+        self.assertRaises(snapshot.StaleSnapshot,
+                          snapshot.load_snapshot, self.path)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a catalog snapshot at all, honest')
+        self.assertRaises(snapshot.SnapshotError,
+                          snapshot.CatalogSnapshot, self.path)
+
+    def test_command(self):
+        call_command('export_catalog_snapshot', output=self.path, verbosity=0)
+        snapshot.load_snapshot(self.path).close()
+
+    def test_catalog_uses_snapshot(self):
+        snapshot.write_snapshot(self.path)
+        card_ids = list(WhiteCard.objects.values_list('id', flat=True))
+        texts = dict(WhiteCard.objects.values_list('id', 'text'))
+        with override_settings(CARD_SNAPSHOT=self.path):
+            catalog.catalog_version()
+            with self.assertNumQueries(0):
+                self.assertEqual(catalog.white_card_texts(card_ids), texts)
+                black_card = catalog.black_card(self.black.id)
+                self.assertEqual(black_card.text, self.black.text)
+                white, black = catalog.card_pool(['first', 'second'])
+            self.assertEqual(len(white), 5)
+            self.assertEqual(len(black), 3)
+
+            # stale snapshots are ignored, the database is used instead
+            WhiteCard.objects.create(text='new card')
+            self.assertTrue(snapshot.current_snapshot() is None)
+            self.assertEqual(catalog.black_card(self.black.id), self.black)
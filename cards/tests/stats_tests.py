@@ -0,0 +1,77 @@
+import datetime
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from cards import stats
+from cards.models import (
+    PlayerStats,
+    GameStanding,
+    LeaderboardEntry,
+)
+from cards.sharedcache import cache
+from cards.tests.model_tests import create_card_set, create_started_game
+
+
+class RecordWinTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.when = datetime.datetime(2015, 6, 3, 12, 0)  # a Wednesday
+
+    def test_counters(self):
+        stats.record_win(1, 'a', when=self.when)
+        stats.record_win(1, 'a', when=self.when)
+        stats.record_win(2, 'a', when=self.when + datetime.timedelta(days=1))
+        stats.record_win(2, 'b', when=self.when)
+
+        self.assertEqual(PlayerStats.objects.get(player_name='a').wins, 3)
+        self.assertEqual(
+            GameStanding.objects.get(game_id=1, player_name='a').wins, 2)
+        week = LeaderboardEntry.objects.get(
+            period=LeaderboardEntry.PERIOD_WEEK, player_name='a')
+        self.assertEqual(week.period_start, datetime.date(2015, 6, 1))
+        self.assertEqual(week.wins, 3)
+        self.assertEqual(LeaderboardEntry.objects.filter(
+            period=LeaderboardEntry.PERIOD_DAY, player_name='a').count(), 2)
+
+    def test_leaderboard_sorted(self):
+        stats.record_win(1, 'b', when=self.when)
+        stats.record_win(1, 'a', when=self.when)
+        stats.record_win(1, 'c', when=self.when)
+        stats.record_win(1, 'c', when=self.when)
+        self.assertEqual(
+            stats.leaderboard(), [('c', 2), ('a', 1), ('b', 1)])
+        self.assertEqual(
+            stats.leaderboard(LeaderboardEntry.PERIOD_DAY, when=self.when),
+            [('c', 2), ('a', 1), ('b', 1)])
+        self.assertEqual(stats.game_standings(1), [('c', 2), ('a', 1), ('b', 1)])
+
+    def test_leaderboard_cached(self):
+        stats.record_win(1, 'a', when=self.when)
+        self.assertEqual(stats.leaderboard(), [('a', 1)])
+        self.assertEqual(cache.get('leaderboard:all:%d' % stats.LEADERBOARD_SIZE),
+                         [('a', 1)])
+        stats.record_win(1, 'b', when=self.when)
+        self.assertEqual(stats.leaderboard(), [('a', 1)])
+
+    def test_start_new_round_records_win(self):
+        create_card_set()
+        game = create_started_game()
+        game.start_new_round('a', 'b', 'b')
+        self.assertEqual(stats.game_standings(game.id), [('b', 1)])
+        self.assertEqual(game.standings()[0][0], 'b')
+
+    def test_api(self):
+        stats.record_win(1, 'a', when=datetime.datetime.now())
+        response = self.client.get(reverse('leaderboard'), {'period': 'week'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['leaders'], [{'player_name': 'a', 'wins': 1}])
+        response = self.client.get(reverse('leaderboard'), {'period': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_leaderboard_page(self):
+        stats.record_win(1, 'a', when=datetime.datetime.now())
+        response = self.client.get(reverse('leaderboard-view'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'No winners yet', count=0)
@@ -8,9 +8,12 @@ when you run "manage.py test".
 
 Replace this with more appropriate tests for your application.
 """
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
 from django.core.urlresolvers import reverse
 from django.test.client import RequestFactory
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from cards.views.game_views import (
     LobbyView,
@@ -22,7 +25,8 @@ from cards.models import (
     GAMESTATE_SUBMISSION,
     GAMESTATE_SELECTION,
 )
-from cards import factories
+from cards import factories, gamestate
+from cards.tests.model_tests import create_card_set, create_started_game
 
 
 class SimpleTest(TestCase):
@@ -93,3 +97,79 @@ class GameViewTests(TestCase):
         game_view.game = self.game
         self.assertTrue(game_view.can_show_form())
 
+
+
+class ObserverPageTests(TestCase):
+
+    def setUp(self):
+        django_cache.clear()
+        create_card_set()
+        self.game = create_started_game()
+        self.url = reverse('game-view', kwargs={'pk': self.game.id})
+
+    def test_cached_per_state_version(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('public' in response['Cache-Control'])
+        self.assertTrue('Cookie' in response['Vary'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], etag)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        card = self.game.gamedata['players']['b']['hand'][0]
+        self.game.submit_white_cards('b', [card])
+        self.game.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.context_data['waiting_on'], ['c'])
+
+    def test_state_versions_start_over(self):
+        etag = self.client.get(self.url)['ETag']
+        version = gamestate.state_version(self.game.id)
+        # the cache lost the versions, and they come round to the same one
+        # for a different state
+        django_cache.clear()
+        card = self.game.gamedata['players']['b']['hand'][0]
+        self.game.submit_white_cards('b', [card])
+        self.game.save()
+        while gamestate.state_version(self.game.id) < version:
+            gamestate.bump_state_version(self.game.id)
+        self.assertEqual(gamestate.state_version(self.game.id), version)
+        for _ in range(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(SHARED_CACHE_SINGLE_PROCESS=False)
+    def test_process_local_cache(self):
+        # other workers would not see the state version move
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(gamestate.observer_page(
+            self.game.id, gamestate.state_version(self.game.id)), None)
+
+    def test_player_page_private(self):
+        User.objects.create_user('b', 'b@example.com', 'secret')
+        self.client.login(username='b', password='secret')
+        response = self.client.get(self.url)
+        self.assertEqual(response.context_data['player_name'], 'b')
+        self.assertTrue('private' in response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_password_game_not_cached(self):
+        self.game.gamedata['password'] = 'secret'
+        self.game.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        response = self.client.get(self.url + '?password=secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('private' in response['Cache-Control'])
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
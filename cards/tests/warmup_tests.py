@@ -0,0 +1,48 @@
+from django.test import TestCase
+
+from cards import catalog, sharedcache
+from cards.tests.model_tests import create_card_set
+from cards.warmup import PHASES, warm_up
+
+
+class ClosingBackend(sharedcache.FakeBackend):
+
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class WarmUpTests(TestCase):
+
+    def setUp(self):
+        create_card_set(name='v1.0')
+
+    def test_phases(self):
+        timings = warm_up()
+        self.assertEqual(list(timings), [name for name, func in PHASES])
+        for name, seconds in timings.items():
+            self.assertTrue(seconds is not None, name)
+        # a worker keeps its cache, and its L1
+        self.assertTrue(sharedcache._cache is not None)
+
+        hits = catalog.card_pool_stats()['hits']
+        catalog.warm_card_pools()
+        self.assertEqual(catalog.card_pool_stats()['hits'], hits + 1)
+
+    def test_before_fork(self):
+        backend = ClosingBackend()
+        sharedcache._cache = sharedcache.TwoTierCache(backend)
+        try:
+            warm_up([], before_fork=True)
+            self.assertTrue(sharedcache._cache is None)
+            self.assertTrue(backend.closed)
+        finally:
+            sharedcache.reset_cache()
+
+    def test_failed_phase(self):
+        def fail():
+            raise ValueError('broken')
+        timings = warm_up([('broken', fail), ('card_pools', PHASES[-1][1])])
+        self.assertEqual(timings['broken'], None)
+        self.assertTrue(timings['card_pools'] is not None)
@@ -8,7 +8,10 @@ import urllib
 import redis
 
 from django.core.exceptions import PermissionDenied
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags, quote_etag
 from django.utils.safestring import mark_safe
 from django.utils.html import strip_tags
 from django.views.generic import FormView, TemplateView
@@ -25,8 +28,6 @@ from cards.forms.game_forms import (
 )
 
 from cards.models import (
-    BlackCard,
-    WhiteCard,
     Game,
     BLANK_MARKER,
     GAMESTATE_SUBMISSION,
@@ -34,8 +35,13 @@ from cards.models import (
     avatar_url,
     StandardSubmission,
     DEFAULT_HAND_SIZE,
+    DEFAULT_CARD_SETS,
 )
 
+from cards import actions, catalog, gamestate, profiling, sharding
+from cards.ratelimit import rate_limit
+from cards.routers import replica_reads
+from cards.sharedcache import is_shared
 import cards.log as log
 
 TWITTER_SUBMISSION_LENGTH = 93
@@ -66,9 +72,11 @@ class GameViewMixin(object):
 
         if game_id not in self._games:
             try:
-                self._games[game_id] = Game.objects.get(pk=game_id)
+                self._games[game_id] = sharding.get_game(int(game_id))
             except Game.DoesNotExist:
                 raise Http404
+            profiling.note_game(getattr(self, 'request', None),
+                                self._games[game_id])
 
         expected_password = self._games[game_id].gamedata.get('password')
         if expected_password:
@@ -104,10 +112,11 @@ class GameViewMixin(object):
         if player_name and session_details:
             if player_name != session_details.get('name'):
                 if self.game.gamedata['players'].get(session_details.get('name')):
-                    self.game.gamedata['players'][player_name] = self.game.gamedata['players'][session_details.get('name')]
-                    self.game.del_player(session_details.get('name'))
-                    if self.game.gamedata['card_czar'] == session_details.get('name'):
-                        self.game.gamedata['card_czar'] = player_name
+                    # an action, so it is logged and goes via the actor
+                    self.game = actions.perform(
+                        self.game, 'rename',
+                        old_name=session_details.get('name'),
+                        new_name=player_name)
 
         # XXX check_game_status shouldn't be necessary, refactor it out
         # somehow!
@@ -127,12 +136,8 @@ class LobbyView(FormView):
     form_class = LobbyForm
 
     def dispatch(self, *args, **kwargs):
-        game_list = Game.objects.filter(is_active=True)
-
-        if not self.request.user.is_staff:
-            game_list = game_list.exclude(name__startswith='Private')
-
-        self.game_list = game_list.values_list('id', 'name')
+        self.game_list = gamestate.lobby_games(
+            include_private=self.request.user.is_staff)
 
         return super(LobbyView, self).dispatch(*args, **kwargs)
 
@@ -164,7 +169,7 @@ class LobbyView(FormView):
             # Attempting to create a new game
             try:
                 # see if already exists
-                existing_game = Game.objects.get(name=game_name)
+                existing_game = sharding.find_game(name=game_name)
             except Game.DoesNotExist:
                 existing_game = None
 
@@ -183,7 +188,7 @@ class LobbyView(FormView):
                 if not card_set:
                     # Are not staff or are staff and didn't select cardset(s)
                     # Either way they get default
-                    card_set = ['v1.0', 'v1.2', 'v1.3', 'v1.4']
+                    card_set = DEFAULT_CARD_SETS
                 tmp_game.gamedata = tmp_game.create_game(card_set, initial_hand_size=initial_hand_size, password=password)
                 tmp_game.save()
                 if password:
@@ -194,7 +199,7 @@ class LobbyView(FormView):
             if not game_name:
                 game_name = form.cleaned_data.get('game_list')
 
-            existing_game = Game.objects.get(
+            existing_game = sharding.find_game(
                 name=game_name)  # existing_game maybe a bool
 
             log.logger.debug('existing_game.gamedata %r',
@@ -232,12 +237,33 @@ def gen_qr_url(url, image_size=547):
 
 class GameView(GameViewMixin, FormView):
 
+    """The game page. Observers (no player name) all see the same page, it
+    is cached per game state version and may be cached by reverse proxies
+    for OBSERVER_PAGE_MAX_AGE seconds, games with a password excepted.
+    Only with a cache every worker shares (sharedcache.is_shared()), the
+    state versions mean nothing otherwise. The ETag also has the game's
+    event_seq and modified time, so it changes with the game even when
+    the state versions start over (the cache lost them)."""
+
     template_name = 'game_view.html'
     form_class = PlayerForm
 
+    @method_decorator(rate_limit('game-action', methods=('POST',)))
     def dispatch(self, request, *args, **kwargs):
         log.logger.debug('%r %r', args, kwargs)
-        self.game = self.get_game(kwargs['pk'])
+        game_id = int(kwargs['pk'])
+        # before loading the game, the page is at least this new
+        self.state_version = gamestate.state_version(game_id)
+        self.cache_pages = is_shared()
+        observing = request.method in ('GET', 'HEAD')
+        if observing and self.cache_pages and self.is_anonymous_observer():
+            # no need to load the game, only pages of games without a
+            # password are cached
+            response = self.cached_observer_page(game_id)
+            if response is not None:
+                return response
+
+        self.game = self.get_game(game_id)
 
         if not self.game.can_be_played():
             return redirect(reverse('lobby-view'))
@@ -248,15 +274,68 @@ class GameView(GameViewMixin, FormView):
         card_czar_name = self.game.gamedata['card_czar']
         self.is_card_czar = self.player_name == card_czar_name
 
-        return super(GameView, self).dispatch(request, *args, **kwargs)
+        observing = (observing and self.player_name is None and
+                     not self.game.gamedata.get('password'))
+        if not observing:
+            response = super(GameView, self).dispatch(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            return response
+
+        if not self.cache_pages:
+            response = super(GameView, self).dispatch(request, *args, **kwargs)
+            patch_cache_control(response, public=True, max_age=getattr(
+                settings, 'OBSERVER_PAGE_MAX_AGE', 2))
+            return response
+
+        response = self.cached_observer_page(game_id)
+        if response is not None:
+            return response
+        response = super(GameView, self).dispatch(request, *args, **kwargs)
+        version = self.state_version
+        etag = self.observer_etag(self.game, version)
+
+        def rendered(response):
+            gamestate.cache_observer_page(
+                game_id, version, etag, response.content)
+
+        response.add_post_render_callback(rendered)
+        return self.observer_headers(response, etag)
+
+    def is_anonymous_observer(self):
+        session_details = self.request.session.get('session_details') or {}
+        return (not self.request.user.is_authenticated() and
+                not session_details.get('name'))
+
+    def observer_etag(self, game, version):
+        return '%d-%d-%s-%d' % (game.id, game.event_seq,
+                                game.modified.strftime('%Y%m%d%H%M%S%f'),
+                                version)
+
+    def observer_headers(self, response, etag):
+        response['ETag'] = quote_etag(etag)
+        patch_cache_control(response, public=True, max_age=getattr(
+            settings, 'OBSERVER_PAGE_MAX_AGE', 2))
+        # players of the game get their own page
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def cached_observer_page(self, game_id):
+        cached = gamestate.observer_page(game_id, self.state_version)
+        if cached is None:
+            return None
+        etag, content = cached
+        if etag in parse_etags(self.request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content)
+        return self.observer_headers(response, etag)
 
     def get_context_data(self, *args, **kwargs):
         context = super(GameView, self).get_context_data(*args, **kwargs)
 
         log.logger.debug('game %r', self.game.gamedata['players'])
-        black_card = BlackCard.objects.get(
-            id=self.game.gamedata['current_black_card'],
-        )
+        black_card = catalog.black_card(
+            self.game.gamedata['current_black_card'])
 
         context['tintg_server'] = settings.TINTG_SERVER
         context['show_form'] = self.can_show_form()
@@ -268,6 +347,7 @@ class GameView(GameViewMixin, FormView):
         context['card_czar_avatar'] = self.game.gamedata[
             'players'][card_czar_name]['player_avatar']
         context['room_name'] = self.game.name
+        context['standings'] = self.game.standings()
         if self.game.gamedata['submissions']:
             context['waiting_on'] = [
                 name for name in self.game.gamedata['players'] if name not in self.game.gamedata['submissions'] and name != card_czar_name
@@ -275,11 +355,14 @@ class GameView(GameViewMixin, FormView):
 
         # context['socketio'] = settings.SOCKETIO_URL
         context['qr_code_url'] = reverse('game-qrcode-view', kwargs={'pk': self.game.id})
+        context['state_version'] = self.state_version
 
-        submissions = StandardSubmission.objects.filter(game=self.game).order_by('-id')[:10]
-        context['submissions'] = [
-            submission.export_for_display() for submission in submissions
-        ]
+        with replica_reads():
+            submissions = sharding.game_queryset(
+                StandardSubmission, self.game.id).filter(game=self.game).order_by('-round', '-id')[:10]
+            context['submissions'] = [
+                submission.export_for_display() for submission in submissions
+            ]
 
         if self.player_name:
             if self.game.gamedata['submissions'] and not self.is_card_czar:
@@ -315,30 +398,21 @@ class GameView(GameViewMixin, FormView):
             winner = form.cleaned_data['card_selection']
             log.logger.debug(winner)
             winner = winner[0]  # for some reason we have a list
-            winner_name = winner 
-
-            # NOTE StandardSubmission could benefit from a round number to ensure unique key, this would remove the need for the [0] offset/slice
-            winning_submission = StandardSubmission.objects.filter(
-                game=self.game,
-                blackcard=self.game.gamedata['current_black_card'],
-                submissions__in=self.game.gamedata['submissions'][winner]  # TODO equality instead of in?; submissions=self.game.gamedata['submissions'][winner][0]
-            )[0]
-            winning_submission.winner = True
-            winning_submission.save()
-            self.game.start_new_round(self.player_name, winner_name, winner)
+            self.game = actions.perform(
+                self.game, 'pick', czar_name=self.player_name, winner=winner)
         else:
             submitted = form.cleaned_data['card_selection']
             # The form returns unicode strings. We want ints in our list.
             white_card_list = [int(card) for card in submitted]
-            self.game.submit_white_cards(
-                self.player_name, white_card_list)  # FIXME catch GameError and/or check before hand
+            self.game = actions.perform(
+                self.game, 'submit', player_name=self.player_name,
+                white_card_list=white_card_list)  # FIXME catch GameError and/or check before hand
 
             if self.game.gamedata['filled_in_texts']:
                 log.logger.debug(
                     'filled_in_texts %r',
                     self.game.gamedata['filled_in_texts']
                 )
-        self.game.save()
 
         # push_notification(str(self.game.name))
         
@@ -357,15 +431,13 @@ class GameView(GameViewMixin, FormView):
                     ]
                     kwargs['cards'] = czar_selection_options
             else:
-                temp_black_card = BlackCard.objects.get(id=black_card_id)
+                temp_black_card = catalog.black_card(black_card_id)
                 kwargs['blanks'] = temp_black_card.pick
+                hand = self.game.gamedata['players'][self.player_name]['hand']
+                card_texts = catalog.white_card_texts(hand)
                 cards = [
-                    (card_id, mark_safe(card_text.capitalize()))
-                    for card_id, card_text
-                    in WhiteCard.objects.filter(
-                        id__in=self.game.gamedata[
-                            'players'][self.player_name]['hand']
-                    ).values_list('id', 'text')
+                    (card_id, mark_safe(card_texts[card_id].capitalize()))
+                    for card_id in hand if card_id in card_texts
                 ]
                 kwargs['cards'] = cards
         return kwargs
@@ -412,6 +484,7 @@ class GameExitView(GameViewMixin, FormView):
     template_name = 'game_exit.html'
     form_class = ExitForm
 
+    @method_decorator(rate_limit('game-action', methods=('POST',)))
     def dispatch(self, request, *args, **kwargs):
         log.logger.debug('%r %r', args, kwargs)
         self.game = self.get_game(kwargs['pk'])
@@ -447,8 +520,8 @@ class GameExitView(GameViewMixin, FormView):
         log.logger.debug('view really_exit %r', really_exit)
 
         if really_exit == 'yes':  # FIXME use bool via coerce?
-            self.game.del_player(self.player_name)
-            self.game.save()
+            self.game = actions.perform(
+                self.game, 'exit', player_name=self.player_name)
             # push_notification(str(self.game.name))
         return super(GameExitView, self).form_valid(form)
 
@@ -469,6 +542,7 @@ class GameJoinView(GameViewMixin, FormView):
     template_name = 'game_join.html'
     form_class = JoinForm
 
+    @method_decorator(rate_limit('game-action', methods=('POST',)))
     def dispatch(self, request, *args, **kwargs):
         self.game = self.get_game(kwargs['pk'])
 
@@ -483,11 +557,9 @@ class GameJoinView(GameViewMixin, FormView):
             else:
                 player_image_url = avatar_url(self.player_name)
             if self.player_name not in self.game.gamedata['players']:
-                self.game.add_player(
-                    self.player_name, player_image_url=player_image_url)
-                if len(self.game.gamedata['players']) == 1:
-                    self.game.start_new_round(winner_id=self.player_name)
-                self.game.save()
+                self.game = actions.perform(
+                    self.game, 'join', player_name=self.player_name,
+                    player_image_url=player_image_url)
 
             log.logger.debug('about to return reverse')
             return redirect(reverse('game-view', kwargs={'pk': self.game.id}))
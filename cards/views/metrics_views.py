@@ -0,0 +1,13 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+
+from cards import metrics
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@staff_member_required
+def metrics_view(request):
+    """Request metrics of this worker process, for Prometheus."""
+    return HttpResponse(metrics.render_prometheus(),
+                        content_type=PROMETHEUS_CONTENT_TYPE)
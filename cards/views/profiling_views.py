@@ -0,0 +1,47 @@
+import datetime
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+
+from cards import profiling
+
+
+def _with_created(meta):
+    return dict(meta, created=datetime.datetime.fromtimestamp(meta['created']))
+
+
+@staff_member_required
+def profiles_view(request):
+    """The stored profiles, newest first."""
+    return render(request, 'profiles.html', {
+        'profiles': [_with_created(meta) for meta in profiling.profiles()],
+        'sample_rate': profiling.sample_rate(),
+    })
+
+
+def _get_profile(seq):
+    found = profiling.get(int(seq))
+    if found is None:
+        raise Http404
+    return found
+
+
+@staff_member_required
+def profile_view(request, seq):
+    """Top functions of one profile."""
+    meta, data = _get_profile(seq)
+    return render(request, 'profile.html', {
+        'profile': _with_created(meta),
+        'functions': profiling.top_functions(data),
+    })
+
+
+@staff_member_required
+def profile_download_view(request, seq):
+    """The profile as a .prof file, for pstats and friends."""
+    meta, data = _get_profile(seq)
+    response = HttpResponse(data, content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename="cah-%d.prof"' % (
+        meta['seq'],)
+    return response
@@ -0,0 +1,14 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render
+
+from cards import ratelimit
+
+
+@staff_member_required
+def top_talkers_view(request):
+    """The busiest clients of this worker process and their rate limits."""
+    return render(request, 'top_talkers.html', {
+        'talkers': ratelimit.top_talkers(),
+        'rate_limits': sorted(ratelimit.rate_limits().items()),
+        'window': ratelimit.TALKERS_WINDOW,
+    })
@@ -0,0 +1,33 @@
+from django.views.generic import TemplateView
+
+from cards import analytics, stats
+
+
+class LeaderboardView(TemplateView):
+
+    """All time, weekly and daily top players."""
+
+    template_name = 'leaderboard.html'
+
+    def get_context_data(self, *args, **kwargs):
+        context = super(LeaderboardView, self).get_context_data(*args, **kwargs)
+        context['leaderboards'] = [
+            ('All time', stats.leaderboard()),
+            ('This week', stats.leaderboard(stats.LeaderboardEntry.PERIOD_WEEK)),
+            ('Today', stats.leaderboard(stats.LeaderboardEntry.PERIOD_DAY)),
+        ]
+        return context
+
+
+class HallOfFameView(TemplateView):
+
+    """Cards that win the most, ?card_set=name to limit to one card set."""
+
+    template_name = 'hall_of_fame.html'
+
+    def get_context_data(self, *args, **kwargs):
+        context = super(HallOfFameView, self).get_context_data(*args, **kwargs)
+        card_set_name = self.request.GET.get('card_set') or None
+        context['card_set_name'] = card_set_name
+        context.update(analytics.hall_of_fame(card_set_name))
+        return context
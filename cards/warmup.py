@@ -0,0 +1,101 @@
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Load at boot what every worker otherwise loads on its first requests.
+
+warm_up() runs the PHASES in order, timing each, a phase that fails is
+logged and skipped. cah.wsgi calls it when CAH_WARMUP is set, in every
+worker, or with CAH_WARMUP=preload (for gunicorn --preload) once in the
+master before forking. Only then does it close the database connections
+and the shared cache client at the end, the workers must not share them.
+
+    ./manage.py warm_up
+
+reports the timings of a cold start.
+"""
+
+import collections
+import time
+
+from django.db import connections
+
+import cards.log as log
+
+# templates GameView and LobbyView render, with their parents and
+# includes, kept compiled by the cached template loader
+WARM_TEMPLATES = [
+    'base.html',
+    'main.html',
+    'lobby.html',
+    'game_view.html',
+    'game_form.html',
+    'stats.html',
+    'submissions.html',
+]
+
+
+def warm_views():
+    from cards.views import card_views, game_views, stats_views
+    from cards.api import views as api_views
+    from cards.forms import game_forms
+
+
+def warm_urls():
+    from django.core.urlresolvers import get_resolver, reverse
+    # imports every urls module (admin, allauth, DRF views)
+    get_resolver(None).url_patterns
+    reverse('lobby-view')
+    reverse('game-view', kwargs={'pk': 1})
+
+
+def warm_templates():
+    from django.template.loader import get_template
+    for template_name in WARM_TEMPLATES:
+        get_template(template_name)
+
+
+def warm_catalog():
+    from cards import catalog
+    from cards.models import CardSet
+    catalog.catalog_version()
+    catalog._snapshot()
+    catalog.card_set_ids(list(CardSet.objects.values_list('name', flat=True)))
+
+
+def warm_card_pools():
+    from cards import catalog
+    catalog.warm_card_pools()
+
+
+PHASES = [
+    ('views', warm_views),
+    ('urls', warm_urls),
+    ('templates', warm_templates),
+    ('catalog', warm_catalog),
+    ('card_pools', warm_card_pools),
+]
+
+
+def warm_up(phases=None, before_fork=False):
+    """Run `phases` (default PHASES), returns OrderedDict of phase name:
+    seconds, None for phases that failed. With `before_fork` close what
+    the forked workers must not share."""
+    from cards import sharedcache
+
+    timings = collections.OrderedDict()
+    for name, func in phases or PHASES:
+        start = time.time()
+        try:
+            func()
+        except Exception:
+            log.logger.exception('warm up phase %s failed', name)
+            timings[name] = None
+        else:
+            timings[name] = time.time() - start
+    if before_fork:
+        connections.close_all()
+        sharedcache.reset_cache()
+    log.logger.info('warm up %s', ', '.join(
+        '%s %s' % (name, 'failed' if seconds is None else '%.3fs' % seconds)
+        for name, seconds in timings.items()))
+    return timings
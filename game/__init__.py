@@ -10,9 +10,11 @@ Cards Against Humanity(tm).
 
 import os
 import sys
+import codecs
 import random
 import pprint
 import cgi
+from collections import OrderedDict
 # json support, TODO consider http://pypi.python.org/pypi/omnijson
 try:
     # Python 2.6+
@@ -48,6 +50,7 @@ else:
 
 
 DEFAULT_BLANK_MARKER = u"\uFFFD"  # u'_'
+CHUNK_SIZE = 64 * 1024
 data_dir = os.path.join(os.path.dirname(__file__), 'data')
 #data_dir = os.path.join(data_dir, '')
 
@@ -58,42 +61,64 @@ class CardsParser(object):
         self.white_cards = []
         self.black_cards = []
 
+    def itercards(self, file_obj=None, look_for_blanks=False, seen=None, chunk_size=CHUNK_SIZE):
+        """Read from already open file and yield the cards (Unicode strings)
+        one at a time, reading `chunk_size` bytes at a time.
+        Cards already in `seen` (an OrderedDict used as an ordered set) are
+        skipped, new cards are added to it.
+        """
+        skip_start = 'cards='
+        blank_marker_in_file = u'__________'
+        card_seperator = u'<>'
+        if seen is None:
+            seen = OrderedDict()
+        
+        # there are some non-ascii characters (e.g. TradeMark symbol)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = u''
+        at_start = True
+        while True:
+            data = file_obj.read(chunk_size)
+            pending += decoder.decode(data, final=not data)
+            if at_start:
+                if len(pending) < len(skip_start) and data:
+                    continue
+                pending = pending[len(skip_start):]
+                at_start = False
+            card_list = pending.split(card_seperator)
+            if data:
+                # last entry may be incomplete, wait for more data
+                pending = card_list.pop()
+            for card in card_list:
+                if look_for_blanks:
+                    """Black cards ask questions which will have:
+                        * 0 blank markers
+                        * 1 blank markers
+                        * 2 blank markers
+                        * 3 blank markers - NOTE no *.txt files have this
+                    
+                    0 blank markers is a question, from a game play perspective
+                    this is the same as 1 blank marker.
+                    """
+                    card = card.replace(blank_marker_in_file, self.blank)
+                # Remove duplicates
+                if card not in seen:
+                    seen[card] = None
+                    yield card
+            if not data:
+                break
+
     def parsefile(self, file_obj=None, look_for_blanks=False, existing_cards=None, sort_cards=True):
         """Read from already open file and chop up cards into a
         list of (Unicode) strings.
         This attempts to avoid duplicates and allows an existing list to be passed in,
         the returned list includes the existing_cards
         """
-        skip_start = 'cards='
-        blank_marker_in_file = '__________'
-        card_seperator = '<>'
-        existing_cards = existing_cards or []
-        
-        data = file_obj.read()  # yup all of it at once
-        
-        # there are some non-ascii characters (e.g. TradeMark symbol)
-        data = data.decode('utf-8')
-        data = data[len(skip_start):]
-        
-        if look_for_blanks:
-            """Black cards ask questions which will have:
-                * 0 blank markers
-                * 1 blank markers
-                * 2 blank markers
-                * 3 blank markers - NOTE no *.txt files have this
-            
-            0 blank markers is a question, from a game play perspective
-            this is the same as 1 blank marker.
-            """
-            data = data.replace(blank_marker_in_file, self.blank)
-        
-        card_list = data.split(card_seperator)
-        
-        # Remove duplicates
-        result = existing_cards[:]  # copy the existing list but do not modify it
-        for card in card_list:
-            if card not in result:
-                result.append(card)
+        # copy the existing list but do not modify it
+        seen = OrderedDict.fromkeys(existing_cards or [])
+        for _ in self.itercards(file_obj, look_for_blanks=look_for_blanks, seen=seen):
+            pass
+        result = list(seen)
         
         if sort_cards:
             result.sort()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""How many clients waiting on a game can one process hold: the async
+long-poll in cah.asgi against a blocking long-poll in WSGI worker
+threads (gunicorn gthread, a sync gunicorn worker holds just one).
+
+    PYTHONPATH=`pwd` python3 scripts/bench_asgi.py [num_clients [players_per_game]]
+
+Runs in process, without Django or Redis, the state change is delivered
+the way the Redis listener would. Reports the memory per waiting client
+and how long it takes to answer all of them after the change.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+
+from cah.asgi import GameEventsApplication
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * 4096
+
+
+def report(label, num_clients, setup_seconds, rss, wake_seconds):
+    print('%-6s %6d clients  %6.2fs to wait  %8.1f KB/client  '
+          '%7.3fs to answer all' % (
+              label, num_clients, setup_seconds, rss / 1024.0 / num_clients,
+              wake_seconds))
+
+
+def bench_asgi(num_clients, players_per_game):
+    versions = {}
+
+    def state_versions(game_ids):
+        return dict((game_id, versions.get(game_id, 0)) for game_id in game_ids)
+
+    def wsgi_app(environ, start_response):
+        start_response('404 Not Found', [])
+        return [b'']
+
+    app = GameEventsApplication(wsgi_app=wsgi_app, state_versions=state_versions)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    answered = []
+
+    def client(game_id):
+        requests = asyncio.Queue()
+        requests.put_nowait({'type': 'http.request', 'body': b''})
+        scope = {'type': 'http', 'method': 'GET',
+                 'path': '/game/%d/poll' % game_id,
+                 'query_string': b'version=0', 'headers': []}
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                answered.append(time.time())
+
+        return app(scope, requests.get, send)
+
+    start_rss = rss_bytes()
+    start = time.time()
+    game_ids = [num // players_per_game + 1 for num in range(num_clients)]
+    tasks = [loop.create_task(client(game_id)) for game_id in game_ids]
+
+    async def all_waiting():
+        while sum(len(waiters) for waiters in app.hub.waiters.values()) < num_clients:
+            await asyncio.sleep(0.01)
+
+    loop.run_until_complete(all_waiting())
+    setup_seconds = time.time() - start
+    rss = rss_bytes() - start_rss
+
+    changed = time.time()
+    for game_id in set(game_ids):
+        versions[game_id] = 1
+        app.hub.publish(game_id, 1)
+    loop.run_until_complete(asyncio.wait(tasks))
+    report('asgi', num_clients, setup_seconds, rss, max(answered) - changed)
+    app._listener.cancel()
+    loop.run_until_complete(asyncio.gather(app._listener, return_exceptions=True))
+    app.executor.shutdown()
+    loop.close()
+
+
+def bench_threads(num_clients, players_per_game):
+    # what a blocking long-poll view does in a threaded WSGI worker
+    condition = threading.Condition()
+    versions = {}
+    answered = []
+
+    def long_poll(game_id):
+        with condition:
+            while not versions.get(game_id):
+                condition.wait(25)
+        answered.append(time.time())
+
+    start_rss = rss_bytes()
+    start = time.time()
+    threads = []
+    try:
+        for num in range(num_clients):
+            thread = threading.Thread(
+                target=long_poll, args=(num // players_per_game + 1,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+    except RuntimeError as info:
+        print('threads  gave up after %d clients: %s' % (len(threads), info))
+    setup_seconds = time.time() - start
+    rss = rss_bytes() - start_rss
+
+    changed = time.time()
+    with condition:
+        for num in range(num_clients):
+            versions[num // players_per_game + 1] = 1
+        condition.notify_all()
+    for thread in threads:
+        thread.join()
+    report('threads', len(threads), setup_seconds, rss, max(answered) - changed)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        num_clients = int(argv[1])
+    except IndexError:
+        num_clients = 10000
+    try:
+        players_per_game = int(argv[2])
+    except IndexError:
+        players_per_game = 5
+
+    bench_asgi(num_clients, players_per_game)
+    bench_threads(num_clients, players_per_game)
+    print('sync    %6d client per gunicorn worker process' % 1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
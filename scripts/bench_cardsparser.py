@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Benchmark game.CardsParser on a synthetic <> separated card file,
+the original read-everything/list-dedupe parser against the streaming
+one.
+
+    PYTHONPATH=`pwd` python scripts/bench_cardsparser.py [num_cards]
+
+NOTE the original parser is quadratic, expect it to take minutes for
+100,000 cards.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from io import BytesIO
+
+from game import CardsParser
+
+
+def synthetic_file(num_cards):
+    # every 10th card is a repeat so there is something to deduplicate
+    cards = [u'Card number %d \u2122 __________.' % (num - num % 10 if num % 10 == 9 else num)
+             for num in range(num_cards)]
+    return ('cards=' + u'<>'.join(cards)).encode('utf-8')
+
+
+def legacy_parsefile(file_obj, look_for_blanks=False, existing_cards=None, sort_cards=True):
+    """The original CardsParser.parsefile()"""
+    skip_start = 'cards='
+    blank_marker_in_file = '__________'
+    card_seperator = '<>'
+    existing_cards = existing_cards or []
+    data = file_obj.read()
+    data = data.decode('utf-8')
+    data = data[len(skip_start):]
+    if look_for_blanks:
+        data = data.replace(blank_marker_in_file, u'\uFFFD')
+    card_list = data.split(card_seperator)
+    result = existing_cards[:]
+    for card in card_list:
+        if card not in result:
+            result.append(card)
+    if sort_cards:
+        result.sort()
+    return result
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    duration = time.time() - start
+    print('%-10s %8.2f seconds' % (label, duration))
+    return duration, result
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        num_cards = int(argv[1])
+    except IndexError:
+        num_cards = 100000
+
+    data = synthetic_file(num_cards)
+    print('%d cards, %d bytes' % (num_cards, len(data)))
+    parser = CardsParser()
+    new, new_result = timed('streaming', parser.parsefile, BytesIO(data), look_for_blanks=True)
+    old, old_result = timed('original', legacy_parsefile, BytesIO(data), look_for_blanks=True)
+    assert new_result == old_result
+    print('%d unique cards' % len(new_result))
+    print('speedup    %8.1fx' % (old / new))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Benchmark game actions saving the whole gamedata each time against the
+event log (settings.GAME_EVENT_LOG, see cards.eventlog), bytes written
+and time per action. Uses a throw away test database.
+
+    CAH_KEY=x PYTHONPATH=`pwd` python scripts/bench_eventlog.py [rounds [white_cards]]
+
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cah.settings.test")
+import django
+django.setup()
+
+from django.db.models.signals import post_save
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from cards import actions, sharding
+from cards.models import BlackCard, CardSet, Game, GameEvent, WhiteCard
+
+PLAYERS = ['player%d' % num for num in range(6)]
+
+written = {'bytes': 0}
+
+
+def count_bytes(sender, instance, **kwargs):
+    if sender is Game:
+        written['bytes'] += len(json.dumps(instance.gamedata))
+    elif sender is GameEvent:
+        written['bytes'] += len(json.dumps(instance.data))
+
+
+def create_cards(num_white):
+    card_set = CardSet.objects.create(name='bench', description='bench')
+    card_set.black_card.add(*[
+        BlackCard.objects.create(text=u'question %d' % num)
+        for num in range(num_white // 5)])
+    card_set.white_card.add(*[
+        WhiteCard.objects.create(text=u'answer %d' % num)
+        for num in range(num_white)])
+
+
+def play(label, rounds):
+    game = Game(name=label)
+    game.gamedata = game.create_game(['bench'])
+    game.save()
+    for player_name in PLAYERS:
+        game = actions.perform(game, 'join', player_name=player_name)
+
+    written['bytes'] = 0
+    num_actions = 0
+    start = time.time()
+    for num in range(rounds):
+        czar = game.gamedata['card_czar']
+        others = [player_name for player_name in PLAYERS if player_name != czar]
+        for player_name in others:
+            card = game.gamedata['players'][player_name]['hand'][0]
+            game = actions.perform(game, 'submit', player_name=player_name,
+                                   white_card_list=[card])
+            num_actions += 1
+        game = actions.perform(game, 'pick', czar_name=czar,
+                               winner=others[num % len(others)])
+        num_actions += 1
+    duration = time.time() - start
+    assert sharding.get_game(game.id).gamedata == game.gamedata
+    print('%-9s %5d actions %8.1f KB written %6.2f KB/action %6.2f ms/action' % (
+        label, num_actions, written['bytes'] / 1024.0,
+        written['bytes'] / 1024.0 / num_actions, duration * 1000 / num_actions))
+    return written['bytes']
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        rounds = int(argv[1])
+    except IndexError:
+        rounds = 100
+    try:
+        num_white = int(argv[2])
+    except IndexError:
+        num_white = 2000
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    post_save.connect(count_bytes)
+    try:
+        create_cards(num_white)
+        print('%d rounds, %d players, %d white cards' % (
+            rounds, len(PLAYERS), num_white))
+        blob = play('gamedata', rounds)
+        with override_settings(GAME_EVENT_LOG=True):
+            events = play('eventlog', rounds)
+        print('%.1fx less written' % (float(blob) / events))
+    finally:
+        post_save.disconnect(count_bytes)
+        runner.teardown_databases(old_config)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+#
+"""Benchmark card set import, per row saves (the old dict2db) against
+the bulk dict2db, on a synthetic card set. Uses a throw away test
+database.
+
+    CAH_KEY=x PYTHONPATH=`pwd` python scripts/bench_import.py [num_cards]
+
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cah.settings.test")
+import django
+django.setup()
+
+from django.db import transaction
+from django.test.runner import DiscoverRunner
+
+from cards.models import BlackCard, WhiteCard, CardSet, dict2db
+
+
+def synthetic_cardset(num_cards, prefix):
+    num_black = num_cards // 5
+    return {
+        'description': 'synthetic %s' % prefix,
+        'blackcards': [
+            {'text': u'%s question %d \uFFFD?' % (prefix, num), 'pick': 1}
+            for num in range(num_black)
+        ],
+        'whitecards': [
+            {'text': u'%s answer %d' % (prefix, num)}
+            for num in range(num_cards - num_black)
+        ],
+    }
+
+
+@transaction.atomic
+def legacy_dict2db(d):
+    """The original one card (and one link) at a time import."""
+    for cardset_name in d:
+        cs = d[cardset_name]
+        cardset = CardSet(name=cardset_name, description=cs.get('description'))
+        cardset.save()
+        for entry in cs.get('blackcards') or []:
+            black_card = BlackCard(**entry)
+            black_card.save()
+            cardset.black_card.add(black_card)
+        for entry in cs.get('whitecards') or []:
+            white_card = WhiteCard(**entry)
+            white_card.save()
+            cardset.white_card.add(white_card)
+
+
+def timed(label, func, *args):
+    start = time.time()
+    func(*args)
+    duration = time.time() - start
+    print('%-8s %8.2f seconds' % (label, duration))
+    return duration
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        num_cards = int(argv[1])
+    except IndexError:
+        num_cards = 50000
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        print('%d cards' % num_cards)
+        old = timed('per row', legacy_dict2db,
+                    {'old': synthetic_cardset(num_cards, 'old')})
+        new = timed('bulk', dict2db,
+                    {'new': synthetic_cardset(num_cards, 'new')}, 0)
+        print('speedup  %8.1fx' % (old / new))
+    finally:
+        runner.teardown_databases(old_config)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,8 @@ Converts (PostgresSQL) SQL files into Django fixture (json) data file.
 
 import os
 import sys
+import itertools
+import re
 import random
 import pprint
 import csv
@@ -77,12 +79,8 @@ def simple_select(c, sql_query, bind_params=None):
             row = c.fetchone()
     print ''
 
-def db2data(c, cp, django_data, json_style='django', fix_blank_count=True, safe_fail=True):
-    # safe_fail=True, restrict_deck=None, 
-    if json_style == 'django':
-        black_cards_list = django_data
-    else:
-        black_cards_list = cp.black_cards
+def iter_black_cards(c, cp, json_style='django', fix_blank_count=True, safe_fail=True):
+    """Yields black card entries from sqlite cursor c, in id order"""
     c.execute('select text, pick, draw, id, watermark from black_cards order by id')
     for row in c:
         line = row[0]
@@ -114,14 +112,11 @@ def db2data(c, cp, django_data, json_style='django', fix_blank_count=True, safe_
             #entry = line
             #entry = (line, pick, draw)
             entry = {'text': line, 'pick': pick, 'draw': draw}
-        black_cards_list.append(entry)
-    cp.black_cards.sort()  # no need to sort alpha django black_cards_list.sort() the order should be correct already
-    
-    if json_style == 'django':
-        white_cards_list = django_data
-    else:
-        white_cards_list = cp.white_cards
+        yield entry
 
+
+def iter_white_cards(c, json_style='django', safe_fail=True):
+    """Yields white card entries from sqlite cursor c, in id order"""
     c.execute('select text, id, watermark from white_cards order by id')
     for row in c:
         line = row[0]
@@ -142,17 +137,160 @@ def db2data(c, cp, django_data, json_style='django', fix_blank_count=True, safe_
                 }
         else:
             entry = line
-        
-        white_cards_list.append(entry)
+        yield entry
+
+
+def iterdb2data(c, cp, json_style='django', fix_blank_count=True, safe_fail=True):
+    """Yields black then white card entries, reading one row at a time"""
+    return itertools.chain(
+        iter_black_cards(c, cp, json_style=json_style, fix_blank_count=fix_blank_count, safe_fail=safe_fail),
+        iter_white_cards(c, json_style=json_style, safe_fail=safe_fail),
+    )
+
+
+def db2data(c, cp, django_data, json_style='django', fix_blank_count=True, safe_fail=True):
+    # safe_fail=True, restrict_deck=None, 
+    if json_style == 'django':
+        black_cards_list = django_data
+    else:
+        black_cards_list = cp.black_cards
+    black_cards_list.extend(iter_black_cards(c, cp, json_style=json_style, fix_blank_count=fix_blank_count, safe_fail=safe_fail))
+    cp.black_cards.sort()  # no need to sort alpha django black_cards_list.sort() the order should be correct already
+    
+    if json_style == 'django':
+        white_cards_list = django_data
+    else:
+        white_cards_list = cp.white_cards
+    white_cards_list.extend(iter_white_cards(c, json_style=json_style, safe_fail=safe_fail))
     cp.white_cards.sort()
     
 
-def sql2data(filename, safe_fail=True, restrict_deck=None, json_style='django', fix_blank_count=False, dbname=':memory:'):
+INSERT_BATCH_SIZE = 1000
+
+# table name in the dump: columns to load (None means all, in DDL order)
+INSERT_TABLES = {
+    'black_cards': None,
+    'white_cards': None,
+    'card_set': None,
+    'card_set_black_card': ('cardset_id', 'blackcard_id'),
+    'card_set_white_card': ('cardset_id', 'whitecard_id'),
+}
+# tables with card text, blank markers are normalized in their strings
+TEXT_TABLES = ('black_cards', 'white_cards', 'card_set')
+
+
+# quoted string or bare literal, followed by a comma or the end of the values
+INSERT_VALUE_RE = re.compile(r"\s*(?:'((?:[^']|'')*)'|([^,']*?))\s*(?:,|$)")
+BARE_LITERALS = {'null': None, 'true': 1, 'false': 0}
+
+
+def _bare_literal(token):
+    token = token.strip()
+    lowered = token.lower()
+    if lowered in BARE_LITERALS:
+        return BARE_LITERALS[lowered]
+    if '.' in token:
+        return float(token)
+    return int(token)
+
+
+def parse_insert_values(statement):
+    """Parse the VALUES (...) of a PostgreSQL dump INSERT statement into a
+    tuple. Handles quoted strings ('' is an escaped quote), NULL, true,
+    false and numbers. Strings are returned as unicode.
+    """
+    start = statement.index('VALUES (') + len('VALUES (')
+    values = statement[start:statement.rindex(')')]
+    if "'" not in values:
+        return tuple(_bare_literal(token) for token in values.split(','))
+    result = []
+    for match in INSERT_VALUE_RE.finditer(values):
+        quoted, bare = match.groups()
+        if quoted is not None:
+            result.append(quoted.replace("''", "'").decode('utf8'))
+        else:
+            result.append(_bare_literal(bare))
+        if match.end() == len(values):
+            break
+    return tuple(result)
+
+
+def replace_blanks(value, blank=DEFAULT_BLANK_MARKER):
+    # there appears to be variable length underscores in different rows
+    value = value.replace('_____', blank)
+    value = value.replace('____', blank)
+    value = value.replace('___', blank)
+    return value
+
+
+def iter_inserts(file_obj, blank=DEFAULT_BLANK_MARKER):
+    """Yields (table name, row tuple) for each INSERT INTO line, of a table
+    in INSERT_TABLES, in the dump `file_obj`."""
+    for line in file_obj:
+        if not line.startswith('INSERT INTO '):
+            continue
+        table_name = line[len('INSERT INTO '):].split(' ', 1)[0]
+        if table_name not in INSERT_TABLES:
+            continue
+        row = parse_insert_values(line)
+        if table_name in TEXT_TABLES:
+            row = tuple(replace_blanks(value, blank) if isinstance(value, unicode) else value
+                        for value in row)
+        yield table_name, row
+
+
+def load_inserts(db, rows, batch_size=INSERT_BATCH_SIZE):
+    """Load (table name, row tuple) pairs from `rows` into sqlite `db` with
+    executemany(), batch_size rows at a time, all in one transaction.
+
+    Returns dict of table name: number of rows loaded.
+    """
+    pending = {}
+    counts = {}
+
+    def flush(table_name):
+        batch = pending.pop(table_name, None)
+        if not batch:
+            return
+        columns = INSERT_TABLES[table_name]
+        column_sql = ' (%s)' % ', '.join(columns) if columns else ''
+        sql = 'INSERT INTO %s%s VALUES (%s)' % (table_name, column_sql, ', '.join('?' * len(batch[0])))
+        db.executemany(sql, batch)
+        counts[table_name] = counts.get(table_name, 0) + len(batch)
+
+    with db:
+        for table_name, row in rows:
+            batch = pending.setdefault(table_name, [])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(table_name)
+        for table_name in list(pending):
+            flush(table_name)
+    return counts
+
+
+def iter_fixture_json(entries, indent=4):
+    """Yields chunks of a Django fixture (json list) of `entries`, one entry
+    at a time, formatted the way Django formats fixtures."""
+    yield '['
+    separator = '\n'
+    for entry in entries:
+        data = dump_json(entry, indent=indent)
+        yield separator + '\n'.join(line.rstrip() for line in data.split('\n'))
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def sql2data(filename, safe_fail=True, restrict_deck=None, json_style='django', fix_blank_count=False, dbname=':memory:', json_filename=None):
     """Convert PostgresSQL files into json data file.
     
     If json_style == 'django', the json file is suitable for the model in
     use in https://github.com/phildini/cards-against-django/
     
+    The dump is read a line at a time and loaded with executemany() in one
+    transaction. If json_filename is given (json_style 'django' only) the
+    fixture is written to it an entry at a time.
+
     NOTE this routine will add blank markers if any are missing.
     
         281 black cards
@@ -216,42 +354,11 @@ CREATE TABLE card_set (
     
     print 'reading %s' % filename
     f = open(filename, 'rb')
-    for line in f:
-        line_type = None
-        if line.startswith('INSERT INTO black_cards VALUES ('):
-            line = line.strip()
-            line_type = 'BLACK'
-        elif line.startswith('INSERT INTO white_cards VALUES ('):
-            line = line.strip()
-            line_type = 'WHITE'
-        elif line.startswith('INSERT INTO card_set_black_card VALUES (') or line.startswith('INSERT INTO card_set_white_card VALUES ('):
-            if line.startswith('INSERT INTO card_set_black_card VALUES ('):
-                line = line.replace('INSERT INTO card_set_black_card VALUES (', 'INSERT INTO card_set_black_card (cardset_id, blackcard_id) VALUES (')
-            elif line.startswith('INSERT INTO card_set_white_card VALUES ('):
-                line = line.replace('INSERT INTO card_set_white_card VALUES (', 'INSERT INTO card_set_white_card (cardset_id, whitecard_id) VALUES (')
-            c.execute(line)
-        elif line.startswith('INSERT INTO card_set VALUES ('):
-            line = line.strip()
-            line_type = 'cardset'
-        if line_type:
-            # quick-n-dirty true/false literal conversion, assumes they do not exist in string literals (card text)
-            line = line.replace(', true', ', 1')
-            line = line.replace(', false', ', 0')
-            
-            line = line.decode('utf8')
-            # there appears to be variable length underscores in different rows
-            line = line.replace('_____', cp.blank)
-            line = line.replace('____', cp.blank)
-            line = line.replace('___', cp.blank)
-            #print line_type, line
-            c.execute(line)
+    counts = load_inserts(db, iter_inserts(f, cp.blank))
     f.close()
-    
-    simple_select(c, 'select count(*) from black_cards')
-    simple_select(c, 'select count(*) from white_cards')
-    
-    simple_select(c, 'select count(*) from card_set_black_card')
-    simple_select(c, 'select count(*) from card_set_white_card')
+    for table_name in sorted(counts):
+        print '%s: %d rows' % (table_name, counts[table_name])
+    print ''
     
     # remove cards not in a set (likely to be test cards)
     c.execute('delete from black_cards where id not in (select blackcard_id from card_set_black_card)')
@@ -270,34 +377,29 @@ CREATE TABLE card_set (
     simple_select(c, 'select count(*) from black_cards')
     simple_select(c, 'select count(*) from white_cards')
 
-    db2data(c, cp, django_data, json_style=json_style, fix_blank_count=fix_blank_count)  # FIXME this is messy
+    if json_style == 'django':
+        # one entry at a time, without a json_filename the cards are still checked
+        entries = iterdb2data(c, cp, json_style=json_style, fix_blank_count=fix_blank_count)
+        if json_filename:
+            print 'writing %s' % json_filename
+            f = open(json_filename, 'wb')
+            for chunk in iter_fixture_json(entries):
+                f.write(chunk)
+            f.close()
+        else:
+            for entry in entries:
+                pass
+    else:
+        db2data(c, cp, django_data, json_style=json_style, fix_blank_count=fix_blank_count)  # FIXME this is messy
     c.close()
     db.commit()
     db.close()
     
     return  # bail and and forget json for now :-)
     
-    if json_style == 'django':
-        filename = os.path.join(DJANGO_CARDS_DATA_DIR, 'initial_data.json')
-    else:
+    if json_style != 'django':
         filename = os.path.join(DATA_DIR, 'data.json')
-    print 'writing %s' % filename
-    if json_style == 'django':
-        data = dump_json(django_data, indent=4)
-        # now "fix" indentation to match Djago fixture formatting
-        new_data = []
-        for line in data.split('\n'):
-            if line.startswith('    '):
-                line = line[4:]
-            if line.endswith('}, '):
-                line = line[:-1]
-            new_data.append(line)
-        data = '\n'.join(new_data)
-        f = open(filename, 'wb')
-        f.write(data)
-        f.write('\n')
-        f.close()
-    else:
+        print 'writing %s' % filename
         g = Game(cp.white_cards, cp.black_cards)
         print '%d black cards' % len(g.black_cards)
         print '%d white cards' % len(g.white_cards)
@@ -315,8 +417,13 @@ def main(argv=None):
         sql_filename = 'cah_cards.sql'  # https://raw.github.com/ajanata/PretendYoureXyzzy/master/cah_cards.sql
         filename = os.path.join(DATA_DIR, sql_filename)
     
+    try:
+        json_filename = argv[2]
+    except IndexError:
+        json_filename = None
+    
     #sql2data(filename)
-    sql2data(filename, dbname='cards.sqlite3')
+    sql2data(filename, dbname='cards.sqlite3', json_filename=json_filename)
     
     return 0
 
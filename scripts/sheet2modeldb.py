@@ -17,6 +17,7 @@
 
 """
 
+import collections
 import os
 import sys
 import sqlite3
@@ -29,13 +30,55 @@ import xlrd
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cah.settings.local")  # FIXME
-from django.conf import settings
-import django.db.transaction
-from django.db import connection
-import cards.models
-from cards.models import BlackCard, WhiteCard, CardSet, Game
+import django
+django.setup()
+from django.db import connection, transaction
+from cards.models import (
+    AnalyticsWatermark,
+    BlackCard,
+    BlackCardStats,
+    CardPairStats,
+    CardSet,
+    Game,
+    GameArchive,
+    GameEvent,
+    GameStanding,
+    LeaderboardEntry,
+    Player,
+    PlayerStats,
+    RoundWin,
+    StandardSubmission,
+    WhiteCard,
+    WhiteCardStats,
+    dict2db,
+)
 from card_fixturegen import DEFAULT_BLANK_MARKER, DATA_DIR
 
+MAIN_DECK_VERSIONS = ('v1.0', 'v1.2', 'v1.3', 'v1.4')
+
+# emptied before the import, tables referring to another table come first
+DELETE_MODELS = (
+    StandardSubmission.submissions.through,
+    StandardSubmission,
+    GameEvent,
+    Player,
+    Game,
+    GameArchive,
+    GameStanding,
+    RoundWin,
+    PlayerStats,
+    LeaderboardEntry,
+    CardPairStats,
+    WhiteCardStats,
+    BlackCardStats,
+    AnalyticsWatermark,
+    CardSet.white_card.through,
+    CardSet.black_card.through,
+    CardSet,
+    BlackCard,
+    WhiteCard,
+)
+
 
 def replace_blank(card_text):
     card_text = card_text.replace('_______', DEFAULT_BLANK_MARKER)
@@ -45,183 +88,115 @@ def replace_blank(card_text):
         raise NotImplementedError('found an underscore, this may not be a real problem')
     return card_text
 
-def doit():
-    dbname = ':memory:'
-    dbname = os.path.join(DATA_DIR, 'tmpdb.db')
-    db = sqlite3.connect(dbname)
-    c = db.cursor()
-
-    # TODO read from spreadsheet into temp database "dbname"
-    
-    settings.DATABASES['default']['AUTOCOMMIT'] = False
-    print dir(django.db.transaction)
-    print dir(django.db.transaction.connections)
-    django.db.transaction.commit_manually()
-    #django.db.transaction.set_autocommit(False)
-    
-    
-    """this is a terrible way to delete stuff....
-    Game.objects.all().delete()
-    BlackCard.objects.all().delete()
-    WhiteCard.objects.all().delete()
-    CardSet.objects.all().delete()
-    # So instead use raw SQL
+def black_card_entry(card_text, special, watermark):
+    """Returns dict of BlackCard fields for a spreadsheet row"""
+    draw = 0
+    pick = card_text.count(DEFAULT_BLANK_MARKER)
+    if pick < 1:
+        pick = 1
+    if special:
+        if special == 'PICK 2':
+            pick = 2
+        elif special == 'DRAW 2, PICK 3':
+            draw = 2
+            pick = 3
+        else:
+            raise NotImplementedError('unrecognized special')
+    return {'text': card_text, 'draw': draw, 'pick': pick, 'watermark': watermark}
+
+
+def read_cardsets(c):
+    """Read the spreadsheet tables from sqlite cursor c into an (ordered)
+    dict of card set name: dict2db() style card set dict.
     """
-    dmc = connection.cursor()  # Django Model Database Cursor
-    for tablename in ['card_set_white_card', 'cards_game', 'cards_player', 'black_cards', 'card_set', 'card_set_black_card', 'white_cards']:
-        dmc.execute('DELETE FROM %s' % tablename)
-    dmc.close()
-    
-    cardset_dict = {}
-    for card_ver in 'v1.0', 'v1.2', 'v1.3', 'v1.4':
-        cardset = CardSet(name=card_ver, description=card_ver)
-        cardset.save()
-        cardset_dict[card_ver] = cardset
+    cardset_dict = collections.OrderedDict()
+
+    def cardset(name):
+        if name not in cardset_dict:
+            cardset_dict[name] = {'description': name, 'blackcards': [], 'whitecards': []}
+        return cardset_dict[name]
+
+    for card_ver in MAIN_DECK_VERSIONS:
+        cardset(card_ver)
     
     #c.execute(""" select b."Text" as text, b."Special" as special, b."v1" as v10, b."v1.2" as v12, b."v1.3" as v13, b."v1.4" as v14 from "Main Deck Black" b order by text LIMIT 3""")
     c.execute(""" select b."Text" as text, b."Special" as special, b."v1" as v10, b."v1.2" as v12, b."v1.3" as v13, b."v1.4" as v14 from "Main Deck Black" b order by text """)
-    print c.description
-    for row_id, row in enumerate(c.fetchall(), 1):
-        draw = 0
-
-        print row_id, row
-        card_text = row[0]
-        special = row[1]
-        v10 = row[2]
-        v12 = row[3]
-        v13 = row[4]
-        v14 = row[5]
+    for row in c:
+        card_text, special, v10, v12, v13, v14 = row
         if v10:
             # sync with other naming conventions
             v10 = 'v1.0'
-        print (card_text, special, v10, v12, v13, v14)
         
         card_text = card_text.replace('______', DEFAULT_BLANK_MARKER)
         if '_' in card_text:
             raise NotImplementedError('found an underscore, this may not be a real problem')
         
-        pick = card_text.count(DEFAULT_BLANK_MARKER)
-        if pick < 1:
-            pick = 1
-        
-        if special:
-            print row
-            if special == 'PICK 2':
-                pick = 2
-            elif special == 'DRAW 2, PICK 3':
-                draw = 2
-                pick = 3
-            else:
-                raise NotImplementedError('unrecognized special')
-        
         watermark = v10 or v12 or v13 or v14  # pick the first version it showed up in (or we could leave blank)
-        black_card = BlackCard(text=card_text, draw=draw, pick=pick, watermark=watermark)
-        print black_card
-        black_card.save()
-        tmp_dict = {'v1.0':v10, 'v1.2':v12, 'v1.3':v13, 'v1.4':v14}
-        for card_ver in tmp_dict:
-            #print card_ver, tmp_dict[card_ver]
-            if tmp_dict[card_ver]:
-                cardset = cardset_dict[card_ver]
-                cardset.black_card.add(black_card)
+        entry = black_card_entry(card_text, special, watermark)
+        for card_ver, in_version in zip(MAIN_DECK_VERSIONS, (v10, v12, v13, v14)):
+            if in_version:
+                cardset(card_ver)['blackcards'].append(entry)
 
     #c.execute(""" select w."Text" as text, w."v1.0" as v10, w."v1.2" as v12, w."v1.3" as v13, w."v1.4" as v14 from "Main Deck White" w order by text LIMIT 5""")
     c.execute(""" select w."Text" as text, w."v1.0" as v10, w."v1.2" as v12, w."v1.3" as v13, w."v1.4" as v14 from "Main Deck White" w order by text""")
-    print c.description
-    for row_id, row in enumerate(c.fetchall(), 1):
-        print row_id, row
-        card_text = row[0]
-        v10 = row[1]
-        v12 = row[2]
-        v13 = row[3]
-        v14 = row[4]
+    for row in c:
+        card_text, v10, v12, v13, v14 = row
         
         watermark = v10 or v12 or v13 or v14  # pick the first version it showed up in (or we could leave blank)
-        white_card = WhiteCard(text=card_text, watermark=watermark)
-        print white_card
-        white_card.save()
-        tmp_dict = {'v1.0':v10, 'v1.2':v12, 'v1.3':v13, 'v1.4':v14}
-        for card_ver in tmp_dict:
-            #print card_ver, tmp_dict[card_ver]
-            if tmp_dict[card_ver]:
-                cardset = cardset_dict[card_ver]
-                cardset.white_card.add(white_card)
+        entry = {'text': card_text, 'watermark': watermark}
+        for card_ver, in_version in zip(MAIN_DECK_VERSIONS, (v10, v12, v13, v14)):
+            if in_version:
+                cardset(card_ver)['whitecards'].append(entry)
     
     #c.execute(""" select b."col2" as text, b.col3 as special, b.col4 as expansion_name from "Expansions Black" b  where text NOT NULL and text != '' and text != 'Text' and expansion_name NOT NULL and expansion_name != '' order by text LIMIT 15""")
     c.execute(""" select b."col2" as text, b.col3 as special, b.col4 as expansion_name from "Expansions Black" b  where text NOT NULL and text != '' and text != 'Text' and expansion_name NOT NULL and expansion_name != '' order by text""")
-    print c.description
-    for row_id, row in enumerate(c.fetchall(), 1):
-        draw = 0
-    
-        print row_id, row
-        card_text = row[0]
-        special = row[1]
-        expansion_name = row[2]
-
+    for row in c:
+        card_text, special, expansion_name = row
         card_text = replace_blank(card_text)
-        
-        pick = card_text.count(DEFAULT_BLANK_MARKER)
-        if pick < 1:
-            pick = 1
-        
-        if special:
-            print row
-            if special == 'PICK 2':
-                pick = 2
-            elif special == 'DRAW 2, PICK 3':
-                draw = 2
-                pick = 3
-            else:
-                raise NotImplementedError('unrecognized special')
-
-        cardset = cardset_dict.get(expansion_name)
-        # This shouldn't be needed, should have created earlier with black card expansion
-        if cardset is None:
-            cardset = CardSet(name=expansion_name, description=expansion_name, base_deck=False)
-            cardset.save()
-            cardset_dict[expansion_name] = cardset
-        
         watermark = expansion_name  # could leave it blank
-        black_card = BlackCard(text=card_text, draw=draw, pick=pick, watermark=watermark)
-        print black_card
-        black_card.save()
-        cardset.black_card.add(black_card)
+        cardset(expansion_name)['blackcards'].append(black_card_entry(card_text, special, watermark))
     
     # TODO handle "[italic]", etc.
     #c.execute(""" select w."col2" as text, w.col3 as expansion_name from "Expansions White" w where text NOT NULL and text != '' and expansion_name NOT NULL and expansion_name != '' order by expansion_name, text LIMIT 15""")
     c.execute(""" select w.col2 as text, w.col3 as expansion_name from "Expansions White" w where text NOT NULL and text != '' and text != 'Text' and expansion_name NOT NULL and expansion_name != '' order by expansion_name, text""")
-    print c.description
-    for row_id, row in enumerate(c.fetchall(), 1):
-        print row_id, row
-        card_text = row[0]
-        expansion_name = row[1]
-        
-        cardset = cardset_dict.get(expansion_name)
-        # This shouldn't be needed, should have created earlier with black card expansion
-        if cardset is None:
-            cardset = CardSet(name=expansion_name, description=expansion_name, base_deck=False)
-            cardset.save()
-            cardset_dict[expansion_name] = cardset
-        
+    for row in c:
+        card_text, expansion_name = row
         watermark = expansion_name  # could leave it blank
-        white_card = WhiteCard(text=card_text, watermark=watermark)
-        print white_card
-        white_card.save()
-        cardset.white_card.add(white_card)
+        cardset(expansion_name)['whitecards'].append({'text': card_text, 'watermark': watermark})
     
-    
-    # this is probably not needed due to manual commit later
-    for tmp_cardset_name in cardset_dict:
-        cardset = cardset_dict[tmp_cardset_name]
-        cardset.save()
+    return cardset_dict
+
+
+def doit():
+    dbname = ':memory:'
+    dbname = os.path.join(DATA_DIR, 'tmpdb.db')
+    db = sqlite3.connect(dbname)
+    c = db.cursor()
 
-    django.db.transaction.commit()
+    # TODO read from spreadsheet into temp database "dbname"
+    cardset_dict = read_cardsets(c)
     
     c.close()
-    db.commit()
     db.close()
-
-
+    
+    # One transaction, cards are bulk inserted (and shared between sets) by dict2db()
+    with transaction.atomic():
+        """this is a terrible way to delete stuff....
+        Game.objects.all().delete()
+        BlackCard.objects.all().delete()
+        WhiteCard.objects.all().delete()
+        CardSet.objects.all().delete()
+        # So instead use raw SQL
+        """
+        dmc = connection.cursor()  # Django Model Database Cursor
+        for model in DELETE_MODELS:
+            dmc.execute('DELETE FROM %s' % connection.ops.quote_name(model._meta.db_table))
+        dmc.close()
+        
+        for cardset_name, black_count, white_count in dict2db(cardset_dict, verbosity=0):
+            print '%s: %d black cards, %d white cards' % (cardset_name, black_count, white_count)
+        # main deck versions are base decks, everything else is an expansion
+        CardSet.objects.exclude(name__in=MAIN_DECK_VERSIONS).update(base_deck=False)
 
 
 def main(argv=None):